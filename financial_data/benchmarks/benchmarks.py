@@ -0,0 +1,190 @@
+"""
+Benchmarks of the hot paths of financial_data, written with the asv
+conventions (classes with params, setup and time_* methods) and run by
+benchmarks/run.py.
+
+Sizes go from the 253 rows of the files in data/raw to millions of rows
+(pair of tickers) and thousands of tickers (one year of daily bars).
+"""
+import shutil
+import tempfile
+import contextlib
+import io
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_prices, synthetic_log_returns, synthetic_fetcher, synthetic_index
+from src.data.get_data import load_data
+from src.features.build_features import compute_daily_return
+from src.models.libfit import (find_closest_date, apply_filter_by_dates, apply_filter_by_windows, fit_line,
+                               fit_adaptative_line, OutlierRemover)
+
+# Rows of the pair of tickers of the dashboard
+PAIR_ROWS = [253, 2_520, 25_200, 252_000, 1_000_000]
+# (rows, tickers) of the universes
+UNIVERSES = [(253, 2), (2_520, 10), (2_520, 100), (253, 1_000), (253, 5_000)]
+
+def pair_returns(n_rows, seed=0):
+    """Log returns of two tickers indexed by date, as log_returns_difference"""
+    import pandas as pd
+    return pd.DataFrame(synthetic_log_returns(n_rows, 2, seed=seed), index=synthetic_index(n_rows),
+                        columns=['T0000', 'T0001'])
+
+def window_dates(index, fraction=0.8):
+    """Dates of a window covering the central fraction of the index"""
+    margin = int(len(index) * (1 - fraction) / 2)
+    return (index[margin].strftime('%Y-%m-%d %H:%M'),
+            index[len(index) - 1 - margin].strftime('%Y-%m-%d %H:%M'))
+
+class LoadData:
+    """load_data when everything is already in the store (cache hit)"""
+    params = [[(2_520, 10), (2_520, 100), (253, 1_000)], ['csv', 'parquet', 'npy']]
+    param_names = ['rows_x_tickers', 'cache']
+
+    def setup(self, shape, cache):
+        n_rows, n_tickers = shape
+        self.directory = tempfile.mkdtemp()
+        self.tickers = [f"T{i:04d}" for i in range(n_tickers)]
+        index = synthetic_index(n_rows, freq="B")
+        self.start = index[0].strftime('%Y-%m-%d')
+        self.end = (index[-1] + index.freq).strftime('%Y-%m-%d')
+        with contextlib.redirect_stdout(io.StringIO()):
+            load_data(self.tickers, None, "1d", self.directory, start=self.start, end=self.end,
+                      cache=cache, fetcher=synthetic_fetcher())
+
+    def teardown(self, shape, cache):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def time_load_data(self, shape, cache):
+        load_data(self.tickers, None, "1d", self.directory, start=self.start, end=self.end,
+                  cache=cache, fields=['Adj Close'])
+
+class ComputeDailyReturn:
+    params = [UNIVERSES + [(rows, 2) for rows in PAIR_ROWS[2:]]]
+    param_names = ['rows_x_tickers']
+
+    def setup(self, shape):
+        self.prices = synthetic_prices(*shape, fields=['Adj Close'])['Adj Close']
+
+    def time_compute_daily_return(self, shape):
+        compute_daily_return(self.prices, self.prices.index, self.prices.columns)
+
+class FindClosestDate:
+    params = [PAIR_ROWS]
+    param_names = ['rows']
+
+    def setup(self, n_rows):
+        self.index = synthetic_index(n_rows).values
+        self.dates = window_dates(synthetic_index(n_rows))
+
+    def time_find_closest_date(self, n_rows):
+        find_closest_date(list(self.dates), self.index)
+
+class ApplyFilterByDates:
+    params = [PAIR_ROWS]
+    param_names = ['rows']
+
+    def setup(self, n_rows):
+        self.data = pair_returns(n_rows)
+        self.dates = window_dates(self.data.index)
+        # 100 windows of the slider positions, for the batch form
+        fractions = np.linspace(0.1, 0.9, 100)
+        windows = [window_dates(self.data.index, fraction) for fraction in fractions]
+        self.initial_dates, self.end_dates = map(list, zip(*windows))
+
+    def time_apply_filter_by_dates(self, n_rows):
+        apply_filter_by_dates(self.data, *self.dates)
+
+    def time_apply_filter_by_windows(self, n_rows):
+        apply_filter_by_windows(self.data, self.initial_dates, self.end_dates)
+
+class OutlierRemoval:
+    params = [PAIR_ROWS, ['std', 'iqr']]
+    param_names = ['rows', 'strategy']
+
+    def setup(self, n_rows, strategy):
+        self.residuals = synthetic_log_returns(n_rows, 1)[:, 0]
+        self.remover = OutlierRemover(strategy, 1.5)
+
+    def time_remove_outliers(self, n_rows, strategy):
+        self.remover.remove_outliers(self.residuals)
+
+    def time_remove_outliers_border_cases(self, n_rows, strategy):
+        self.remover.remove_outliers(self.residuals, border_cases=True)
+
+class FitLine:
+    params = [PAIR_ROWS]
+    param_names = ['rows']
+
+    def setup(self, n_rows):
+        returns = synthetic_log_returns(n_rows, 2)
+        self.X = returns[:, :1]
+        self.y = returns[:, 1]
+
+    def time_fit_line(self, n_rows):
+        fit_line(self.X, self.y, verbose=False)
+
+class FitAdaptativeLine:
+    params = [PAIR_ROWS, ['std', 'iqr']]
+    param_names = ['rows', 'strategy']
+
+    def setup(self, n_rows, strategy):
+        returns = synthetic_log_returns(n_rows, 2)
+        self.X = returns[:, :1]
+        self.y = returns[:, 1]
+        _, _, reg = fit_line(self.X, self.y, verbose=False)
+        self.residuals = self.y - reg.predict(self.X)
+
+    def time_fit_adaptative_line(self, n_rows, strategy):
+        fit_adaptative_line(self.X, self.y, self.residuals, None, None, strategy, 1.5)
+
+class UpdatePlot:
+    """
+    Full update_plot callback through the Dash server (fit, figure and
+    JSON serialization): a new date window (full figure) and a threshold
+    change on the same window (patch)
+    """
+    params = [PAIR_ROWS[:4]]
+    param_names = ['rows']
+
+    def setup(self, n_rows):
+        from dash import Dash
+        from src.models.layout import create_layout
+        from src.models.callbacks import register_callbacks
+
+        returns = pair_returns(n_rows)
+        dates = returns.index.values
+        date_indices = {i: date for i, date in enumerate(returns.index.strftime('%Y-%m-%d'))}
+        app = Dash(__name__)
+        app.layout = create_layout(dates, date_indices)
+        with contextlib.redirect_stdout(io.StringIO()):
+            register_callbacks(app, returns, dates, 'T0000', 'T0001', dates)
+        self.client = app.server.test_client()
+        self.output = next(iter(app.callback_map))
+        self.last = len(dates) - 1
+        self.step = 0
+        # Window of the figure held by the client, for the patch benchmark
+        self.window = self._post(1.5, [0, self.last], None, [])['plot-window']['data']
+
+    def _post(self, threshold, range_dates, window, triggered):
+        body = {"output": self.output,
+                "outputs": [{"id": "scatter-plot", "property": "figure"},
+                            {"id": "plot-window", "property": "data"}],
+                "inputs": [{"id": "threshold-slider", "property": "value", "value": threshold},
+                           {"id": "date-range-slider", "property": "value", "value": range_dates},
+                           {"id": "outlier-strategy", "property": "value", "value": "std"}],
+                "state": [{"id": "plot-window", "property": "data", "value": window}],
+                "changedPropIds": [f"{trigger}.value" for trigger in triggered]}
+        response = self.client.post("/_dash-update-component", json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"update_plot failed with status {response.status_code}")
+        return response.get_json()["response"]
+
+    def time_update_plot_window(self, n_rows):
+        # A different window every call, so nothing is reused
+        self.step = (self.step + 1) % max(self.last // 2, 1)
+        self._post(1.5, [self.step, self.last], None, ['date-range-slider'])
+
+    def time_update_plot_threshold(self, n_rows):
+        self.step = (self.step + 1) % 9
+        self._post(1 + 0.5 * self.step, [0, self.last], self.window, ['threshold-slider'])
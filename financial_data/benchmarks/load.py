@@ -0,0 +1,416 @@
+"""
+Load test of the dashboard: replays sessions of analysts (page load, then
+threshold, strategy and date window changes carrying the plot-window
+state as the browser does) against /_dash-update-component of a local
+gunicorn server, for several worker and thread configurations.
+
+The server is the one of the Procfile, outlier_returns:server built by
+create_app from config.yaml as shipped (result cache, resources, timing,
+shared dataset... off unless set with --set), with the paths, companies and dates replaced by
+synthetic daily prices of two tickers stored under a work directory in
+benchmarks/results. Every configuration starts with empty caches.
+
+Reports the throughput, the latency percentiles and the error rate of
+each configuration, overall and per action. Results are saved in
+benchmarks/results/load-<commit>-<time>.json.
+
+The generator runs in this process with one thread per user: on a box
+with few cores it competes with the server for the CPU, so compare
+configurations run on the same machine only.
+
+Usage (from financial_data):
+    python -m benchmarks.load                                  # 1x1, 2x1 and 2x4 workers x threads
+    python -m benchmarks.load --configs 1x1 4x2 --users 16 --duration 30
+    python -m benchmarks.load --rows 25200 --think 0.5 --background
+    python -m benchmarks.load --set shared_dataset.enabled=true result_cache.enabled=true
+    python -m benchmarks.load --url http://127.0.0.1:8050     # server already running
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import contextlib
+import io
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from benchmarks.run import ROOT, RESULTS_DIR, git_commit
+
+# Probability of each action of a session after the page load
+ACTIONS = {'threshold': 0.5, 'strategy': 0.1, 'window': 0.4}
+# Smallest date window chosen by the sessions, in rows
+MIN_WINDOW = 20
+PERCENTILES = [50, 90, 95, 99]
+# Synthetic daily prices end here; the pandas date range bounds their rows
+END_DATE = "2025-02-01"
+MAX_ROWS = 90_000
+# Synthetic tickers of the dashboard
+COMPANIES = ['T0000', 'T0001']
+
+def synthetic_config(n_rows, workdir, background=False, overrides=()):
+    """
+    config.yaml as shipped, on n_rows synthetic daily prices of COMPANIES
+    stored under workdir
+
+    Parameters
+    ----------
+    n_rows: int
+    workdir: str
+        Directory relative to financial_data (the root of the paths of
+        the configuration)
+    background: bool
+        Enable background_callbacks
+    overrides: list of str
+        Settings as 'section.key=value' (YAML value), e.g.
+        'shared_dataset.enabled=true'
+
+    Returns
+    -------
+    dict
+    """
+    from outlier_returns import load_config
+
+    if not 2 <= n_rows <= MAX_ROWS:
+        raise ValueError(f"rows must be between 2 and {MAX_ROWS} (daily bars)")
+    config = load_config(os.path.join(ROOT, "config.yaml"))
+    config["paths"]["root"] = workdir
+    config["companies_fit"] = list(COMPANIES)
+    start = pd.Timestamp(END_DATE) - pd.offsets.BDay(n_rows)
+    config["download_params"].update(interval="1d", start_date=start.strftime("%Y-%m-%d"),
+                                      end_date=END_DATE)
+    config["plot_verbosity"] = False
+    config["savefigs"] = False
+    config.setdefault("background_callbacks", {})["enabled"] = background
+    for override in overrides:
+        keys, _, value = override.partition("=")
+        section = config
+        *parents, key = keys.split(".")
+        for parent in parents:
+            section = section.setdefault(parent, {})
+        section[key] = yaml.safe_load(value)
+    return config
+
+def prepare_workdir(config):
+    """
+    Store the synthetic prices in the raw path of config (so create_app
+    loads them from the cache) and empty the processed and reports paths
+    (result cache, shared dataset, background jobs, resources)
+    """
+    from src.data.get_data import load_data
+    from benchmarks.synthetic import synthetic_fetcher
+
+    root_dir = os.path.join(ROOT, config["paths"]["root"])
+    for path in (config["paths"]["processed"], config["paths"]["reports"]):
+        shutil.rmtree(os.path.join(root_dir, path), ignore_errors=True)
+    download_params = config["download_params"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        load_data(config["companies_fit"], download_params["period"], download_params["interval"],
+                  os.path.join(root_dir, config["paths"]["raw"]),
+                  start=download_params["start_date"], end=download_params["end_date"],
+                  cache=config.get("cache_format", "csv"), fields=[config["financial_param"]],
+                  fetcher=synthetic_fetcher())
+
+def create_server(config_path):
+    """
+    outlier_returns:server built from the configuration in config_path,
+    started by gunicorn as 'benchmarks.load:create_server("<path>")'
+    """
+    from outlier_returns import load_config, create_app
+    return create_app(load_config(config_path)).server
+
+def find_component(layout, component_id):
+    """Props of the component with component_id in a serialized layout"""
+    if isinstance(layout, dict):
+        if layout.get('props', {}).get('id') == component_id:
+            return layout['props']
+        values = layout.values()
+    elif isinstance(layout, list):
+        values = layout
+    else:
+        return None
+    for value in values:
+        found = find_component(value, component_id)
+        if found is not None:
+            return found
+    return None
+
+class Session:
+    """
+    One analyst: loads the page, then changes the threshold, the strategy
+    or the date window at random, waiting for each figure before the next
+    action (plus an exponential think time of mean think seconds)
+    """
+
+    def __init__(self, url, seed, think=0.0, timeout=60):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.rng = np.random.default_rng(seed)
+        self.think = think
+        self.timeout = timeout
+        self.connection = None
+        self.window = None
+
+    def _request(self, method, path, body=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            payload = json.dumps(body) if body is not None else None
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            self.connection.request(method, path, body=payload, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Connection closed by the server (e.g. worker restarted): reconnect on the next request
+            self.connection.close()
+            self.connection = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path} returned status {response.status}")
+        # The page itself is HTML, the Dash endpoints answer JSON
+        if data and 'json' in response.getheader('Content-Type', ''):
+            return json.loads(data)
+        return None
+
+    def load_page(self):
+        """Requests of the browser on page load"""
+        self._request('GET', '/')
+        layout = self._request('GET', '/_dash-layout')
+        dependencies = self._request('GET', '/_dash-dependencies')
+        dependency = next(d for d in dependencies if 'scatter-plot.figure' in d['output'])
+        self.output = dependency['output']
+        self.poll_interval = ((dependency.get('long') or {}).get('interval') or 0) / 1e3
+        slider = find_component(layout, 'threshold-slider')
+        self.thresholds = np.arange(slider['min'], slider['max'] + slider['step'] / 2, slider['step'])
+        self.strategies = [option if isinstance(option, str) else option['value']
+                           for option in find_component(layout, 'outlier-strategy')['options']]
+        date_slider = find_component(layout, 'date-range-slider')
+        self.last = date_slider['max']
+        self.threshold = slider['value']
+        self.strategy = find_component(layout, 'outlier-strategy')['value']
+        self.range_dates = list(date_slider['value'])
+
+    def update(self, triggered):
+        """Callback request of the current state, polling background jobs"""
+        body = {"output": self.output,
+                "outputs": [{"id": "scatter-plot", "property": "figure"},
+                            {"id": "plot-window", "property": "data"}],
+                "inputs": [{"id": "threshold-slider", "property": "value", "value": float(self.threshold)},
+                           {"id": "date-range-slider", "property": "value", "value": self.range_dates},
+                           {"id": "outlier-strategy", "property": "value", "value": self.strategy}],
+                "state": [{"id": "plot-window", "property": "data", "value": self.window}],
+                "changedPropIds": [f"{trigger}.value" for trigger in triggered]}
+        result = self._request('POST', '/_dash-update-component', body)
+        if 'cacheKey' in result:
+            path = f"/_dash-update-component?cacheKey={result['cacheKey']}&job={result['job']}"
+            deadline = time.perf_counter() + self.timeout
+            while 'response' not in result:
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"Background job {result.get('job')} did not finish")
+                time.sleep(self.poll_interval)
+                result = self._request('POST', path, body) or {}
+        response = result['response']
+        # Patches keep the window of the figure (no plot-window in the response)
+        if 'plot-window' in response:
+            self.window = response['plot-window']['data']
+        return response
+
+    def step(self):
+        """Random action: returns its name and the trigger of the callback"""
+        action = self.rng.choice(list(ACTIONS), p=list(ACTIONS.values()))
+        if action == 'threshold':
+            self.threshold = self.rng.choice(self.thresholds)
+            return action, 'threshold-slider'
+        if action == 'strategy':
+            self.strategy = self.rng.choice(self.strategies)
+            return action, 'outlier-strategy'
+        width = int(self.rng.integers(min(MIN_WINDOW, self.last), self.last + 1))
+        start = int(self.rng.integers(0, self.last - width + 1))
+        self.range_dates = [start, start + width]
+        return action, 'date-range-slider'
+
+    def run(self, deadline, records):
+        """Sessions until deadline, appending (time, action, latency, error) to records"""
+        while time.perf_counter() < deadline:
+            action, triggered = 'page_load', []
+            try:
+                start = time.perf_counter()
+                self.window = None
+                self.load_page()
+                self.update(triggered)
+                records.append((start, action, time.perf_counter() - start, None))
+                while time.perf_counter() < deadline:
+                    if self.think:
+                        time.sleep(self.rng.exponential(self.think))
+                    action, trigger = self.step()
+                    start = time.perf_counter()
+                    self.update([trigger])
+                    records.append((start, action, time.perf_counter() - start, None))
+            except Exception as error:
+                records.append((start, action, time.perf_counter() - start, repr(error)))
+                # Reload the page after a short pause, as an analyst would
+                time.sleep(0.1)
+
+def summarize(records, duration):
+    """Throughput (requests per second), latency percentiles (ms) and error rate of records"""
+    if not records:
+        return dict(requests=0, throughput=0.0, error_rate=0.0)
+    latencies = np.array([latency for _, _, latency, _ in records]) * 1e3
+    errors = sum(error is not None for _, _, _, error in records)
+    summary = dict(requests=len(records), errors=errors, error_rate=errors / len(records),
+                   throughput=(len(records) - errors) / duration,
+                   mean=float(latencies.mean()), max=float(latencies.max()))
+    for q, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        summary[f"p{q}"] = float(value)
+    return summary
+
+def run_load(url, users=8, duration=20.0, warmup=3.0, think=0.0, seed=0):
+    """
+    Replay users concurrent sessions against url for warmup + duration
+    seconds; the requests started during the warm-up are discarded
+
+    Returns
+    -------
+    dict
+        Summary of all the requests ('all'), of each action, and the
+        first errors
+    """
+    records = []
+    start = time.perf_counter()
+    deadline = start + warmup + duration
+    sessions = [Session(url, seed=seed + i, think=think) for i in range(users)]
+    threads = [threading.Thread(target=session.run, args=(deadline, records), daemon=True)
+               for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    records = [record for record in records if record[0] >= start + warmup]
+    result = {'all': summarize(records, duration)}
+    for action in ['page_load'] + list(ACTIONS):
+        result[action] = summarize([record for record in records if record[1] == action], duration)
+    result['first_errors'] = sorted({error for _, _, _, error in records if error is not None})[:5]
+    return result
+
+def free_port():
+    with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, threads, config_path, port=None, timeout=120, log=None):
+    """
+    Start gunicorn (gunicorn.conf.py, as the Procfile) with the dashboard
+    of the configuration in config_path and wait until it serves the layout
+
+    Returns
+    -------
+    (subprocess.Popen, str)
+        Server process and its URL
+    """
+    port = port or free_port()
+    command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers), "--threads", str(threads),
+               "-b", f"127.0.0.1:{port}", "--timeout", str(timeout),
+               f"benchmarks.load:create_server({config_path!r})"]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=log or subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/_dash-layout")
+            if connection.getresponse().status == 200:
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise TimeoutError(f"gunicorn did not start in {timeout} seconds")
+
+def stop_server(process, timeout=30):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def print_result(name, result):
+    print(f"{name:12s} {'requests':>8s} {'req/s':>8s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} "
+          f"{'max ms':>9s} {'errors':>7s}")
+    for action in ['all', 'page_load'] + list(ACTIONS):
+        summary = result[action]
+        if not summary['requests']:
+            continue
+        print(f"  {action:10s} {summary['requests']:8d} {summary['throughput']:8.2f} {summary['p50']:9.1f} "
+              f"{summary['p90']:9.1f} {summary['p99']:9.1f} {summary['max']:9.1f} "
+              f"{summary['error_rate']:7.1%}")
+    for error in result['first_errors']:
+        print(f"  error: {error}")
+
+def parse_config(config):
+    """'4x2' -> (4 workers, 2 threads)"""
+    workers, _, threads = config.partition("x")
+    return int(workers), int(threads or 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the outlier dashboard")
+    parser.add_argument("--configs", nargs="+", default=["1x1", "2x1", "2x4"],
+                        help="gunicorn configurations as WORKERSxTHREADS")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent sessions")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds measured per configuration")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds discarded per configuration")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between actions (seconds)")
+    parser.add_argument("--rows", type=int, default=2520,
+                        help=f"Daily bars of the synthetic prices (at most {MAX_ROWS})")
+    parser.add_argument("--background", action="store_true", help="Run the fits as background callbacks")
+    parser.add_argument("--set", nargs="+", default=[], metavar="SECTION.KEY=VALUE",
+                        help="Settings of config.yaml for the server")
+    parser.add_argument("--url", help="Load an already running server instead of starting gunicorn")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    load_kwargs = dict(users=args.users, duration=args.duration, warmup=args.warmup, think=args.think,
+                       seed=args.seed)
+    results = {}
+    if args.url:
+        results[args.url] = run_load(args.url, **load_kwargs)
+        print_result(args.url, results[args.url])
+    else:
+        workdir = os.path.relpath(os.path.join(RESULTS_DIR, f"load-data-{args.rows}"), ROOT)
+        server_config = synthetic_config(args.rows, workdir, args.background, args.set)
+        config_path = os.path.join(ROOT, workdir, "config.yaml")
+        os.makedirs(os.path.dirname(config_path), exist_ok=True)
+        with open(config_path, "w") as file:
+            yaml.safe_dump(server_config, file)
+        for config in args.configs:
+            workers, threads = parse_config(config)
+            prepare_workdir(server_config)
+            with open(os.path.join(RESULTS_DIR, f"gunicorn-{config}.log"), "w") as log:
+                process, url = start_server(workers, threads, config_path, log=log)
+                try:
+                    results[config] = run_load(url, **load_kwargs)
+                finally:
+                    stop_server(process)
+            print_result(f"{workers}x{threads}", results[config])
+
+    commit = git_commit()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    # Timestamped: reruns of the same commit (or without git) are kept
+    path = os.path.join(RESULTS_DIR, f"load-{commit}-{time.strftime('%Y%m%dT%H%M%S')}.json")
+    with open(path, "w") as file:
+        json.dump(dict(commit=commit, date=time.strftime("%Y-%m-%dT%H:%M:%S"), cpu_count=os.cpu_count(),
+                       parameters=vars(args), results=results), file, indent=1)
+    print(f"Results saved to {path}")
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    main()
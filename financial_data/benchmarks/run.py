@@ -0,0 +1,196 @@
+"""
+Runner of the benchmarks in benchmarks/benchmarks.py.
+
+Results are saved in benchmarks/results/<commit>.json (commit of the
+working tree, with "-dirty" if it has changes), so runs of different
+commits can be compared and their scaling curves plotted.
+
+Usage (from financial_data):
+    python -m benchmarks.run                    # all the sizes
+    python -m benchmarks.run --quick            # up to 1e5 cells per benchmark
+    python -m benchmarks.run --filter FitLine
+    python -m benchmarks.run --compare <commit_a> <commit_b>
+    python -m benchmarks.run --plot reports/scaling.html [<commit> ...]
+"""
+import os
+import io
+import re
+import sys
+import json
+import time
+import inspect
+import argparse
+import platform
+import itertools
+import subprocess
+import contextlib
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+# Benchmarks above this number of cells (rows x tickers) are skipped by --quick
+QUICK_MAX_CELLS = 100_000
+
+def git_commit():
+    """Short hash of HEAD, with -dirty if the tree has changes"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--", "."], cwd=ROOT)
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def cells(params):
+    """Size of a parameter combination: product of its numeric values"""
+    size = 1
+    for value in params:
+        for number in (value if isinstance(value, tuple) else (value,)):
+            if isinstance(number, (int, np.integer)):
+                size *= int(number)
+    return size
+
+def discover(module):
+    """(class, method name) of every time_* benchmark"""
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if cls.__module__ != module.__name__:
+            continue
+        for name, _ in inspect.getmembers(cls, inspect.isfunction):
+            if name.startswith("time_"):
+                yield cls, name
+
+def time_call(func, repeat=5, min_time=0.05):
+    """
+    Seconds per call: the number of calls per repeat is increased until a
+    repeat takes min_time (as timeit autorange). Returns the times of the
+    repeats.
+    """
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times, number
+
+def run(pattern=None, quick=False, repeat=5):
+    from benchmarks import benchmarks as module
+
+    results = {}
+    for cls, method in discover(module):
+        name = f"{cls.__name__}.{method}"
+        if pattern and not re.search(pattern, name):
+            continue
+        params = getattr(cls, "params", [])
+        params = params if params and isinstance(params[0], list) else [params] if params else []
+        for combination in itertools.product(*params):
+            if quick and cells(combination) > QUICK_MAX_CELLS:
+                continue
+            bench = cls()
+            # Benchmarked functions print their progress
+            with contextlib.redirect_stdout(io.StringIO()):
+                if hasattr(bench, "setup"):
+                    bench.setup(*combination)
+                try:
+                    times, number = time_call(lambda: getattr(bench, method)(*combination), repeat=repeat)
+                finally:
+                    if hasattr(bench, "teardown"):
+                        bench.teardown(*combination)
+            result = dict(params=[list(value) if isinstance(value, tuple) else value for value in combination],
+                          cells=cells(combination),
+                          min=min(times), median=float(np.median(times)), number=number, repeat=repeat)
+            results.setdefault(name, []).append(result)
+            print(f"{name:55s} {str(combination):28s} {result['median'] * 1e3:12.4f} ms")
+    return results
+
+def save(results, commit):
+    import pandas as pd
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{commit}.json")
+    # Merge with the benchmarks of a previous run of the same commit
+    previous = load(commit)["benchmarks"] if os.path.exists(path) else {}
+    previous.update(results)
+    with open(path, "w") as file:
+        json.dump(dict(commit=commit,
+                       date=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       machine=dict(platform=platform.platform(), processor=platform.processor(),
+                                    cpu_count=os.cpu_count(), python=platform.python_version(),
+                                    numpy=np.__version__, pandas=pd.__version__),
+                       benchmarks=previous), file, indent=1)
+    return path
+
+def load(commit):
+    with open(os.path.join(RESULTS_DIR, f"{commit}.json"), "r") as file:
+        return json.load(file)
+
+def to_frame(commits):
+    """Long table of the results of the commits: one row per benchmark and size"""
+    import pandas as pd
+    rows = []
+    for commit in commits:
+        for name, results in load(commit)["benchmarks"].items():
+            for result in results:
+                rows.append(dict(commit=commit, benchmark=name, params=str(result["params"]),
+                                 variant=" ".join(map(str, result["params"][1:])),
+                                 cells=result["cells"], median=result["median"]))
+    return pd.DataFrame(rows)
+
+def compare(old, new, threshold=1.1):
+    """Print the ratio new/old of the median times, flagging changes above threshold"""
+    table = to_frame([old, new]).pivot_table(index=["benchmark", "cells", "params"], columns="commit",
+                                             values="median").dropna()
+    table["ratio"] = table[new] / table[old]
+    for (name, _, params), row in table.iterrows():
+        flag = "slower" if row["ratio"] > threshold else "faster" if row["ratio"] < 1 / threshold else ""
+        print(f"{name:55s} {params:28s} {row[old] * 1e3:10.4f} ms {row[new] * 1e3:10.4f} ms "
+              f"{row['ratio']:6.2f} {flag}")
+    return table
+
+def plot(path, commits):
+    """Scaling curves (time vs size, log-log) of every benchmark, one line per commit"""
+    import plotly.express as px
+    table = to_frame(commits)
+    # Benchmarks with more parameters than the size get one curve per value
+    table["curve"] = (table["commit"] + " " + table["variant"]).str.strip()
+    fig = px.line(table.sort_values("cells"), x="cells", y="median", color="curve", facet_col="benchmark",
+                  facet_col_wrap=3, log_x=True, log_y=True, markers=True,
+                  labels=dict(cells="rows x tickers", median="seconds per call"))
+    fig.update_yaxes(matches=None)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig.write_html(path)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of financial_data")
+    parser.add_argument("--filter", help="Regular expression on Class.time_method")
+    parser.add_argument("--quick", action="store_true", help=f"Skip sizes above {QUICK_MAX_CELLS} cells")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two saved commits")
+    parser.add_argument("--plot", nargs="+", metavar=("PATH", "COMMIT"),
+                        help="Save the scaling curves of the commits (default: this one) to PATH")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.plot:
+        commits = args.plot[1:] or [git_commit()]
+        print(f"Scaling curves saved to {plot(args.plot[0], commits)}")
+        return
+    commit = git_commit()
+    print(f"Running benchmarks of commit {commit}")
+    results = run(args.filter, quick=args.quick, repeat=args.repeat)
+    print(f"Results saved to {save(results, commit)}")
+
+if __name__ == "__main__":
+    sys.path.insert(0, ROOT)
+    main()
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+# Price fields of the synthetic data, as downloaded from Yahoo Finance
+FIELDS = ['Adj Close', 'Close']
+
+def synthetic_index(n_rows, freq=None, start="2000-01-03"):
+    """
+    Dates of n_rows bars: business days up to 50000 rows, minutes above
+    (so millions of rows stay inside the pandas date range)
+    """
+    if freq is None:
+        freq = "B" if n_rows <= 50_000 else "min"
+    return pd.date_range(start, periods=n_rows, freq=freq, name="Date")
+
+def synthetic_log_returns(n_rows, n_tickers, seed=0, n_factors=3, volatility=0.01):
+    """
+    Correlated log returns (n_rows, n_tickers): a few common factors plus
+    idiosyncratic noise with fat tails, so the outlier strategies have
+    something to find
+    """
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0.5, 0.3, size=(n_factors, n_tickers))
+    factors = rng.normal(size=(n_rows, n_factors)) / np.sqrt(n_factors)
+    noise = rng.standard_t(4, size=(n_rows, n_tickers)) / np.sqrt(2)
+    return volatility * (factors @ loadings + noise)
+
+def synthetic_prices(n_rows, n_tickers, seed=0, freq=None, fields=FIELDS):
+    """
+    Geometric Brownian motion prices with the layout returned by
+    load_data: DatetimeIndex and (Price, Ticker) columns
+
+    Parameters
+    ----------
+    n_rows: int
+        Number of bars (253 is one year of daily bars)
+    n_tickers: int
+    seed: int
+    freq: str, optional
+        Frequency of the bars, see synthetic_index
+    fields: list of str
+        Price fields. Every field has the same prices.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    columns = pd.MultiIndex.from_product([fields, tickers], names=["Price", "Ticker"])
+    index = synthetic_index(n_rows, freq)
+    # Range without bars (e.g. a weekend asked by load_data)
+    if n_rows == 0:
+        return pd.DataFrame(np.empty((0, len(columns))), index=index, columns=columns)
+    log_returns = synthetic_log_returns(n_rows, n_tickers, seed=seed)
+    log_returns[0] = 0
+    prices = 100 * np.exp(np.cumsum(log_returns, axis=0))
+    return pd.DataFrame(np.tile(prices, len(fields)), index=index, columns=columns)
+
+def synthetic_fetcher(seed=0):
+    """
+    Fetcher for load_data serving synthetic daily prices of any ticker and
+    date range without network
+    """
+    def fetcher(companies, start, end, interval, period=None):
+        index = pd.bdate_range(start, end, inclusive="left", name="Date")
+        # Same seed for a ticker whatever the range
+        data = {}
+        for company in companies:
+            company_seed = seed + sum(map(ord, company))
+            prices = synthetic_prices(len(index), 1, seed=company_seed, freq="B")
+            for field in FIELDS:
+                data[(field, company)] = prices[(field, "T0000")].to_numpy()
+        return pd.DataFrame(data, index=index)
+    return fetcher
@@ -0,0 +1,19 @@
+# gunicorn settings of the dashboard, see the Procfile:
+#   gunicorn -c gunicorn.conf.py outlier_returns:server
+
+# Create the app (and load the dataset) once in the master; the forked
+# workers share it copy-on-write
+preload_app = True
+
+def post_fork(server, worker):
+    """
+    Threads do not survive fork: restart the resource sampler of the
+    preloaded app in each worker. Only gunicorn workers run this hook, not
+    the processes forked by the background callbacks.
+    """
+    wsgi_app = server.app.callable
+    if wsgi_app is None:
+        return
+    resource_sampler = wsgi_app.extensions.get("resource_sampler")
+    if resource_sampler is not None:
+        resource_sampler.start()
@@ -21,103 +21,90 @@ Date: January 10th, 2025
 """
 # Load specific packages
 import os
+import atexit
+import logging
+
 import yaml
 
-import plotly.express as px
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+
+CONFIG_PATH = "./config.yaml"
 
-from dash import Dash
+def load_config(path=CONFIG_PATH):
+    """Load the configuration file"""
+    logging.info(f"Loading configuration file from {path}")
+    # Look if there exists a configuration file
+    if not os.path.exists(path):
+        logging.error("Configuration file not found.")
+        raise FileNotFoundError("Configuration file not found.")
+    with open(path, 'r') as file:
+        return yaml.safe_load(file)
 
-# Import local module
-from src.data.get_data import load_data
-from src.features.build_features import compute_daily_return
-from src.visualization.plot_lib import (plot_scatter_returns, 
-                                        plot_log_return_difference)
-from src.models.layout import create_layout
-from src.models.callbacks import register_callbacks
+def prepare_dataset(config, resource_sampler=None):
+    """
+    Download (or load from the cache) the prices of the two companies of
+    companies_fit, normalized to start at 1, and their daily log returns
 
-import logging
+    Returns
+    -------
+    data: pd.DataFrame
+        Normalized prices
+    log_returns_difference: pd.DataFrame
+        Log returns of the companies
+    """
+    from src.data.get_data import load_data
+    from src.data.fetch import BatchDownloader
+    from src.features.build_features import compute_daily_return
+    from src.models.utils import measure
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
+    # Extract the parameters needed for running script from the configuration file
+    companies_name = config['companies_fit']
+    download_params = config["download_params"]
+    param_to_analyze = config["financial_param"]
+    root_dir = "./"+config["paths"]["root"]
+    PATH_RAW_DIR = root_dir+"/"+config["paths"]["raw"]
 
-# Example usage
-logging.info("Starting the Dash app...")
-# Print current working directory and listed files
-logging.info(f"Current working directory: {os.getcwd()}")
-logging.info(f"List of files in the current working directory: {os.listdir()}")
-# Print environment variables
-logging.info(f"Environment variables: {os.environ}")
-
-# Load configutration file
-print("====================================")
-print(" ")
-print(os.environ["DS_DIR"])
-logging.info(f"Loading configuration file from ./config.yaml")
-# Look if there exists a configuration file
-if not os.path.exists(f"./config.yaml"):
-    logging.error("Configuration file not found.")
-    raise FileNotFoundError("Configuration file not found.")
-print(" ")
-print("====================================")
-with open(f"./config.yaml", 'r') as file:
-    config = yaml.safe_load(file)
-
-# Extract the parameters needed for running script from the configuration file
-companies_name = config['companies_fit']
-period = config["download_params"]["period"]
-interval = config["download_params"]["interval"]
-start_date = config["download_params"]["start_date"]
-end_date = config["download_params"]["end_date"]
-param_to_analyze = config["financial_param"]
-# Paths
-root_dir = "./"+config["paths"]["root"]
-raw_data_dir = config["paths"]["raw"]
-PATH_RAW_DIR = root_dir+"/"+raw_data_dir
-# Plots
-savefigs = config["savefigs"]
-reports_dir = config["paths"]["reports"]
-PATH_REPORTS_DIR = root_dir+"/"+reports_dir
-plot_verbosity = config["plot_verbosity"]
-# Server setup
-HOST = config["server"]["host"]
-PORT = config["server"]["port"]
-DEBUG = config["server"]["debug"]
-# Import the download method from get_data.py
-
-#############################################################
-######
-######      The following code is the main code
-######
-#############################################################
-# Use the imported method to download the data
-data = load_data(companies_name, 
-                period, 
-                interval,
-                PATH_RAW_DIR,
-                start=start_date,
-                end=end_date)
-
-# Normalize data to start at 1
-data = data[param_to_analyze]
-data = data / data.iloc[0]
-
-compname1 = companies_name[0]
-compname2 = companies_name[1]
-
-# Plot trends
-if plot_verbosity:
+    # Use the imported method to download the data
+    with measure("load_data", resource_sampler):
+        data = load_data(companies_name, 
+                         download_params["period"], 
+                         download_params["interval"],
+                         PATH_RAW_DIR,
+                         start=download_params["start_date"],
+                         end=download_params["end_date"],
+                         cache=config.get("cache_format", "csv"),
+                         fields=[param_to_analyze],
+                         downloader=BatchDownloader(**config.get("fetch", {})))
+
+    # Normalize data to start at 1
+    data = data[param_to_analyze]
+    data = data / data.iloc[0]
+
+    # Look at the daily return of elected companies
+    with measure("compute_daily_return", resource_sampler):
+        log_returns_difference = compute_daily_return(data, 
+                                                      data.index, 
+                                                      companies_name[:2])
+    return data, log_returns_difference
+
+def render_reports(config, data, log_returns_difference):
+    """Show (and save, with savefigs) the figures of the analysis"""
+    import plotly.express as px
+    from src.visualization.plot_lib import (plot_scatter_returns, 
+                                            plot_log_return_difference)
+
+    compname1, compname2 = config['companies_fit'][:2]
+    savefigs = config["savefigs"]
+    PATH_REPORTS_DIR = "./"+config["paths"]["root"]+"/"+config["paths"]["reports"]
+
+    # Plot trends
     fig = px.line(data, title=f"Normalized price of {compname1} and {compname2}")
     # Show and save plot
     if savefigs:
         fig.write_image(f"{PATH_REPORTS_DIR}/normalize_price_{compname1}_{compname2}.jpeg")    
     fig.show()
 
-# Look at the daily return of elected companies
-log_returns_difference = compute_daily_return(data, 
-                                              data.index, 
-                                              [compname1, compname2])
-
-if plot_verbosity:
     plot_log_return_difference(log_returns_difference, 
                                [compname1, compname2],
                                PATH_REPORTS_DIR=PATH_REPORTS_DIR,
@@ -127,28 +114,196 @@ if plot_verbosity:
                          PATH_REPORTS_DIR=PATH_REPORTS_DIR,
                          savefig=savefigs)
 
-# Initialize Dash app
-app = Dash(__name__)
+def shared_dataset(config):
+    """
+    SharedDataset of the returns under the processed path, or None if
+    shared_dataset is not enabled in the configuration
+    """
+    shared_config = config.get("shared_dataset", {})
+    if not shared_config.get("enabled", False):
+        return None
+    from src.data.shared import SharedDataset
+    return SharedDataset("./"+config["paths"]["root"]+"/"+config["paths"]["processed"],
+                         shared_config.get("name", "log_returns_difference"))
+
+def candidate_margins(config):
+    """Widenings of the outlier limits fitted as candidates (see config.yaml)"""
+    return config.get("outliers", {}).get("candidate_margins", [0.1])
+
+def publish_dataset(config=None):
+    """
+    Prepare the returns and publish them as the new version of the shared
+    dataset (e.g. from the nightly refresh). Running workers swap to it on
+    their next request.
+    """
+    if config is None:
+        config = load_config()
+    dataset = shared_dataset(config)
+    if dataset is None:
+        raise ValueError("shared_dataset is not enabled in the configuration")
+    from src.models.callbacks import dataset_arrays
+    _, log_returns_difference = prepare_dataset(config)
+    return dataset.publish(log_returns_difference, keep=config["shared_dataset"].get("keep", 2),
+                           arrays=dataset_arrays(log_returns_difference, *config['companies_fit'][:2],
+                                                candidate_margins=candidate_margins(config)))
+
+def export_resources(resource_sampler, path, creator_pid):
+    """
+    Export the resources at exit. The process that created the app writes
+    path; every forked worker (which inherits the atexit handler) writes
+    its own file next to it, name-<pid>.ext, instead of overwriting it.
+    """
+    if os.getpid() != creator_pid:
+        root, ext = os.path.splitext(path)
+        path = f"{root}-{os.getpid()}{ext}"
+    resource_sampler.export(path)
+
+def create_app(config=None, server_mode=True):
+    """
+    Build the Dash app: prepare the dataset once, register the layout and
+    the callbacks.
+
+    Parameters
+    ----------
+    config: dict, optional
+        Configuration, loaded from CONFIG_PATH if not given
+    server_mode: bool
+        Serving with gunicorn: the report figures (plot_verbosity) are not
+        rendered
+
+    Returns
+    -------
+    Dash
+    """
+    from dash import Dash
+    from src.models.layout import create_layout
+    from src.models.callbacks import register_callbacks, create_background_manager, dataset_arrays
+    from src.models.result_cache import ResultCache
+    from src.models.utils import ResourceSampler
+    from src.models import timing
+
+    logging.info("Starting the Dash app...")
+    logging.info(f"Current working directory: {os.getcwd()}")
+    if config is None:
+        config = load_config()
+    root_dir = "./"+config["paths"]["root"]
+    result_cache_config = config.get("result_cache", {})
+    resources_config = config.get("resources", {})
+    timing_config = config.get("timing", {})
+    background_config = config.get("background_callbacks", {})
+
+    # Sample CPU and memory in the background to state the resource
+    # requirements of the daily computation
+    resource_sampler = None
+    if resources_config.get("enabled", False):
+        resource_sampler = ResourceSampler(interval=resources_config.get("interval", 1.0),
+                                           maxlen=resources_config.get("maxlen", 3600)).start()
+        if resources_config.get("export"):
+            atexit.register(export_resources, resource_sampler,
+                            root_dir+"/"+resources_config["export"], os.getpid())
+
+    # Returns published once for all the processes (see shared_dataset in
+    # config.yaml) or prepared by this process
+    dataset = shared_dataset(config)
+    if not server_mode or dataset is None or not dataset.exists():
+        data, log_returns_difference = prepare_dataset(config, resource_sampler)
+        if dataset is not None:
+            dataset.publish(log_returns_difference, keep=config["shared_dataset"].get("keep", 2),
+                            arrays=dataset_arrays(log_returns_difference, *config['companies_fit'][:2],
+                                                  candidate_margins=candidate_margins(config)))
+        if config["plot_verbosity"] and not server_mode:
+            render_reports(config, data, log_returns_difference)
+    if dataset is not None:
+        # Zero-copy view of the published returns, following new versions
+        log_returns_difference = dataset.attach(config["shared_dataset"].get("check_interval", 1.0))
+
+    # Fits as background jobs on a local diskcache queue
+    background_manager = None
+    if background_config.get("enabled", False):
+        background_manager = create_background_manager(root_dir+"/"+background_config["directory"])
+
+    # Initialize Dash app
+    app = Dash(__name__)
+
+    xdata_label, ydata_label = config['companies_fit'][:2]
+
+    def serve_layout():
+        """Layout with the dates of the current dataset"""
+        frame = log_returns_difference
+        if dataset is not None:
+            _, frame, _ = log_returns_difference.current()
+        date_indices = {i: date for i, date in enumerate(frame.index.strftime('%Y-%m-%d'))}
+        return create_layout(frame.index.values, 
+                             date_indices,
+                             background=background_manager is not None)
+
+    # Set app layout (rebuilt on page load with a shared dataset, so the
+    # slider follows the published dates)
+    app.layout = serve_layout if dataset is not None else serve_layout()
+
+    # Cache of the results shared by the workers
+    result_cache = None
+    if result_cache_config.get("enabled", False):
+        result_cache_dir = result_cache_config.get("directory")
+        result_cache = ResultCache(maxsize=result_cache_config.get("maxsize", 128),
+                                   ttl=result_cache_config.get("ttl"),
+                                   directory=root_dir+"/"+result_cache_dir if result_cache_dir else None)
+
+    # Register callbacks
+    dates = None if dataset is not None else log_returns_difference.index.values
+    register_callbacks(app, 
+                       log_returns_difference, 
+                       dates, 
+                       xdata_label, 
+                       ydata_label, 
+                       dates,
+                       result_cache=result_cache,
+                       cache_figures=result_cache_config.get("figures", False),
+                       resource_sampler=resource_sampler,
+                       background_manager=background_manager,
+                       poll_interval=background_config.get("interval", 250),
+                       progress_min_rows=background_config.get("progress_min_rows", 10_000),
+                       candidate_margins=candidate_margins(config))
+    # Stage timings of the callbacks, served on the Dash server
+    if timing_config.get("enabled", False):
+        timing.enable()
+        timing.register_timing_endpoint(app, timing_config.get("endpoint", "/_timings"))
+    if resource_sampler is not None:
+        print(f"Resources of the data preparation: {resource_sampler.summary()}")
+        # Restarted in the gunicorn workers by post_fork (gunicorn.conf.py)
+        app.server.extensions["resource_sampler"] = resource_sampler
+    return app
 
-# Load data (ensure you define these variables)
-dates = data.index.values  # Load your dates
-date_indices = {i: date for i, date in enumerate(dates)}
-full_indexes = log_returns_difference.index.values
-xdata_label = compname1
-ydata_label = compname2
+_app = None
 
-# Set app layout
-app.layout = create_layout(dates, 
-                           date_indices)
+def get_app():
+    """App of the process, created on first use"""
+    global _app
+    if _app is None:
+        _app = create_app()
+    return _app
 
-# Register callbacks
-register_callbacks(app, 
-                   log_returns_difference, 
-                   full_indexes, 
-                   xdata_label, 
-                   ydata_label, 
-                   dates)
+def __getattr__(name):
+    """
+    Lazy module attributes (PEP 562): `gunicorn outlier_returns:server`
+    creates the app when it looks up server. With preload_app
+    (gunicorn.conf.py) this happens once in the master and the forked
+    workers share the dataset copy-on-write.
+    """
+    if name == "server":
+        return get_app().server
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Run server
 if __name__ == '__main__':
-    app.run_server(host=HOST, port=PORT, debug=DEBUG)
+    import sys
+    config = load_config()
+    # python outlier_returns.py --publish: refresh the shared dataset only
+    if "--publish" in sys.argv[1:]:
+        publish_dataset(config)
+        sys.exit(0)
+    app = _app = create_app(config, server_mode=False)
+    app.run_server(host=config["server"]["host"], port=config["server"]["port"],
+                   debug=config["server"]["debug"])
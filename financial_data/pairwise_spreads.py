@@ -0,0 +1,65 @@
+"""
+Author: Martin Gamboa
+GitHub: mmgamboa
+
+# Pairwise spread regressions
+
+Outlier-robust linear fit (same method as outlier_returns.py) of the log
+returns of every pair of tickers in companies_name, over rolling windows.
+The results table (slope, intercept, R2 and outliers per pair and window)
+is saved in the processed data directory.
+"""
+import yaml
+
+# Import local module
+from src.data.get_data import load_data
+from src.data.fetch import BatchDownloader
+from src.features.build_features import compute_daily_return
+from src.models.pairs import pairwise_fits, rolling_windows
+
+# Load the configuration file
+with open("./config.yaml", 'r') as file:
+    config = yaml.safe_load(file)
+
+# Extract the parameters needed for running script from the configuration file
+companies_name = config['companies_name']
+period = config["download_params"]["period"]
+interval = config["download_params"]["interval"]
+start_date = config["download_params"]["start_date"]
+end_date = config["download_params"]["end_date"]
+param_to_analyze = config["financial_param"]
+cache_format = config.get("cache_format", "csv")
+pairs_config = config["pairs"]
+root_dir = config["paths"]["root"]
+PATH_RAW_DIR = root_dir+"/"+config["paths"]["raw"]
+PATH_PROCESSED_DIR = root_dir+"/"+config["paths"]["processed"]
+
+#############################################################
+######
+######      The following code is the main code
+######
+#############################################################
+if __name__ == '__main__':
+    data = load_data(companies_name,
+                     period,
+                     interval,
+                     PATH_RAW_DIR,
+                     start=start_date,
+                     end=end_date,
+                     cache=cache_format,
+                     fields=[param_to_analyze],
+                     downloader=BatchDownloader(**config.get("fetch", {})))
+
+    returns_of_companies = compute_daily_return(data[param_to_analyze],
+                                                data.index, companies_name)
+
+    windows = rolling_windows(returns_of_companies.index,
+                              pairs_config["window"],
+                              pairs_config["step"])
+    results = pairwise_fits(returns_of_companies,
+                            windows=windows,
+                            outlier_strategy=pairs_config["outlier_strategy"],
+                            threshold=pairs_config["threshold"],
+                            n_jobs=pairs_config["n_jobs"],
+                            path=f"{PATH_PROCESSED_DIR}/pairwise_spreads_{start_date}_{end_date}.parquet")
+    print(results)
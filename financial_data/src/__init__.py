@@ -0,0 +1,9 @@
+import os
+import sys
+
+# mymodule, the helpers shared by the projects of the repository, lives at
+# its root: make it importable from the app, the scripts and gunicorn
+# whatever the working directory (the notebooks use sys.path.append('..'))
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
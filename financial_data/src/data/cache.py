@@ -0,0 +1,181 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Separator used to flatten the (Price, Ticker) columns in binary formats
+COLUMN_SEP = "|"
+COLUMN_NAMES = ["Price", "Ticker"]
+INDEX_NAME = "Date"
+
+def _flatten_columns(columns):
+    return [COLUMN_SEP.join(map(str, col)) for col in columns]
+
+def _unflatten_columns(names):
+    return pd.MultiIndex.from_tuples([tuple(name.split(COLUMN_SEP, 1)) for name in names],
+                                     names=COLUMN_NAMES)
+
+def _select_columns(names, fields):
+    """Flattened column names whose Price level is in fields"""
+    if fields is None:
+        return list(names)
+    fields = set(fields)
+    return [name for name in names if name.split(COLUMN_SEP, 1)[0] in fields]
+
+def prepare_frame(data):
+    """Typed DatetimeIndex and named MultiIndex columns"""
+    data = data.copy(deep=False)
+    data.index = pd.DatetimeIndex(pd.to_datetime(data.index), name=INDEX_NAME)
+    data.columns = pd.MultiIndex.from_tuples(list(data.columns), names=COLUMN_NAMES)
+    return data
+
+def atomic_replace(tmp_path, path):
+    """Move tmp_path to path so concurrent readers never see partial files"""
+    if os.path.isdir(path):
+        old = path + ".old"
+        os.replace(path, old)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old, ignore_errors=True)
+    else:
+        os.replace(tmp_path, path)
+
+class CacheBackend:
+    """
+    Storage format of the downloaded data. Subclasses implement read and
+    write for a DataFrame with DatetimeIndex and (Price, Ticker) columns.
+    """
+    name = None
+    extension = None
+
+    def path(self, PATH_DIR, name):
+        return os.path.join(PATH_DIR, f"{name}{self.extension}")
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def read(self, path, fields=None):
+        """
+        Parameters
+        ----------
+        path: str
+        fields: list of str, optional
+            Price fields to load (e.g. ['Adj Close']). None loads all.
+        """
+        raise NotImplementedError
+
+    def write(self, data, path):
+        raise NotImplementedError
+
+class CSVCache(CacheBackend):
+    """Two header rows CSV, the original cache format"""
+    name = "csv"
+    extension = ".csv"
+
+    def read(self, path, fields=None):
+        data = pd.read_csv(path, header=[0, 1], index_col=0, parse_dates=True)
+        data = prepare_frame(data)
+        if fields is not None:
+            data = data[list(fields)]
+        return data
+
+    def write(self, data, path):
+        data.to_csv(path + ".tmp", index=True)
+        atomic_replace(path + ".tmp", path)
+
+class ParquetCache(CacheBackend):
+    """Parquet file, read with column projection and memory mapping"""
+    name = "parquet"
+    extension = ".parquet"
+
+    def read(self, path, fields=None):
+        import pyarrow.parquet as pq
+        names = [name for name in pq.read_schema(path).names if COLUMN_SEP in name]
+        table = pq.read_table(path,
+                              columns=_select_columns(names, fields),
+                              memory_map=True,
+                              use_pandas_metadata=True)
+        data = table.to_pandas()
+        data.columns = _unflatten_columns(data.columns)
+        return data
+
+    def write(self, data, path):
+        data = prepare_frame(data)
+        data.columns = _flatten_columns(data.columns)
+        data.to_parquet(path + ".tmp", index=True)
+        atomic_replace(path + ".tmp", path)
+
+class FeatherCache(CacheBackend):
+    """Arrow IPC (Feather v2) file, memory mapped"""
+    name = "feather"
+    extension = ".feather"
+
+    def read(self, path, fields=None):
+        import pyarrow.feather as feather
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            names = [name for name in reader.schema.names if COLUMN_SEP in name]
+        table = feather.read_table(path,
+                                   columns=[INDEX_NAME] + _select_columns(names, fields),
+                                   memory_map=True)
+        data = table.to_pandas().set_index(INDEX_NAME)
+        data.columns = _unflatten_columns(data.columns)
+        return data
+
+    def write(self, data, path):
+        data = prepare_frame(data)
+        data.columns = _flatten_columns(data.columns)
+        data.reset_index().to_feather(path + ".tmp", compression="uncompressed")
+        atomic_replace(path + ".tmp", path)
+
+class NpyCache(CacheBackend):
+    """
+    Directory with the index, the column names and a column-major float
+    matrix. The matrix is memory mapped, so selecting some fields only
+    reads the pages of those columns.
+    """
+    name = "npy"
+    extension = ".npy.d"
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(path, "columns.json"))
+
+    def read(self, path, fields=None):
+        with open(os.path.join(path, "columns.json"), "r") as file:
+            names = json.load(file)
+        index = np.load(os.path.join(path, "index.npy"))
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        selected = _select_columns(names, fields)
+        if len(selected) == len(names):
+            values = np.asarray(values)
+        else:
+            positions = [names.index(name) for name in selected]
+            values = values[:, positions]
+        return pd.DataFrame(values,
+                            index=pd.DatetimeIndex(index, name=INDEX_NAME),
+                            columns=_unflatten_columns(selected))
+
+    def write(self, data, path):
+        data = prepare_frame(data)
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "index.npy"), data.index.values.astype("datetime64[ns]"))
+        np.save(os.path.join(tmp_path, "values.npy"), np.asfortranarray(data.to_numpy(dtype=np.float64)))
+        with open(os.path.join(tmp_path, "columns.json"), "w") as file:
+            json.dump(_flatten_columns(data.columns), file)
+        atomic_replace(tmp_path, path)
+
+CACHE_BACKENDS = {backend.name: backend for backend in (CSVCache, ParquetCache, FeatherCache, NpyCache)}
+
+def get_cache_backend(cache):
+    """
+    Cache backend from its name ('csv', 'parquet', 'feather' or 'npy')
+    or an already built CacheBackend
+    """
+    if isinstance(cache, CacheBackend):
+        return cache
+    if cache not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache format '{cache}'. Use one of {list(CACHE_BACKENDS)}")
+    return CACHE_BACKENDS[cache]()
@@ -0,0 +1,297 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+from src.data.cache import COLUMN_NAMES, prepare_frame
+
+class TickerError(Exception):
+    """
+    Error of some tickers of a request (unknown or delisted symbol), not
+    of the request itself: retrying does not help. data holds what the
+    source returned for the other tickers.
+    """
+
+    def __init__(self, errors, data=None):
+        """
+        Parameters
+        ----------
+        errors: dict
+            Error message by ticker
+        data: pd.DataFrame, optional
+            Data of the tickers without error
+        """
+        super().__init__(f"{len(errors)} tickers failed: {errors}")
+        self.errors = errors
+        self.data = data
+
+    @property
+    def tickers(self):
+        return list(self.errors)
+
+class DataSource:
+    """
+    Source of price data. Subclasses implement fetch, returning a
+    DataFrame indexed by date with (Price, Ticker) columns. Tickers
+    without rows in the range (e.g. a weekend) may be missing from it.
+    Errors of specific tickers are raised as TickerError; any other
+    exception fails the whole request and is retried.
+    """
+    name = None
+
+    def fetch(self, tickers, start, end, interval, period=None):
+        raise NotImplementedError
+
+class YahooSource(DataSource):
+    """
+    Yahoo Finance through yfinance, one history request per ticker (as
+    yf.download does) so that its errors are raised instead of logged
+    """
+    name = "yahoo"
+
+    def fetch(self, tickers, start, end, interval, period=None):
+        import yfinance as yf
+        from yfinance.exceptions import YFPricesMissingError, YFTickerMissingError
+        frames = {}
+        errors = {}
+        for ticker in tickers:
+            try:
+                history = yf.Ticker(ticker).history(period=period,
+                                                    interval=interval,
+                                                    start=start,
+                                                    end=end,
+                                                    auto_adjust=False,
+                                                    actions=False,
+                                                    raise_errors=True)
+            except YFPricesMissingError as exc:
+                # Error status of Yahoo: fail the request so it is retried
+                if "status_code" in exc.debug_info:
+                    raise
+                # No bars in the range (weekend, holiday): answered, no rows
+                continue
+            except YFTickerMissingError as exc:
+                errors[ticker] = str(exc)
+                continue
+            # Daily bars without time zone, as yf.download
+            if interval[-1] not in ("m", "h") and history.index.tz is not None:
+                history.index = history.index.tz_localize(None)
+            frames[ticker] = history
+
+        if frames:
+            data = pd.concat(frames, axis=1, names=COLUMN_NAMES[::-1]).swaplevel(axis=1)
+        else:
+            data = pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=COLUMN_NAMES),
+                                index=pd.DatetimeIndex([], name="Date"))
+        if errors:
+            raise TickerError(errors, data)
+        return data
+
+class FunctionSource(DataSource):
+    """
+    Source from a callable fetcher(tickers, start=, end=, interval=,
+    period=), e.g. a local fake for tests
+    """
+    name = "function"
+
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+
+    def fetch(self, tickers, start, end, interval, period=None):
+        return self.fetcher(tickers, start=start, end=end, interval=interval, period=period)
+
+def get_data_source(source):
+    """DataSource from an instance, a callable or None (Yahoo Finance)"""
+    if source is None:
+        return YahooSource()
+    if isinstance(source, DataSource):
+        return source
+    if callable(source):
+        return FunctionSource(source)
+    raise ValueError(f"Unsupported data source: {source!r}")
+
+class RateLimiter:
+    """
+    Spacing of the requests of all the threads to at most calls_per_second
+    """
+
+    def __init__(self, calls_per_second=None, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / calls_per_second if calls_per_second else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+class FetchReport:
+    """
+    Outcome of a download per ticker: 'ok', 'empty' (answered without
+    rows, e.g. a range without trading days) or 'failed' (error of the
+    ticker, or of its batch after all the retries), with the number of
+    attempts and the last error.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.elapsed = 0.0
+
+    def add(self, tickers, start, end, status, attempts, error=None):
+        for ticker in tickers:
+            self.results.setdefault(ticker, []).append(
+                dict(start=start, end=end, status=status, attempts=attempts,
+                     error=None if error is None else repr(error)))
+
+    @property
+    def failed(self):
+        """Tickers with at least one range not downloaded"""
+        return sorted(ticker for ticker, results in self.results.items()
+                      if any(result['status'] == 'failed' for result in results))
+
+    @property
+    def succeeded(self):
+        return sorted(ticker for ticker, results in self.results.items()
+                      if all(result['status'] != 'failed' for result in results))
+
+    def to_frame(self):
+        """One row per ticker and date range"""
+        return pd.DataFrame([dict(ticker=ticker, **result)
+                             for ticker, results in self.results.items() for result in results],
+                            columns=['ticker', 'start', 'end', 'status', 'attempts', 'error'])
+
+    def __str__(self):
+        return (f"{len(self.succeeded)} tickers downloaded, {len(self.failed)} failed"
+                + (f": {self.failed}" if self.failed else "") + f" ({self.elapsed:.2f} s)")
+
+class BatchDownloader:
+    """
+    Download of large universes in batches of tickers, fetched
+    concurrently by a bounded thread pool. Each batch is retried with
+    exponential backoff, the requests of all the threads are rate limited,
+    and every batch is handed to on_batch (e.g. written to the store) as
+    soon as it lands, so a failure only loses its own batch. Errors of
+    specific tickers (TickerError) are not retried: only those tickers
+    fail and the data of the rest of the batch is kept.
+    """
+
+    def __init__(self,
+                 source=None,
+                 batch_size=50,
+                 max_workers=4,
+                 max_retries=3,
+                 backoff=1.0,
+                 rate_limit=None,
+                 sleep=time.sleep):
+        """
+        Parameters
+        ----------
+        source: DataSource or callable, optional
+            Source of the data, Yahoo Finance by default
+        batch_size: int
+            Maximum number of tickers per request
+        max_workers: int
+            Number of concurrent requests
+        max_retries: int
+            Retries of a failed batch
+        backoff: float
+            Seconds before the first retry, doubled at each one (plus jitter)
+        rate_limit: float, optional
+            Maximum requests per second of all the workers
+        """
+        self.source = get_data_source(source)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sleep = sleep
+        self.rate_limiter = RateLimiter(rate_limit, sleep=sleep)
+
+    def batches(self, tickers):
+        tickers = list(tickers)
+        return [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+
+    def _fetch(self, tickers, start, end, interval, period):
+        """
+        Fetch one batch, retrying on errors other than TickerError.
+        Returns (data, attempts, error)
+        """
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random() / 2))
+            self.rate_limiter.wait()
+            try:
+                return self.source.fetch(tickers, start=start, end=end, interval=interval,
+                                         period=period), attempt + 1, None
+            except TickerError as exc:
+                print(f"Download of {exc.tickers} from {start} to {end} failed: {exc!r}")
+                return exc.data, attempt + 1, exc
+            except Exception as exc:
+                error = exc
+                print(f"Download of {tickers} from {start} to {end} failed "
+                      f"(attempt {attempt + 1}/{self.max_retries + 1}): {exc!r}")
+        return None, self.max_retries + 1, error
+
+    def download(self, requests, interval, period=None, on_batch=None):
+        """
+        Download the requested tickers and date ranges
+
+        Parameters
+        ----------
+        requests: list of (tickers, start, end)
+        interval: str
+        period: str, optional
+        on_batch: callable, optional
+            Called as on_batch(data, start, end, tickers) in the calling
+            thread for every batch answered, with the tickers answered
+            without error (with or without rows)
+
+        Returns
+        -------
+        FetchReport
+        """
+        t0 = time.time()
+        report = FetchReport()
+        jobs = [(batch, start, end) for tickers, start, end in requests
+                for batch in self.batches(tickers)]
+        if not jobs:
+            return report
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+            pending = {executor.submit(self._fetch, batch, start, end, interval, period): (batch, start, end)
+                       for batch, start, end in jobs}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, start, end = pending.pop(future)
+                    data, attempts, error = future.result()
+                    # Only the tickers of a TickerError fail, the rest of
+                    # the batch was answered
+                    failed = []
+                    if error is not None:
+                        failed = error.tickers if isinstance(error, TickerError) else batch
+                        report.add([ticker for ticker in batch if ticker in failed], start, end,
+                                   'failed', attempts, error)
+                    answered = [ticker for ticker in batch if ticker not in failed]
+                    if data is None or not answered:
+                        continue
+                    returned = set()
+                    if len(data.columns):
+                        data = prepare_frame(data)
+                        returned = set(data.dropna(axis=1, how="all").columns.get_level_values(COLUMN_NAMES[1]))
+                    report.add([ticker for ticker in answered if ticker in returned], start, end, 'ok', attempts)
+                    report.add([ticker for ticker in answered if ticker not in returned], start, end,
+                               'empty', attempts)
+                    if on_batch is not None:
+                        on_batch(data, start, end, answered)
+        report.elapsed = time.time() - t0
+        return report
@@ -1,15 +1,35 @@
-import yfinance as yf
-import pandas as pd
+import os
 
-def load_data(companies, 
-              period, 
+from src.data.store import TickerStore
+from src.data.fetch import YahooSource, BatchDownloader
+
+def yahoo_fetcher(companies, start, end, interval, period=None):
+    """
+    Download data from Yahoo Finance API
+
+    Any callable with this signature, returning a DataFrame with
+    (Price, Ticker) columns, can be given to load_data as fetcher.
+    """
+    return YahooSource().fetch(companies, start=start, end=end, interval=interval, period=period)
+
+def load_data(companies,
+              period,
               interval,
               PATH_DIR,
               start="2024-01-01",
-              end="2025-02-01"):
+              end="2025-02-01",
+              cache="csv",
+              fields=None,
+              fetcher=None,
+              downloader=None):
     """
     Load data from Yahoo Finance API. If the data is not in the cache, it will be downloaded and saved in the cache.
-    
+
+    The cache is a per-ticker store partitioned by year (see TickerStore)
+    under PATH_DIR/store. Only the tickers and date ranges not yet in the
+    store are downloaded. Cache files named COMPANIES_START_END in
+    PATH_DIR are imported into the store the first time they are needed.
+
     Parameters:
     companies: list of str
         List of companies to download data
@@ -20,40 +40,59 @@ def load_data(companies,
     start: str
         Start date
     end: str
-        End date
+        End date (not included)
+    cache: str or CacheBackend
+        Format of the store files: 'csv', 'parquet', 'feather' or 'npy'
+    fields: list of str, optional
+        Price fields to load (e.g. ['Adj Close']). None loads all of them.
+    fetcher: DataSource or callable, optional
+        Source of the data, a DataSource or a callable called as
+        fetcher(companies, start=, end=, interval=, period=). Defaults to
+        Yahoo Finance.
+    downloader: BatchDownloader, optional
+        Batching, concurrency, retries and rate limit of the downloads.
+        Defaults to a BatchDownloader of fetcher. Give the source to the
+        downloader instead of fetcher when both are needed.
     Returns:
     data: pd.DataFrame
-        DataFrame with the data    
+        DataFrame with the data. The FetchReport of the downloads (if
+        any) is in data.attrs["fetch_report"].
     """
-    print("Downloading data of the following companies: ", companies)
+    if downloader is not None and fetcher is not None:
+        raise ValueError("Give either fetcher or downloader (with its source), not both")
+    print("Loading data of the following companies: ", companies)
     print("Period: ", period)
     print("Interval: ", interval)
     print("Ranging from ", start, " to ", end)
-    
-    # Sort and join companies names
-    companies_name = "_".join(sorted(companies))
-    # Remove '-' in start and end dates
-    start_name = str(start).replace("-", "")
-    end_name = str(end).replace("-", "")
-    # Make name in format COMPANIES_START_END
-    name = companies_name + "_" + start_name + "_" + end_name
-    
-    # Path to data
-    path = lambda name: PATH_DIR+f"{name}.csv"
-    # List files in cache
-    
-    try:
-        data = pd.read_csv(path(name), header=[0, 1], index_col=0)
+
+    if downloader is None:
+        downloader = BatchDownloader(source=fetcher)
+    store = TickerStore(os.path.join(PATH_DIR, "store"), interval=interval, cache=cache)
+
+    missing = {company: store.missing(company, start, end) for company in companies}
+    if any(missing.values()) and store.import_legacy(PATH_DIR):
+        missing = {company: store.missing(company, start, end) for company in companies}
+
+    # Group companies missing the same date ranges to download them together
+    to_download = {}
+    for company, ranges in missing.items():
+        if ranges:
+            to_download.setdefault(tuple(ranges), []).append(company)
+
+    report = None
+    if not to_download:
         print("Data loaded from cache.")
-        # Set the first column as the index
-        return data
-    except:
-        print("Data not found in cache.")
-        data = yf.download(companies, 
-                           period=period, 
-                           interval=interval,
-                           start=start,
-                           end=end)
-        # Save data in cache
-        data.to_csv(path(name), index=True)
-        return data
\ No newline at end of file
+    else:
+        requests = [(group, range_start.strftime("%Y-%m-%d"), range_end.strftime("%Y-%m-%d"))
+                    for ranges, group in to_download.items() for range_start, range_end in ranges]
+        for group, range_start, range_end in requests:
+            print(f"Downloading {group} from {range_start} to {range_end}")
+        # Every batch is saved as soon as it is downloaded
+        report = downloader.download(requests, interval, period=period, on_batch=store.write)
+        print(report)
+        if report.failed:
+            print(f"Warning: no data downloaded for {report.failed}, their columns will be empty")
+
+    data = store.read(companies, start, end, fields=fields)
+    data.attrs["fetch_report"] = report
+    return data
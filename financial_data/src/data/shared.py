@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.data.cache import atomic_replace
+
+class SharedDataset:
+    """
+    Dataset published once as memory-mapped .npy files and attached by
+    every process as zero-copy NumPy views: all the workers share the same
+    pages of the OS page cache instead of holding their own copy.
+
+    Layout: {root}/{name}/{version}/ with index.npy (datetime64[ns]),
+    values.npy (float64, column-major so each column is contiguous),
+    columns.json and the extra arrays derived from the frame (e.g. the
+    prefix sums of the dashboard) as {array}.npy, plus
+    {root}/{name}/CURRENT with the published version.
+    Publishing writes a new version and swaps CURRENT atomically, so
+    readers see either the old or the new dataset, never a partial one.
+    Old versions stay valid for processes still mapping them (the files
+    are only unlinked), and are removed after keep newer versions.
+    """
+
+    def __init__(self, root, name):
+        self.root = root
+        self.name = name
+        self.directory = os.path.join(root, name)
+
+    def _current_path(self):
+        return os.path.join(self.directory, "CURRENT")
+
+    def current_version(self):
+        """Published version, or None if nothing has been published"""
+        try:
+            with open(self._current_path(), "r") as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def exists(self):
+        return self.current_version() is not None
+
+    def publish(self, frame, keep=2, arrays=None):
+        """
+        Publish a DataFrame with a DatetimeIndex and float columns as the
+        new current version
+
+        Parameters
+        ----------
+        frame: pd.DataFrame
+        keep: int
+            Previous versions kept on disk
+        arrays: dict, optional
+            Arrays derived from frame published with it (name: np.array),
+            so that the processes map them instead of building them
+
+        Returns
+        -------
+        str
+            Published version
+        """
+        version = f"v{time.time_ns()}"
+        path = os.path.join(self.directory, version)
+        tmp_path = path + ".tmp"
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, "index.npy"),
+                pd.DatetimeIndex(frame.index).values.astype("datetime64[ns]"))
+        np.save(os.path.join(tmp_path, "values.npy"), np.asfortranarray(frame.to_numpy(dtype=np.float64)))
+        arrays = arrays or {}
+        for array_name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{array_name}.npy"), np.asarray(array))
+        with open(os.path.join(tmp_path, "columns.json"), "w") as file:
+            json.dump(dict(columns=[str(column) for column in frame.columns],
+                           index_name=frame.index.name,
+                           arrays=sorted(arrays)), file)
+        os.replace(tmp_path, path)
+
+        with open(self._current_path() + ".tmp", "w") as file:
+            file.write(version)
+        atomic_replace(self._current_path() + ".tmp", self._current_path())
+        self._remove_old_versions(keep)
+        print(f"Dataset {self.name} published as {version} ({frame.shape[0]} rows, {frame.shape[1]} columns)")
+        return version
+
+    def _remove_old_versions(self, keep):
+        versions = sorted(entry for entry in os.listdir(self.directory)
+                          if entry.startswith("v") and not entry.endswith(".tmp"))
+        for version in versions[:max(len(versions) - keep - 1, 0)]:
+            shutil.rmtree(os.path.join(self.directory, version), ignore_errors=True)
+
+    def load(self, version=None):
+        """
+        DataFrame of a version (the current one by default) whose values
+        are a read-only memory-mapped view of the published file
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"Dataset {self.name} has not been published in {self.root}")
+        path = os.path.join(self.directory, version)
+        with open(os.path.join(path, "columns.json"), "r") as file:
+            meta = json.load(file)
+        index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        return pd.DataFrame(values,
+                            index=pd.DatetimeIndex(index, name=meta["index_name"], copy=False),
+                            columns=meta["columns"],
+                            copy=False)
+
+    def load_arrays(self, version=None):
+        """
+        Arrays published with a version (the current one by default), as
+        read-only memory-mapped views
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"Dataset {self.name} has not been published in {self.root}")
+        path = os.path.join(self.directory, version)
+        with open(os.path.join(path, "columns.json"), "r") as file:
+            meta = json.load(file)
+        # Plain ndarray views of the maps, so that slices are not memmaps
+        return {array_name: np.asarray(np.load(os.path.join(path, f"{array_name}.npy"), mmap_mode="r"))
+                for array_name in meta.get("arrays", [])}
+
+    def attach(self, check_interval=1.0):
+        """SharedFrame following the current version"""
+        return SharedFrame(self, check_interval=check_interval)
+
+class SharedFrame:
+    """
+    Attached view of a SharedDataset. refresh re-attaches when a new
+    version has been published (checked at most every check_interval
+    seconds), so long-running workers pick up the nightly refresh.
+
+    Readers should compare the version of current() with the one they
+    built their state from rather than rely on the return value of
+    refresh, which is True for only one of them.
+    """
+
+    def __init__(self, dataset, check_interval=1.0):
+        self.dataset = dataset
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._current = self._attach(dataset.current_version())
+
+    def _attach(self, version):
+        # Version, frame and arrays are swapped together, so that readers
+        # never mix two versions
+        return version, self.dataset.load(version), self.dataset.load_arrays(version)
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    @property
+    def frame(self):
+        return self._current[1]
+
+    @property
+    def arrays(self):
+        return self._current[2]
+
+    def current(self):
+        """(version, frame, arrays) of the current version, refreshed if needed"""
+        self.refresh()
+        return self._current
+
+    def refresh(self):
+        """
+        Attach the current version if it changed
+
+        Returns
+        -------
+        bool
+            True if this call attached a new version
+        """
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        with self._lock:
+            self._checked = now
+            version = self.dataset.current_version()
+            if version is None or version == self.version:
+                return False
+            self._current = self._attach(version)
+            print(f"Dataset {self.dataset.name} swapped to {version}")
+            return True
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+
+import pandas as pd
+
+from src.data.cache import (CACHE_BACKENDS, COLUMN_NAMES, get_cache_backend,
+                            prepare_frame, atomic_replace)
+
+# Cache files written by the first versions of load_data: TICKERS_START_END
+LEGACY_NAME = re.compile(r"^(?P<tickers>.+)_(?P<start>\d{8})_(?P<end>\d{8})$")
+
+def _merge_intervals(intervals):
+    """Union of [start, end) intervals, sorted and without overlaps"""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _subtract_intervals(start, end, covered):
+    """Parts of [start, end) not included in the covered intervals"""
+    missing = []
+    cursor = start
+    for cov_start, cov_end in covered:
+        if cov_end <= cursor or cov_start >= end:
+            continue
+        if cov_start > cursor:
+            missing.append((cursor, cov_start))
+        cursor = max(cursor, cov_end)
+    if cursor < end:
+        missing.append((cursor, end))
+    return missing
+
+class TickerStore:
+    """
+    Per-ticker store of downloaded data, partitioned by year.
+
+    Layout: {root}/{format}/{interval}/{TICKER}/{YEAR}{extension}, plus a
+    coverage.json per ticker with the [start, end) date ranges already
+    downloaded. Dates missing in the data but inside a covered range
+    (weekends, holidays) are not downloaded again.
+    """
+
+    def __init__(self, root, interval="1d", cache="parquet"):
+        self.backend = get_cache_backend(cache)
+        self.root = os.path.join(root, self.backend.name, interval)
+
+    def _ticker_dir(self, ticker):
+        return os.path.join(self.root, ticker)
+
+    def _partition_path(self, ticker, year):
+        return self.backend.path(self._ticker_dir(ticker), str(year))
+
+    def _coverage_path(self, ticker):
+        return os.path.join(self._ticker_dir(ticker), "coverage.json")
+
+    def coverage(self, ticker):
+        """
+        Date ranges [start, end) of the ticker already in the store
+        """
+        path = self._coverage_path(ticker)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as file:
+            intervals = json.load(file)
+        return [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in intervals]
+
+    def _save_coverage(self, ticker, intervals):
+        path = self._coverage_path(ticker)
+        with open(path + ".tmp", "w") as file:
+            json.dump([[start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")]
+                       for start, end in _merge_intervals(intervals)], file)
+        atomic_replace(path + ".tmp", path)
+
+    def missing(self, ticker, start, end):
+        """
+        Date ranges [start, end) of the request not in the store
+
+        Parameters
+        ----------
+        ticker: str
+        start: str
+        end: str
+            End date, not included (same convention as yfinance)
+
+        Returns
+        -------
+        list of (pd.Timestamp, pd.Timestamp)
+        """
+        return _subtract_intervals(pd.Timestamp(start), pd.Timestamp(end),
+                                   self.coverage(ticker))
+
+    def write(self, data, start, end, tickers=None):
+        """
+        Merge downloaded data into the store and mark [start, end) as
+        covered for every ticker with at least one row and every ticker of
+        tickers.
+
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Data with (Price, Ticker) columns, as returned by yfinance
+        start: str
+        end: str
+        tickers: list of str, optional
+            Tickers the source answered without error. They are covered
+            even without rows, so ranges without trading days (weekends,
+            holidays) are not downloaded again.
+        """
+        data = prepare_frame(data)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        # Bars of today can still change, do not mark them as covered
+        end = min(end, pd.Timestamp.today().normalize())
+
+        covered = list(tickers) if tickers is not None else []
+        for ticker in data.columns.get_level_values(COLUMN_NAMES[1]).unique():
+            ticker_data = data.xs(ticker, axis=1, level=COLUMN_NAMES[1], drop_level=False)
+            ticker_data = ticker_data.dropna(how="all")
+            if ticker_data.empty:
+                continue
+            os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+            for year, rows in ticker_data.groupby(ticker_data.index.year):
+                path = self._partition_path(ticker, year)
+                if self.backend.exists(path):
+                    rows = pd.concat([self.backend.read(path), rows])
+                    rows = rows[~rows.index.duplicated(keep="last")].sort_index()
+                self.backend.write(rows, path)
+            if ticker not in covered:
+                covered.append(ticker)
+
+        if start < end:
+            for ticker in covered:
+                os.makedirs(self._ticker_dir(ticker), exist_ok=True)
+                self._save_coverage(ticker, self.coverage(ticker) + [(start, end)])
+
+    def read(self, tickers, start, end, fields=None):
+        """
+        Data of the tickers between start (included) and end (excluded)
+
+        Returns
+        -------
+        pd.DataFrame
+            Data with DatetimeIndex and (Price, Ticker) columns. Tickers
+            without data in the store are filled with NaN.
+        """
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        frames = []
+        for ticker in tickers:
+            partitions = [self.backend.read(self._partition_path(ticker, year), fields=fields)
+                          for year in range(start.year, end.year + 1)
+                          if self.backend.exists(self._partition_path(ticker, year))]
+            if partitions:
+                frames.append(pd.concat(partitions, axis=0))
+        if frames:
+            data = pd.concat(frames, axis=1)
+        else:
+            data = pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=COLUMN_NAMES),
+                                index=pd.DatetimeIndex([], name="Date"))
+        data = data.sort_index()
+        data = data[(data.index >= start) & (data.index < end)]
+
+        found_fields = fields if fields is not None else data.columns.get_level_values(0).unique()
+        columns = pd.MultiIndex.from_product([sorted(found_fields), sorted(tickers)], names=COLUMN_NAMES)
+        return data.reindex(columns=columns).astype("float64")
+
+    def import_legacy(self, PATH_DIR):
+        """
+        Load into the store the cache files named TICKERS_START_END found
+        in PATH_DIR. Each file is imported once.
+
+        Returns
+        -------
+        list of str
+            Files imported in this call
+        """
+        manifest_path = os.path.join(self.root, "legacy.json")
+        imported = []
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as file:
+                imported = json.load(file)
+
+        new_files = []
+        for file_name in sorted(os.listdir(PATH_DIR)) if os.path.isdir(PATH_DIR) else []:
+            for backend_cls in CACHE_BACKENDS.values():
+                backend = backend_cls()
+                if not file_name.endswith(backend.extension):
+                    continue
+                match = LEGACY_NAME.match(file_name[:-len(backend.extension)])
+                path = os.path.join(PATH_DIR, file_name)
+                if match is None or file_name in imported or not backend.exists(path):
+                    continue
+                self.write(backend.read(path),
+                           pd.Timestamp(match.group("start")),
+                           pd.Timestamp(match.group("end")))
+                new_files.append(file_name)
+
+        if new_files:
+            os.makedirs(self.root, exist_ok=True)
+            with open(manifest_path, "w") as file:
+                json.dump(imported + new_files, file)
+        return new_files
@@ -1,33 +1,60 @@
 import numpy as np
 import pandas as pd
 
+def compute_returns(prices, kind='log', out=None, dtype=np.float64):
+    """
+    Compute the returns of all the columns of a price matrix at once.
+
+    The first row is set to 0 to mantain the same length as the prices.
+
+    Parameters
+    ----------
+    prices: np.array
+        Prices with shape (n_dates,) or (n_dates, n_assets)
+    kind: str
+        'log' for log returns or 'simple' for percentage change
+    out: np.array, optional
+        Preallocated float array with the shape of prices, filled in place
+    dtype: np.dtype
+        Type of the output when out is not given (float64 or float32)
+
+    Returns
+    -------
+    np.array
+        Returns with the shape of prices
+    """
+    if kind not in ('log', 'simple'):
+        raise ValueError(f"Unknown kind of return '{kind}'. Use 'log' or 'simple'")
+    prices = np.asarray(prices)
+    if out is None:
+        out = np.empty(prices.shape, dtype=dtype)
+    elif out.shape != prices.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {prices.shape}")
+
+    out[:1] = 0
+    np.divide(prices[1:], prices[:-1], out=out[1:])
+    if kind == 'log':
+        np.log(out[1:], out=out[1:])
+    else:
+        np.subtract(out[1:], 1, out=out[1:])
+    return out
+
 def compute_daily_return_one(data):
     """
     Return is a measure of the percentage change in price from one period to the next.
     """
-    
-    # Compute the return of the stock
-    return_stock = np.log(data[1:]/data[:-1])
-    # Add 0 at beggining to mantain the same length
-    return_stock = np.insert(return_stock, 0, 0)
-    
-    return return_stock
-
-def compute_daily_return(full_data, dates, companies):
+    return compute_returns(np.asarray(data, dtype=np.float64))
+
+def compute_daily_return(full_data, dates, companies, kind='log', out=None, dtype=np.float64):
     """
     Compute the daily return of a stock
+
+    All the companies are computed at once with compute_returns. See it
+    for the kind, out and dtype parameters.
     """
-    
-    # Get the data of the stock
-    companies_return = []
-    for company in companies:
-        data = full_data[company].values
-        return_stock = compute_daily_return_one(data)
-        companies_return.append(return_stock)
+    # Prices of the companies as a (n_dates, n_companies) matrix
+    prices = full_data[list(companies)].to_numpy()
+    companies_return = compute_returns(prices, kind=kind, out=out, dtype=dtype)
 
     # Convert to pandas dataframe with proper indexing and date
-    companies_return = pd.DataFrame(companies_return).T
-    companies_return.index = dates
-    companies_return.columns = companies
-
-    return companies_return
\ No newline at end of file
+    return pd.DataFrame(companies_return, index=dates, columns=list(companies), copy=False)
@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+
+def _standardize(values, dtype):
+    """
+    Z-scores (ddof=1) of each column, with NaN replaced by 0 so they do
+    not contribute to the dot products
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = np.nanmean(values, axis=0)
+    std = np.nanstd(values, axis=0, ddof=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = (values - mean) / std
+    return np.nan_to_num(z, nan=0.0, posinf=0.0, neginf=0.0).astype(dtype, copy=False)
+
+def _pairwise_block(values_i, values_j):
+    """
+    Pearson correlation between the columns of two blocks using the rows
+    where both values exist (same as DataFrame.corr with NaN)
+    """
+    mask_i = ~np.isnan(values_i)
+    mask_j = ~np.isnan(values_j)
+    x = np.where(mask_i, values_i, 0.0)
+    y = np.where(mask_j, values_j, 0.0)
+    mask_i = mask_i.astype(values_i.dtype)
+    mask_j = mask_j.astype(values_j.dtype)
+    n = mask_i.T @ mask_j
+    sx = x.T @ mask_j
+    sy = mask_i.T @ y
+    sxx = (x * x).T @ mask_j
+    syy = mask_i.T @ (y * y)
+    sxy = x.T @ y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (n * sxy - sx * sy) / np.sqrt((n * sxx - sx**2) * (n * syy - sy**2))
+
+def blocked_correlation(returns, block_size=256, dtype=np.float32, out=None, memmap_path=None):
+    """
+    Correlation matrix of the columns of returns computed in column blocks,
+    so the intermediate memory is O(n_dates * block_size) instead of the
+    copies made by DataFrame.corr.
+
+    Parameters
+    ----------
+    returns: pd.DataFrame
+        Returns, one column per ticker
+    block_size: int
+        Number of columns per block
+    dtype: np.dtype
+        Type of the output (float32 halves the memory of the matrix)
+    out: np.array, optional
+        Preallocated (N, N) output
+    memmap_path: str, optional
+        Write the output to a memory-mapped .npy file instead of RAM
+
+    Returns
+    -------
+    np.array
+        (N, N) correlation matrix, in the order of returns.columns
+    """
+    values = returns.to_numpy(dtype=np.float64)
+    n_columns = values.shape[1]
+    if out is None:
+        if memmap_path is not None:
+            out = np.lib.format.open_memmap(memmap_path, mode='w+', dtype=dtype,
+                                            shape=(n_columns, n_columns))
+        else:
+            out = np.empty((n_columns, n_columns), dtype=dtype)
+
+    has_nan = np.isnan(values).any()
+    if has_nan:
+        # Centering keeps the pairwise sums well conditioned
+        values = (values - np.nanmean(values, axis=0)).astype(dtype)
+    else:
+        z = _standardize(values, dtype)
+        scale = 1.0 / (len(values) - 1)
+
+    for i in range(0, n_columns, block_size):
+        for j in range(i, n_columns, block_size):
+            if has_nan:
+                block = _pairwise_block(values[:, i:i + block_size], values[:, j:j + block_size])
+            else:
+                block = (z[:, i:i + block_size].T @ z[:, j:j + block_size]) * scale
+            out[i:i + block_size, j:j + block_size] = block
+            out[j:j + block_size, i:i + block_size] = block.T
+    # Rounding can move the diagonal and the extremes slightly off
+    np.clip(out, -1, 1, out=out)
+    np.fill_diagonal(out, 1)
+    if isinstance(out, np.memmap):
+        out.flush()
+    return out
+
+def rolling_correlation_matrices(returns, window, step=1, block_size=256, dtype=np.float32):
+    """
+    Correlation matrices of rolling windows of the returns
+
+    Yields
+    ------
+    end_date, np.array
+        Last date of the window and its (N, N) correlation matrix
+    """
+    for start in range(0, len(returns) - window + 1, step):
+        window_returns = returns.iloc[start:start + window]
+        yield window_returns.index[-1], blocked_correlation(window_returns, block_size=block_size,
+                                                            dtype=dtype)
+
+def top_k_neighbours(returns, k=10, block_size=256, absolute=False, dtype=np.float32):
+    """
+    Most correlated tickers of each ticker, without building the full
+    correlation matrix: only a (block_size, N) slice is kept in memory.
+
+    Parameters
+    ----------
+    returns: pd.DataFrame
+    k: int
+        Number of neighbours per ticker
+    block_size: int
+    absolute: bool
+        Rank by absolute correlation (strong negative ones included)
+
+    Returns
+    -------
+    pd.DataFrame
+        Long format with columns ticker, neighbour, correlation and rank
+    """
+    tickers = np.asarray(returns.columns)
+    values = returns.to_numpy(dtype=np.float64)
+    has_nan = np.isnan(values).any()
+    if has_nan:
+        values = (values - np.nanmean(values, axis=0)).astype(dtype)
+    else:
+        z = _standardize(values, dtype)
+        scale = 1.0 / (len(values) - 1)
+    k = min(k, len(tickers) - 1)
+    if k < 1:
+        return pd.DataFrame(columns=['ticker', 'neighbour', 'correlation', 'rank'])
+
+    rows = []
+    for i in range(0, len(tickers), block_size):
+        if has_nan:
+            block = _pairwise_block(values[:, i:i + block_size], values)
+        else:
+            block = (z[:, i:i + block_size].T @ z) * scale
+        block = np.nan_to_num(block, nan=0.0)
+        # Exclude each ticker from its own neighbours
+        block[np.arange(block.shape[0]), np.arange(i, i + block.shape[0])] = -np.inf
+        score = np.abs(block) if absolute else block
+        if absolute:
+            score[np.arange(block.shape[0]), np.arange(i, i + block.shape[0])] = -np.inf
+        top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(score, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        for row, neighbours in enumerate(top):
+            rows.append(pd.DataFrame({'ticker': tickers[i + row],
+                                      'neighbour': tickers[neighbours],
+                                      'correlation': block[row, neighbours],
+                                      'rank': np.arange(1, k + 1)}))
+    return pd.concat(rows, ignore_index=True)
+
+def cluster_order(returns, n_iter=50, dtype=np.float32):
+    """
+    Order of the tickers that groups correlated ones together: tickers
+    sorted by their loading on the two leading principal components
+    (angle in the plane), computed by power iteration without the
+    correlation matrix.
+    """
+    z = _standardize(returns.to_numpy(dtype=np.float64), dtype)
+    rng = np.random.default_rng(0)
+    basis = np.linalg.qr(rng.normal(size=(z.shape[1], 2)).astype(dtype))[0]
+    for _ in range(n_iter):
+        basis = np.linalg.qr(z.T @ (z @ basis))[0]
+    return np.argsort(np.arctan2(basis[:, 1], basis[:, 0]))
+
+def binned_correlation(returns, n_bins, order=None, dtype=np.float32):
+    """
+    Correlation matrix downsampled to (n_bins, n_bins): each cell is the
+    mean correlation between two groups of consecutive tickers (in the
+    given order). The mean of a group of correlations is the dot product
+    of the summed z-scores, so no (N, N) matrix is built.
+
+    Returns
+    -------
+    pd.DataFrame
+        Binned correlations labelled with the first and last ticker of
+        each group
+    """
+    tickers = np.asarray(returns.columns)
+    if order is None:
+        order = np.arange(len(tickers))
+    z = _standardize(returns.to_numpy(dtype=np.float64), dtype)[:, order]
+    groups = np.array_split(np.arange(len(order)), n_bins)
+    group_sums = np.column_stack([z[:, group].sum(axis=1) for group in groups])
+    sizes = np.array([len(group) for group in groups], dtype=np.float64)
+    binned = (group_sums.T @ group_sums) / (len(z) - 1) / np.outer(sizes, sizes)
+    labels = [f"{tickers[order[group[0]]]}..{tickers[order[group[-1]]]}" if len(group) > 1
+              else str(tickers[order[group[0]]]) for group in groups]
+    return pd.DataFrame(np.clip(binned, -1, 1), index=labels, columns=labels)
+
+# Columns of the rolling co-movement table
+COMOVEMENT_COLUMNS = ['date', 'window', 'x_ticker', 'y_ticker', 'correlation', 'beta', 'n_points']
+
+def rolling_comovement(returns, windows, pairs=None, min_periods=None):
+    """
+    Rolling correlation and beta of pairs of tickers for several window
+    lengths. The running sums of the returns, their squares and their
+    cross products are accumulated once, so every window of every length
+    is a difference of two prefix sums (O(n) per window length instead of
+    a .corr() per window).
+
+    Parameters
+    ----------
+    returns: pd.DataFrame
+        Returns indexed by date (as returned by compute_daily_return)
+    windows: list of int
+        Window lengths in rows
+    pairs: list of (str, str), optional
+        (x_ticker, y_ticker) pairs. Defaults to all the pairs of columns.
+    min_periods: int, optional
+        Minimum number of rows with both returns. Defaults to the window
+        length, so windows with missing values are NaN (as pandas rolling).
+
+    Returns
+    -------
+    pd.DataFrame
+        Long format with the columns of COMOVEMENT_COLUMNS. beta is the
+        slope of y_ticker returns over x_ticker returns.
+    """
+    tickers = list(returns.columns)
+    if pairs is None:
+        pairs = [(tickers[i], tickers[j]) for i in range(len(tickers)) for j in range(i + 1, len(tickers))]
+    if not pairs:
+        return pd.DataFrame(columns=COMOVEMENT_COLUMNS)
+    values = returns.to_numpy(dtype=np.float64)
+    # Centered data keeps the differences of large sums accurate
+    values = values - np.nanmean(values, axis=0)
+    x = values[:, [tickers.index(x_ticker) for x_ticker, _ in pairs]]
+    y = values[:, [tickers.index(y_ticker) for _, y_ticker in pairs]]
+    valid = ~np.isnan(x) & ~np.isnan(y)
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+
+    # Prefix sums with a leading row of zeros: (n+1, pairs) each
+    def prefix(array):
+        sums = np.zeros((len(array) + 1, array.shape[1]))
+        np.cumsum(array, axis=0, out=sums[1:])
+        return sums
+    sums = [prefix(array) for array in (valid.astype(np.float64), x, y, x * x, x * y, y * y)]
+
+    tables = []
+    for window in windows:
+        if window > len(values):
+            continue
+        n, sx, sy, sxx, sxy, syy = (total[window:] - total[:-window] for total in sums)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cxx = n * sxx - sx * sx
+            cyy = n * syy - sy * sy
+            cxy = n * sxy - sx * sy
+            correlation = cxy / np.sqrt(cxx * cyy)
+            beta = cxy / cxx
+        enough = n >= (window if min_periods is None else min_periods)
+        correlation = np.where(enough, np.clip(correlation, -1, 1), np.nan)
+        beta = np.where(enough, beta, np.nan)
+        n_windows = len(n)
+        tables.append(pd.DataFrame({
+            'date': np.repeat(returns.index[window - 1:], len(pairs)),
+            'window': window,
+            'x_ticker': np.tile([x_ticker for x_ticker, _ in pairs], n_windows),
+            'y_ticker': np.tile([y_ticker for _, y_ticker in pairs], n_windows),
+            'correlation': correlation.ravel(),
+            'beta': beta.ravel(),
+            'n_points': n.ravel().astype(int),
+        }))
+    if not tables:
+        return pd.DataFrame(columns=COMOVEMENT_COLUMNS)
+    return pd.concat(tables, ignore_index=True)
@@ -1,52 +1,296 @@
-from dash import Input, Output
-import plotly.graph_objects as go
+from dash import Input, Output, State, Patch, ctx, no_update
 import numpy as np
 import pandas as pd
 import time
+import hashlib
+import threading
 
-from src.models.libfit import find_closest_date, apply_filter_by_dates, fit_line, fit_adaptative_line
+from src.models.libfit import (BORDER_MARGIN, DateResolver, apply_filter_by_dates, prediction_grid,
+                               fit_adaptative_line)
+from src.models.moments import CumulativeMoments
+from src.models.sweep import ThresholdSweep
+from src.models.layout import threshold_values, OUTLIER_STRATEGIES, PROGRESS_HIDDEN, PROGRESS_VISIBLE
+from src.models.utils import measure
+from src.models.timing import span, timed
+from src.visualization.render import base_layout, figure_dict, scatter_trace
 
-def register_callbacks(app, log_returns_difference, full_indexes, xdata_label, ydata_label, dates):
-    @app.callback(
-        Output('scatter-plot', 'figure'),
-        Input('threshold-slider', 'value'),
-        Input('date-range-slider', 'value'),
-        Input('outlier-strategy', 'value')
-    )
-    def update_plot(threshold, range_dates, outlier_strategy):
+# Position of the traces of the scatter plot replaced by partial updates
+FITTED_TRACE = 2
+OUTLIERS_TRACE = 3
+# Inputs that do not change the raw data of the figure
+PATCHABLE_INPUTS = ('threshold-slider', 'outlier-strategy')
+# Stages reported by the progress bar of background fits: window, fit, figure
+PROGRESS_STEPS = 3
+
+def create_background_manager(directory, expire=None):
+    """
+    Manager of the background callbacks: jobs run in forked processes and
+    their results and progress go through a diskcache in directory, so no
+    broker is needed
+
+    Returns
+    -------
+    DiskcacheManager or None
+        None if dash[diskcache] is not installed (callbacks run
+        synchronously)
+    """
+    try:
+        import diskcache
+        import multiprocess  # noqa: F401, needed by DiskcacheManager
+    except ImportError:
+        print("Background callbacks need dash[diskcache]: running the callbacks synchronously")
+        return None
+    from dash import DiskcacheManager
+    return DiskcacheManager(diskcache.Cache(directory), expire=expire)
+
+def content_hash(data, columns):
+    """
+    Digest of the index and the columns of data, so that restated values
+    with the same dates change it. Hashes the buffers of the columns
+    without copy when they are contiguous (e.g. mapped from a shared
+    dataset).
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(data.index.asi8 if hasattr(data.index, 'asi8') else data.index.values))
+    for column in columns:
+        digest.update(np.ascontiguousarray(data[column].to_numpy()))
+    return digest.hexdigest()
+
+def dataset_arrays(data, xdata_label, ydata_label, candidate_margins=(BORDER_MARGIN,)):
+    """
+    Arrays of the callbacks derived from the returns, published with a
+    shared dataset (see SharedDataset.publish) so that the workers map them
+    instead of building them: prefix sums of the pair and threshold sweep
+    of the full window
+    """
+    moments = CumulativeMoments(data, xdata_label, ydata_label)
+    sweep = ThresholdSweep(data, xdata_label, ydata_label,
+                           threshold_values(), OUTLIER_STRATEGIES, moments=moments,
+                           candidate_margins=candidate_margins)
+    if not len(data):
+        return moments.to_arrays()
+    return {**moments.to_arrays(), **sweep.to_arrays(*DateResolver(data.index).closest(data.index[[0, -1]]))}
+
+def register_callbacks(app, log_returns_difference, full_indexes, xdata_label, ydata_label, dates,
+                       result_cache=None, cache_figures=False, resource_sampler=None,
+                       background_manager=None, poll_interval=250, progress_min_rows=10_000,
+                       candidate_margins=(BORDER_MARGIN,)):
+    """
+    Register the callbacks of the scatter plot.
+
+    log_returns_difference: pd.DataFrame or SharedFrame
+        Returns indexed by date. With a SharedFrame (see
+        src.data.shared) the dates of the shared dataset are used instead
+        of full_indexes and dates, the arrays published with it (see
+        dataset_arrays) are mapped instead of built, and a newly published
+        version replaces it on the next callback.
+    result_cache: ResultCache, optional
+        Cache of the fit results keyed by the resolved dates, the outlier
+        strategy and the threshold. Use one with a directory to share it
+        between workers.
+    cache_figures: bool
+        Also cache the serialized figure, not only the fit results
+    resource_sampler: ResourceSampler, optional
+        Record the wall time, CPU time and memory of every fit in
+        resource_sampler.calls
+    background_manager: DiskcacheManager, optional
+        Run the fits as Dash background callbacks (see
+        create_background_manager). A newer request of the same session
+        terminates its running job, the cancel-fit button cancels it, and
+        fit-progress shows the stage of windows of at least
+        progress_min_rows rows. The layout must be created with
+        background=True. Jobs are forked from the worker, so their
+        updates of the caches in memory are lost: use a result_cache with
+        a directory.
+    poll_interval: int
+        Milliseconds between the polls of the client for the result of a
+        background job
+    candidate_margins: list of float
+        Relative widenings of the outlier limits of the threshold fitted
+        as candidates, the best R2 is kept (see fit_adaptative_line)
+    """
+    candidate_margins = tuple(float(margin) for margin in candidate_margins)
+    shared = log_returns_difference if hasattr(log_returns_difference, 'refresh') else None
+
+    def build_state(data, full_indexes, dates, version=None, arrays=None):
+        """
+        Structures of a dataset used by the callbacks, built once per
+        dataset or mapped from the arrays published with it (see
+        dataset_arrays)
+        """
+        arrays = arrays or {}
+        # Prefix sums built once: the fit over any date window is O(1)
+        moments = CumulativeMoments.from_arrays(data.index, arrays, xdata_label, ydata_label)
+        if moments is None:
+            moments = CumulativeMoments(data, xdata_label, ydata_label)
+        # Sorted index built once: date queries are binary searches
+        date_resolver = DateResolver(full_indexes)
+        slider_dates = pd.to_datetime(dates)
+        # Fits of every slider threshold and strategy, warmed up for the
+        # initial window of the slider and swept for the windows requested
+        # again (see ThresholdSweep)
+        sweep = ThresholdSweep(data, xdata_label, ydata_label,
+                               threshold_values(), OUTLIER_STRATEGIES, moments=moments,
+                               candidate_margins=candidate_margins)
+        if len(slider_dates) and not sweep.load_arrays(arrays):
+            sweep.prepare(*date_resolver.closest(slider_dates[[0, -1]]))
+        # Identify the dataset in the keys of a cache shared between
+        # processes: the content hash tells apart restated returns
+        dataset_key = (xdata_label, ydata_label, len(data),
+                       str(moments.index[0]) if len(moments) else None,
+                       str(moments.index[-1]) if len(moments) else None, version,
+                       content_hash(data, [xdata_label, ydata_label]), candidate_margins)
+        return dict(data=data, moments=moments, date_resolver=date_resolver, slider_dates=slider_dates,
+                    sweep=sweep, dataset_key=dataset_key, version=version)
+
+    if shared is not None:
+        version, frame, arrays = shared.current()
+        state = build_state(frame, frame.index, frame.index, version, arrays)
+    else:
+        state = build_state(log_returns_difference, full_indexes, dates)
+    state_lock = threading.Lock()
+
+    def current_state():
+        """State of the dataset, rebuilt when a new shared version is published"""
+        nonlocal state
+        if shared is None:
+            return state
+        # Compare versions: the layout may have attached the new version first
+        version, frame, arrays = shared.current()
+        if version != state['version']:
+            with state_lock:
+                if version != state['version']:
+                    state = build_state(frame, frame.index, frame.index, version, arrays)
+        return state
+
+    # Layout shared by all the figures (axis titles, legend, template)
+    layout = base_layout(xaxis=dict(title_text=xdata_label), yaxis=dict(title_text=ydata_label),
+                         legend=dict(orientation="h", x=0, y=-0.2))
+
+    def fit_window(state, X, y, initial_date, end_date, outlier_strategy, threshold):
+        fit_results = state['sweep'].lookup(initial_date, end_date, outlier_strategy, threshold)
+        if fit_results is not None:
+            return fit_results
+
+        reg_model = state['moments'].fit(initial_date, end_date)
+        print(f"Score: {reg_model.score():10.9f}")
+        print(f"Coef: {reg_model.coef_[0]:3.2} - {reg_model.intercept_:1.5f}")
+        x_pred = prediction_grid(X, nvals=100)
+        y_pred = reg_model.predict(x_pred)
+        residuals = y - reg_model.predict(X)
+
+        x_pred_no_outliers, y_pred_no_outliers, accepted_idxs = fit_adaptative_line(
+            X, y, residuals, initial_date, end_date, outlier_strategy, threshold,
+            candidate_margins=candidate_margins
+        )
+        return x_pred, y_pred, x_pred_no_outliers, y_pred_no_outliers, accepted_idxs
+
+    if resource_sampler is not None:
+        fit_window = measure('fit_window', resource_sampler)(fit_window)
+
+    def report_progress(set_progress, step, n_rows):
+        if set_progress is not None and n_rows >= progress_min_rows:
+            set_progress((step, PROGRESS_STEPS))
+
+    @timed('update_plot')
+    def update_plot(set_progress, threshold, range_dates, outlier_strategy, plot_window):
         print('__________________________________________')
         t0 = time.time()
 
-        initial_date = find_closest_date(pd.to_datetime(dates[range_dates[0]]), pd.to_datetime(full_indexes))
-        end_date = find_closest_date(pd.to_datetime(dates[range_dates[1]]), pd.to_datetime(full_indexes))
+        state = current_state()
+        initial_date, end_date = state['date_resolver'].closest(state['slider_dates'][list(range_dates)])
+        key = state['dataset_key'] + (initial_date, end_date, outlier_strategy, float(threshold))
+        # Window (and dataset version) whose raw data the figure of the client holds
+        window = [xdata_label, ydata_label, initial_date, end_date, state['version']]
+        # Threshold and strategy changes keep the raw data: only the
+        # fitted line and the outliers are sent
+        partial = ctx.triggered_id in PATCHABLE_INPUTS and plot_window == window
+
+        if result_cache is not None and cache_figures and not partial:
+            fig = result_cache.get(('figure',) + key)
+            if fig is not None:
+                print(f"Figure loaded from cache in {time.time() - t0}")
+                return fig, window
 
-        filtered_data = apply_filter_by_dates(log_returns_difference, initial_date, end_date)
+        filtered_data = apply_filter_by_dates(state['data'], initial_date, end_date)
         print("Removing outliers with method:", outlier_strategy)
         
         X = filtered_data[xdata_label].values.reshape(-1, 1)
         y = filtered_data[ydata_label].values
+        report_progress(set_progress, 1, len(y))
 
-        x_pred, y_pred, reg_model = fit_line(X, y, nvals=100)
-        residuals = y - reg_model.predict(X)
-
-        x_pred_no_outliers, y_pred_no_outliers, accepted_idxs = fit_adaptative_line(
-            X, y, residuals, initial_date, end_date, outlier_strategy, threshold
-        )
+        with span('update_plot.fit'):
+            if result_cache is not None:
+                fit_results = result_cache.get_or_compute(('fit',) + key, fit_window, state, X, y,
+                                                          initial_date, end_date, outlier_strategy, threshold)
+            else:
+                fit_results = fit_window(state, X, y, initial_date, end_date, outlier_strategy, threshold)
+        x_pred, y_pred, x_pred_no_outliers, y_pred_no_outliers, accepted_idxs = fit_results
 
         print(f"Time elapsed in preprocessing, outliers, and fitting: {time.time() - t0}")
+        report_progress(set_progress, 2, len(y))
         
-        #monitor_resources()
-        # Create the figure
-        fig = go.Figure()
-        fig.add_scatter(x=x_pred, y=y_pred, mode="markers", line=dict(color="red"), name='Fitted line')
-        fig.add_trace(go.Scatter(x=X.flatten(), y=y, mode='markers', name='Raw data', marker=dict(color='blue')))
-        fig.add_trace(go.Scatter(x=x_pred_no_outliers, y=y_pred_no_outliers, mode='lines', 
-                                 name='Fitted line (no outliers)', line=dict(color='red')))
-        fig.add_trace(go.Scatter(x=X[~accepted_idxs].flatten(), y=y[~accepted_idxs], mode='markers', 
-                                 name='Outliers', marker=dict(color='black')))
-        
-        fig.update_xaxes(title_text=xdata_label, range=[X.min()-np.abs(X.min())*0.1, X.max()+np.abs(X.max())*0.1])
-        fig.update_yaxes(title_text=ydata_label, range=[y.min()-np.abs(y.min())*0.1, y.max()+np.abs(y.max())*0.1])
-        fig.update_layout(legend=dict(orientation="h", x=0, y=-0.2))
-        #monitor_resources()
-        return fig
+        with span('update_plot.figure'):
+            x = X.ravel()
+            outliers = np.flatnonzero(~accepted_idxs)
+            fitted_trace = dict(type='scatter', x=x_pred_no_outliers, y=y_pred_no_outliers, mode='lines',
+                                name='Fitted line (no outliers)', line=dict(color='red'))
+            outliers_trace = scatter_trace(x[outliers], y[outliers], mode='markers',
+                                           name='Outliers', marker=dict(color='black'))
+            if partial:
+                patch = Patch()
+                patch['data'][FITTED_TRACE] = fitted_trace
+                patch['data'][OUTLIERS_TRACE] = outliers_trace
+                print(f"Figure patched in {time.time() - t0}")
+                return patch, no_update
+
+            # Figure assembled as a dict on the base layout: no trace
+            # validation, and x/y are views of the filtered data
+            fig = figure_dict(
+                [
+                    scatter_trace(x_pred, y_pred, mode="markers", line=dict(color="red"), name='Fitted line'),
+                    scatter_trace(x, y, mode='markers', name='Raw data', marker=dict(color='blue')),
+                    fitted_trace,
+                    outliers_trace,
+                ],
+                layout,
+                xaxis={**layout['xaxis'], 'range': [x.min()-np.abs(x.min())*0.1, x.max()+np.abs(x.max())*0.1]},
+                yaxis={**layout['yaxis'], 'range': [y.min()-np.abs(y.min())*0.1, y.max()+np.abs(y.max())*0.1]},
+            )
+            if result_cache is not None and cache_figures:
+                result_cache.set(('figure',) + key, fig)
+            report_progress(set_progress, 3, len(y))
+            return fig, window
+
+    dependencies = [
+        Output('scatter-plot', 'figure'),
+        Output('plot-window', 'data'),
+        Input('threshold-slider', 'value'),
+        Input('date-range-slider', 'value'),
+        Input('outlier-strategy', 'value'),
+        State('plot-window', 'data'),
+    ]
+    if background_manager is None:
+        @app.callback(*dependencies)
+        def update_plot_sync(threshold, range_dates, outlier_strategy, plot_window):
+            return update_plot(None, threshold, range_dates, outlier_strategy, plot_window)
+        return
+
+    if shared is not None:
+        # Jobs are forked from the worker: refresh the shared dataset
+        # before forking so that every job starts from the current state
+        @app.server.before_request
+        def refresh_shared_dataset():
+            current_state()
+
+    app.callback(
+        *dependencies,
+        background=True,
+        manager=background_manager,
+        interval=poll_interval,
+        progress=[Output('fit-progress', 'value'), Output('fit-progress', 'max')],
+        progress_default=[0, PROGRESS_STEPS],
+        running=[(Output('fit-progress', 'style'), PROGRESS_VISIBLE, PROGRESS_HIDDEN),
+                 (Output('cancel-fit', 'disabled'), False, True)],
+        cancel=[Input('cancel-fit', 'n_clicks')],
+    )(update_plot)
@@ -1,24 +1,53 @@
 from dash import html, dcc
+import numpy as np
 import pandas as pd
 
-def create_layout(dates, date_indices):
+# Values offered by the threshold slider and the strategy dropdown
+THRESHOLD_MIN = 1
+THRESHOLD_MAX = 5
+THRESHOLD_STEP = 0.5
+THRESHOLD_DEFAULT = 1.5
+OUTLIER_STRATEGIES = ['std', 'iqr']
+# Progress bar of the background fits, shown while a fit is running
+PROGRESS_HIDDEN = {'visibility': 'hidden'}
+PROGRESS_VISIBLE = {'visibility': 'visible'}
+
+def threshold_values():
+    """All the values that the threshold slider can take"""
+    return np.arange(THRESHOLD_MIN, THRESHOLD_MAX + THRESHOLD_STEP/2, THRESHOLD_STEP)
+
+def create_layout(dates, date_indices, background=False):
+    """
+    Layout of the dashboard. With background=True it includes the progress
+    bar and the cancel button of the background fits (see
+    register_callbacks).
+    """
+    background_controls = [
+        html.Progress(id='fit-progress', value=0, max=1, style=PROGRESS_HIDDEN),
+        html.Button("Cancel", id='cancel-fit', disabled=True),
+    ] if background else []
     return html.Div([
         html.H1("Interactive Scatter Plot with Fitted Line"),
         
         dcc.Graph(id='scatter-plot'),
+        *background_controls,
+        # Date window of the raw data drawn in scatter-plot, so threshold
+        # and strategy changes only patch the fitted line and the outliers
+        dcc.Store(id='plot-window'),
         
         html.Label("Threshold for Outlier Detection:"),
-        dcc.Slider(id='threshold-slider', 
-                   min=1, max=5, step=0.5, value=1.5,
-                   marks={i: str(i) for i in range(1, 6)}),
+        # Sliders only update when released, not for every position of a drag
+        dcc.Slider(id='threshold-slider', updatemode='mouseup',
+                   min=THRESHOLD_MIN, max=THRESHOLD_MAX, step=THRESHOLD_STEP, value=THRESHOLD_DEFAULT,
+                   marks={i: str(i) for i in range(THRESHOLD_MIN, THRESHOLD_MAX + 1)}),
         
         html.Label("Select Initial Date:"),
-        dcc.RangeSlider(id='date-range-slider', 
+        dcc.RangeSlider(id='date-range-slider', updatemode='mouseup',
                         min=0, max=len(dates)-1, step=1, 
                         value=[0, len(dates)-1],
                         marks={i: date_indices[i] for i in range(0, len(dates), 30)}),
         
         html.Div([
-            dcc.Dropdown(['std', 'iqr'], id='outlier-strategy', value='std'),
+            dcc.Dropdown(OUTLIER_STRATEGIES, id='outlier-strategy', value=OUTLIER_STRATEGIES[0]),
         ]),
     ])
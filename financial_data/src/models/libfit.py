@@ -1,24 +1,153 @@
+from collections import namedtuple
+
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.models.moments import masked_line_fits, LinearFit
+from src.models.timing import timed
+
+# Maximum number of values processed at once by the rolling masks
+ROLLING_CHUNK_SIZE = 2**22
+# Border cases widen the outlier limits by 10%
+BORDER_MARGIN = 0.1
+
+# Outliers of each window of a series (see OutlierRemover.rolling_mask)
+RollingOutlierMask = namedtuple('RollingOutlierMask',
+                                ['window', 'step', 'starts', 'start_dates', 'end_dates', 'mask'])
+
+# Many date windows of a frame as offsets into its values (see apply_filter_by_windows)
+DateWindows = namedtuple('DateWindows', ['values', 'starts', 'stops', 'columns'])
+
+class DateResolver:
+    """
+    Resolve user dates to valid dates of an index by binary search.
+
+    The index is converted and sorted once, so each query costs
+    O(log n). Queries can be a single date or an array of dates.
+
+    Modes:
+        'nearest': closest date (the earlier one on ties)
+        'previous': last date lower or equal than the query
+        'next': first date greater or equal than the query
+    """
+    MODES = ('nearest', 'previous', 'next')
+
+    def __init__(self, full_indexes):
+        index = pd.DatetimeIndex(pd.to_datetime(full_indexes))
+        if not index.is_monotonic_increasing:
+            index = index.sort_values()
+        self.index = index
+        self._values = index.asi8
+
+    def __len__(self):
+        return len(self.index)
+
+    def positions(self, dates, mode='nearest'):
+        """
+        Positions in the sorted index of the resolved dates
+
+        Parameters
+        ----------
+        dates: str, datetime or array-like of them
+        mode: str
+            'nearest', 'previous' or 'next'
+
+        Returns
+        -------
+        int or np.array
+            Position of each resolved date
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Use one of {self.MODES}")
+        scalar = np.ndim(dates) == 0
+        query = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates))).asi8
+        last = len(self._values) - 1
+
+        if mode == 'previous':
+            pos = np.searchsorted(self._values, query, side='right') - 1
+        elif mode == 'next':
+            pos = np.searchsorted(self._values, query, side='left')
+        else:
+            right = np.clip(np.searchsorted(self._values, query, side='left'), 0, last)
+            left = np.clip(right - 1, 0, last)
+            take_left = (query - self._values[left]) <= (self._values[right] - query)
+            pos = np.where(take_left, left, right)
+        pos = np.clip(pos, 0, last)
+        return int(pos[0]) if scalar else pos
 
+    def resolve(self, dates, mode='nearest'):
+        """
+        Resolved dates as Timestamp (single query) or DatetimeIndex
+        """
+        pos = self.positions(dates, mode=mode)
+        return self.index[pos]
+
+    @timed('DateResolver.closest')
+    def closest(self, dates, mode='nearest', date_format='%Y-%m-%d'):
+        """
+        Resolved dates formatted as strings, like find_closest_date
+        """
+        resolved = self.resolve(dates, mode=mode)
+        if isinstance(resolved, pd.Timestamp):
+            return resolved.strftime(date_format)
+        return resolved.strftime(date_format).to_numpy()
+
+@timed('find_closest_date')
 def find_closest_date(date, full_indexes):
     """
     Find the closest date to the one provided by the user
+
+    For repeated queries over the same index build a DateResolver once
+    and call its closest method instead.
+    """
+    return DateResolver(full_indexes).closest(date)
+
+def window_bounds(index, initial_dates, end_dates):
     """
-    # Ensure full_indexes is a DatetimeIndex
-    full_indexes = pd.to_datetime(full_indexes)    # Convert to datetime
-    date = pd.to_datetime(date)
-    # Compute the difference in days
-    diff = np.abs((full_indexes - date).days)
-    # Get the index of the minimum
-    idx = np.argmin(diff)
-    return full_indexes[idx].strftime('%Y-%m-%d')
+    Positions [start, stop) in a sorted DatetimeIndex of the rows between
+    initial_date and end_date (both included), found by binary search
+
+    Parameters
+    ----------
+    index: pd.DatetimeIndex
+        Sorted index
+    initial_dates: str, datetime or array-like of them
+    end_dates: str, datetime or array-like of them
+
+    Returns
+    -------
+    tuple
+        (start, stop) as int, or as np.array for arrays of dates
+    """
+    scalar = np.ndim(initial_dates) == 0 and np.ndim(end_dates) == 0
+    # Single dates are parsed as Timestamp, much cheaper than to_datetime
+    if scalar:
+        initial_dates, end_dates = pd.Timestamp(initial_dates), pd.Timestamp(end_dates)
+    else:
+        initial_dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(initial_dates)))
+        end_dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(end_dates)))
+    # Naive dates are in the timezone of the index, as in comparisons
+    if index.tz is not None and initial_dates.tz is None:
+        initial_dates = initial_dates.tz_localize(index.tz)
+    if index.tz is not None and end_dates.tz is None:
+        end_dates = end_dates.tz_localize(index.tz)
+    start = index.searchsorted(initial_dates, side='left')
+    # Empty windows (end before start) have stop == start
+    stop = np.maximum(index.searchsorted(end_dates, side='right'), start)
+    if scalar:
+        return int(start), int(stop)
+    return start, stop
 
+@timed('apply_filter_by_dates')
 def apply_filter_by_dates(data, initial_date, end_date):
     """ 
     Apply a filter to the data by the initial and end date
     
+    With a sorted DatetimeIndex the bounds are found by binary search and
+    the result is a view of data (no copy): do not modify it in place.
+    Otherwise the rows are selected with boolean masks.
+
     Parameters
     ----------
     data: pd.DataFrame
@@ -32,12 +161,46 @@ def apply_filter_by_dates(data, initial_date, end_date):
         Filtered data
         
     """
+    if isinstance(data.index, pd.DatetimeIndex) and data.index.is_monotonic_increasing:
+        start, stop = window_bounds(data.index, initial_date, end_date)
+        return data.iloc[start:stop]
     filtered_data = data[
         (data.index >= initial_date) & 
         (data.index <= end_date)
     ]
     return pd.DataFrame(filtered_data)
 
+def apply_filter_by_windows(data, initial_dates, end_dates):
+    """
+    Filter many windows at once without copying the data
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Data with a sorted DatetimeIndex
+    initial_dates: array-like of str
+    end_dates: array-like of str
+
+    Returns
+    -------
+    DateWindows
+        values: np.array (n_rows, n_columns), values of data (a view when
+        data has a single dtype), shared by all the windows
+        starts, stops: np.array, window i is values[starts[i]:stops[i]]
+        columns: columns of data
+    """
+    if not (isinstance(data.index, pd.DatetimeIndex) and data.index.is_monotonic_increasing):
+        raise ValueError("apply_filter_by_windows requires a sorted DatetimeIndex")
+    starts, stops = window_bounds(data.index, initial_dates, end_dates)
+    return DateWindows(data.to_numpy(copy=False), np.atleast_1d(starts), np.atleast_1d(stops), data.columns)
+
+def prediction_grid(x, nvals=100):
+    """
+    Grid of x values where the fitted line is evaluated for plotting
+    """
+    return np.linspace(x.min()- np.abs(x.min())*5, x.max()+ x.max()*5, nvals)
+
+@timed('fit_line')
 def fit_line(x,
              y, 
              nvals=100, 
@@ -59,18 +222,19 @@ def fit_line(x,
         x values predicted
     y_pred_: np.array
         y values predicted
-    reg: LinearRegression
-        Linear regression model fitted
+    reg: LinearFit
+        Linear regression model fitted (closed form, same interface as
+        sklearn's LinearRegression)
     """
-    reg = LinearRegression(fit_intercept=True).fit(x, y)
+    reg = LinearFit().fit(x, y)
 
     # Get the score of the model
     if verbose:
-        print(f"Score: {reg.score(x,y):10.9f}")
+        print(f"Score: {reg.score():10.9f}")
         print(f"Coef: {reg.coef_[0]:3.2} - {reg.intercept_:1.5f}")
 
     # Predict the data
-    x_pred_ = np.linspace(x.min()- np.abs(x.min())*5, x.max()+ x.max()*5, nvals)
+    x_pred_ = prediction_grid(x, nvals)
     y_pred_ = reg.predict(x_pred_.reshape(-1, 1))
 
     return x_pred_, y_pred_, reg
@@ -139,6 +303,7 @@ class OutlierRemover:
     
         return data, accepted_idxs
     
+    @timed('OutlierRemover.remove_outliers')
     def remove_outliers(self, data, border_cases=False):
         """
         
@@ -148,11 +313,364 @@ class OutlierRemover:
             return self.std_strategy(data, border_cases=border_cases)
         elif self.strategy == 'iqr':
             return self.iqr_strategy(data, border_cases=border_cases)
-    
-def fit_adaptative_line(X, y, residuals, initial_date, end_date, outlier_strategy, threshold):
+
+    @timed('OutlierRemover.threshold_masks')
+    def threshold_masks(self, data, thresholds, border_cases=False, margins=0.0):
+        """
+        Accepted values for several thresholds, computed from a single
+        estimation of the statistics (mean/std or quartiles) of the data.
+        The threshold of the instance is not used.
+
+        Parameters
+        ----------
+        data: pd.Series or np.array
+            1-D data, or 2-D array (n, m) of m series with statistics
+            computed per column. NaN values are ignored and never accepted.
+        thresholds: list of float
+        border_cases: bool or list of bool
+            Border cases rule for all the thresholds or for each one, the
+            same as a margin of BORDER_MARGIN
+        margins: float or list of float
+            Relative widening of the limits for all the thresholds or for
+            each one (0.1 widens them by 10%)
+
+        Returns
+        -------
+        np.array
+            Boolean array (len(thresholds), n) or (len(thresholds), n, m),
+            True for accepted values
+        """
+        values = np.asarray(data, dtype=np.float64)
+        if values.ndim != 2:
+            values = values.ravel()
+        thresholds = np.asarray(thresholds, dtype=np.float64).ravel()
+        border_cases = np.broadcast_to(np.asarray(border_cases, dtype=bool), thresholds.shape)
+        margins = np.broadcast_to(np.asarray(margins, dtype=np.float64), thresholds.shape)
+        margins = np.where(border_cases, BORDER_MARGIN, margins)
+        # Thresholds along a new first axis, broadcast over the data axes
+        shape = (-1,) + (1,) * values.ndim
+        thresholds = thresholds.reshape(shape)
+        margins = margins.reshape(shape)
+        has_nan = np.isnan(values).any()
+
+        if self.strategy == 'std':
+            # Same std as std_strategy: pandas (ddof=1) or numpy (ddof=0)
+            ddof = 1 if isinstance(data, (pd.Series, pd.DataFrame)) else 0
+            mean = np.nanmean(values, axis=0) if has_nan else values.mean(axis=0)
+            std = np.nanstd(values, axis=0, ddof=ddof) if has_nan else values.std(axis=0, ddof=ddof)
+            z = np.abs((values - mean) / std)
+            thresholds = thresholds + margins*thresholds
+            return z[None] < thresholds
+        elif self.strategy == 'iqr':
+            quantile = np.nanquantile if has_nan else np.quantile
+            q1, q3 = quantile(values, [0.25, 0.75], axis=0)
+            iqr = q3 - q1
+            lower_bound = q1 - thresholds * iqr
+            upper_bound = q3 + thresholds * iqr
+            # Margins widen the bounds (by 10% for the border cases)
+            lower_bound = lower_bound - margins*lower_bound
+            upper_bound = upper_bound + margins*upper_bound
+            return (values[None] > lower_bound) & (values[None] < upper_bound)
+        raise ValueError(f"Unknown outlier strategy '{self.strategy}'")
+
+    @timed('OutlierRemover.candidate_masks')
+    def candidate_masks(self, data, candidate_margins=(BORDER_MARGIN,)):
+        """
+        Accepted values for the strict limit and the limits widened by
+        each candidate margin, from a single estimation of the statistics.
+
+        Parameters
+        ----------
+        data: pd.Series or np.array
+        candidate_margins: list of float
+            Relative widenings of the limits of the threshold. The default
+            is the border cases limit (as border_cases=True).
+
+        Returns
+        -------
+        np.array
+            Boolean array (1 + len(candidate_margins), n). Rows are the
+            strict limit and the candidate margins, in that order.
+        """
+        margins = [0.0] + list(np.ravel(candidate_margins))
+        return self.threshold_masks(data, [self.threshold] * len(margins), margins=margins)
+
+    def rolling_mask(self, data, window, step=1, border_cases=False):
+        """
+        Outliers of every window of the series, computed with the same
+        rules as remove_outliers but without a Python loop over windows:
+        the windows are strided views of the data.
+
+        Parameters
+        ----------
+        data: pd.Series or np.array
+            1-D series, e.g. one column of log_returns_difference or the
+            residuals of a fit
+        window: int
+            Number of points of each window
+        step: int
+            Distance between the starts of consecutive windows
+        border_cases: bool
+
+        Returns
+        -------
+        RollingOutlierMask
+            starts: position of the first point of each window
+            mask: bool array (n_windows, window), True for the outliers
+        """
+        index = data.index if isinstance(data, pd.Series) else None
+        values = np.asarray(data, dtype=np.float64)
+        if not 1 < window <= len(values):
+            raise ValueError(f"window must be between 2 and {len(values)}, got {window}")
+        views = sliding_window_view(values, window)[::step]
+        starts = np.arange(0, len(values) - window + 1, step)
+        mask = np.empty(views.shape, dtype=bool)
+
+        if self.strategy == 'std':
+            threshold = self.threshold + 0.1*self.threshold if border_cases else self.threshold
+            # Same std as std_strategy: pandas (ddof=1) or numpy (ddof=0)
+            ddof = 1 if isinstance(data, (pd.Series, pd.DataFrame)) else 0
+            # Window moments from prefix sums, shifted by the global mean
+            shifted = values - values.mean()
+            sums = np.concatenate(([0.0], np.cumsum(shifted)))
+            squares = np.concatenate(([0.0], np.cumsum(shifted**2)))
+            total = sums[starts + window] - sums[starts]
+            mean = total / window + values.mean()
+            std = np.sqrt(np.maximum(squares[starts + window] - squares[starts] - total**2 / window, 0)
+                          / (window - ddof))
+        elif self.strategy != 'iqr':
+            raise ValueError(f"Unknown outlier strategy '{self.strategy}'")
+
+        chunk = max(1, ROLLING_CHUNK_SIZE // window)
+        for i in range(0, len(views), chunk):
+            block = views[i:i + chunk]
+            if self.strategy == 'std':
+                z = (block - mean[i:i + chunk, None]) / std[i:i + chunk, None]
+                mask[i:i + chunk] = ~(np.abs(z) < threshold)
+            else:
+                q1, q3 = np.quantile(block, [0.25, 0.75], axis=1)
+                iqr = q3 - q1
+                lower_bound = q1 - self.threshold * iqr
+                upper_bound = q3 + self.threshold * iqr
+                if border_cases:
+                    lower_bound = lower_bound - 0.1*lower_bound
+                    upper_bound = upper_bound + 0.1*upper_bound
+                mask[i:i + chunk] = ~((block > lower_bound[:, None]) & (block < upper_bound[:, None]))
+
+        if index is not None:
+            starts_index, ends_index = index[starts], index[starts + window - 1]
+        else:
+            starts_index, ends_index = starts, starts + window - 1
+        return RollingOutlierMask(window, step, starts, starts_index, ends_index, mask)
+
+def rolling_outlier_masks(data, windows, steps=(1,), strategy='std', threshold=1.5, border_cases=False):
+    """
+    Rolling outlier masks for several window lengths and steps over the
+    whole history. Replaces moving the date slider window by window.
+
+    Parameters
+    ----------
+    data: pd.Series or np.array
+    windows: list of int
+        Window lengths
+    steps: list of int
+        Distances between window starts
+    strategy: str
+        'std' or 'iqr'
+    threshold: float
+    border_cases: bool
+
+    Returns
+    -------
+    dict
+        RollingOutlierMask for each (window, step)
+    """
+    outlier_removal = OutlierRemover(strategy, threshold)
+    return {(window, step): outlier_removal.rolling_mask(data, window, step=step,
+                                                         border_cases=border_cases)
+            for window in windows for step in steps}
+
+class P2Quantile:
+    """
+    Streaming estimate of a quantile with the P-square algorithm
+    (Jain & Chlamtac, 1985). Keeps five markers, so each update is O(1)
+    in time and memory whatever the number of points seen.
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self._initial = []
+        self.q = None
+
+    def update(self, x):
+        self.count += 1
+        if self.q is None:
+            self._initial.append(float(x))
+            if len(self._initial) == 5:
+                p = self.p
+                self.q = sorted(self._initial)
+                self.n = [0, 1, 2, 3, 4]
+                self.desired = [0, 2*p, 4*p, 2 + 2*p, 4]
+                self.increment = [0, p/2, p, (1 + p)/2, 1]
+            return
+        q, n = self.q, self.n
+
+        # Find the cell of x and update the extreme markers
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increment[i]
+
+        # Adjust the height of the middle markers
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    # Linear prediction when the parabolic one is not monotone
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    @property
+    def value(self):
+        if self.q is not None:
+            return self.q[2]
+        if self._initial:
+            return float(np.quantile(self._initial, self.p))
+        return np.nan
+
+class OnlineOutlierRemover(OutlierRemover):
+    """
+    Outlier detection for streaming data. Statistics are updated with
+    each new batch instead of recomputed over the whole history:
+
+    - 'std': mean and variance with Welford's algorithm
+    - 'iqr': first and third quartiles with P-square estimators
+
+    The bounds follow the same rules as OutlierRemover, including the
+    border_cases widening.
+    """
+
+    def __init__(self, strategy, threshold):
+        super().__init__(strategy, threshold)
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._q1 = P2Quantile(0.25)
+        self._q3 = P2Quantile(0.75)
+
+    @property
+    def std(self):
+        """Standard deviation (ddof=1, as pandas) of the data seen"""
+        if self.count < 2:
+            return np.nan
+        return float(np.sqrt(self._m2 / (self.count - 1)))
+
+    @property
+    def quartiles(self):
+        return self._q1.value, self._q3.value
+
+    def update(self, batch):
+        """
+        Add a batch of new values to the statistics
+
+        Parameters
+        ----------
+        batch: float or array-like
+        """
+        batch = np.asarray(batch, dtype=np.float64).ravel()
+        batch = batch[~np.isnan(batch)]
+        if batch.size == 0:
+            return self
+
+        # Merge the batch moments into the running ones (Chan et al.)
+        batch_mean = batch.mean()
+        batch_m2 = ((batch - batch_mean)**2).sum()
+        total = self.count + batch.size
+        delta = batch_mean - self.mean
+        self.mean += delta * batch.size / total
+        self._m2 += batch_m2 + delta**2 * self.count * batch.size / total
+        self.count = total
+
+        if self.strategy == 'iqr':
+            for value in batch:
+                self._q1.update(value)
+                self._q3.update(value)
+        return self
+
+    def bounds(self, border_cases=False):
+        """
+        Lower and upper limits of the accepted values
+
+        Returns
+        -------
+        lower_bound: float
+        upper_bound: float
+        """
+        if self.strategy == 'std':
+            threshold = self.threshold + 0.1*self.threshold if border_cases else self.threshold
+            return self.mean - threshold * self.std, self.mean + threshold * self.std
+        elif self.strategy == 'iqr':
+            q1, q3 = self.quartiles
+            iqr = q3 - q1
+            lower_bound = q1 - self.threshold * iqr
+            upper_bound = q3 + self.threshold * iqr
+            if border_cases:
+                lower_bound, upper_bound = lower_bound - 0.1*lower_bound, upper_bound + 0.1*upper_bound
+            return lower_bound, upper_bound
+        raise ValueError(f"Unknown outlier strategy '{self.strategy}'")
+
+    def is_outlier(self, values, border_cases=False):
+        """
+        Classify values with the current statistics, O(1) per value
+
+        Parameters
+        ----------
+        values: float or array-like
+        border_cases: bool
+
+        Returns
+        -------
+        bool or np.array
+            True for the values outside the accepted bounds
+        """
+        values = np.asarray(values, dtype=np.float64)
+        lower_bound, upper_bound = self.bounds(border_cases=border_cases)
+        if self.strategy == 'std':
+            # Same strict inequality as std_strategy: |z| < threshold
+            outliers = ~(np.abs(values - self.mean) < upper_bound - self.mean)
+        else:
+            outliers = ~((values > lower_bound) & (values < upper_bound))
+        return outliers if outliers.ndim else bool(outliers)
+
+@timed('fit_adaptative_line')
+def fit_adaptative_line(X, y, residuals, initial_date, end_date, outlier_strategy, threshold,
+                        candidate_margins=(BORDER_MARGIN,)):
     """
     Fit a line to the data considering the outliers
-    
+
+    The strict outlier limit and the limits widened by each candidate
+    margin (by default the border cases limit, 10% wider) are evaluated
+    together: the candidate sets of accepted points come from one
+    estimation of the residual statistics and their fits from one set of
+    sufficient statistics. The candidate with the best R2 is kept (the
+    strict one on ties).
+
     Parameters
     ----------
     X: np.array
@@ -166,7 +684,9 @@ def fit_adaptative_line(X, y, residuals, initial_date, end_date, outlier_strateg
     outlier_strategy: str
         'std' or 'iqr'
     threshold: float
-    
+    candidate_margins: list of float
+        Relative widenings of the outlier limits evaluated as candidates
+
     Returns
     -------
     x_pred_no_outliers: np.array
@@ -174,40 +694,23 @@ def fit_adaptative_line(X, y, residuals, initial_date, end_date, outlier_strateg
     y_pred_no_outliers: np.array
         y values predicted without outliers
     accepted_idxs: np.array
-        indexes of the accepted values   
+        indexes of the accepted values
     """
-    
-    
     outlier_removal = OutlierRemover(outlier_strategy, threshold)
-
-    _, accepted_idxs = outlier_removal.remove_outliers(residuals, border_cases=False)
-    X_no_outliers = X[accepted_idxs]
-    y_no_outliers = y[accepted_idxs]
+    masks = outlier_removal.candidate_masks(residuals, candidate_margins=candidate_margins)
 
     print(f"Fitting line from {initial_date} to {end_date}. ======================")
-    
-    # Fit the model without outliers
-    x_pred_no_outliers, y_pred_no_outliers, fitted_model = fit_line(X_no_outliers, y_no_outliers, nvals=100)
-    score_fix_border = fitted_model.score(X_no_outliers, y_no_outliers)
-    
-    ### Compute Score for linear regression considering 10% greater the outlier limit to account for border cases if improve the score
-    _, accepted_idxs_var = outlier_removal.remove_outliers(residuals, border_cases=True)
-    X_no_outliers_var = X[accepted_idxs_var]
-    y_no_outliers_var = y[accepted_idxs_var]
-    # Fit the model without outliers
-    x_pred_no_outliers_var, y_pred_no_outliers_var, fitted_model_var = fit_line(X_no_outliers_var,
-                                                                                y_no_outliers_var, 
-                                                                                nvals=100)
-    score_var_border = fitted_model_var.score(X_no_outliers_var, y_no_outliers_var)
-    if score_fix_border >= score_var_border:
-        x_pred_no_outliers = x_pred_no_outliers
-        y_pred_no_outliers = y_pred_no_outliers
-        accepted_idxs = accepted_idxs
-    else:
-        x_pred_no_outliers = x_pred_no_outliers_var
-        y_pred_no_outliers = y_pred_no_outliers_var
-        accepted_idxs = accepted_idxs_var
-        print("!Outliers account for Fitting computation!")   
-        
-    return  x_pred_no_outliers, y_pred_no_outliers, accepted_idxs
 
+    slope, intercept, r2, sse, count = masked_line_fits(X, y, masks)
+    best = int(np.argmax(r2))
+    accepted_idxs = masks[best]
+    fitted_model = LinearFit.from_moments(slope[best], intercept[best], r2[best], sse[best], count[best])
+    print(f"Score: {fitted_model.score():10.9f}")
+    print(f"Coef: {fitted_model.coef_[0]:3.2} - {fitted_model.intercept_:1.5f}")
+    if best > 0:
+        print("!Outliers account for Fitting computation!")
+
+    x_pred_no_outliers = prediction_grid(X[accepted_idxs], nvals=100)
+    y_pred_no_outliers = fitted_model.predict(x_pred_no_outliers)
+
+    return  x_pred_no_outliers, y_pred_no_outliers, accepted_idxs
@@ -0,0 +1,316 @@
+import numpy as np
+import pandas as pd
+
+from src.models.timing import timed
+
+def line_from_moments(n, sx, sy, sxx, sxy, syy):
+    """
+    Closed-form simple linear regression from the sufficient statistics
+    of a sample. Every argument can be a scalar or an array, in which case
+    one line is solved per element.
+
+    Parameters
+    ----------
+    n: int or np.array
+        Number of points
+    sx, sy: float or np.array
+        Sum of x and sum of y
+    sxx, sxy, syy: float or np.array
+        Sum of x**2, x*y and y**2
+
+    Returns
+    -------
+    slope: float or np.array
+    intercept: float or np.array
+    r2: float or np.array
+        Coefficient of determination (same as LinearRegression.score)
+    sse: float or np.array
+        Sum of squared residuals
+    """
+    n = np.asarray(n, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Centered second moments
+        cxx = sxx - sx * sx / n
+        cxy = sxy - sx * sy / n
+        cyy = syy - sy * sy / n
+        slope = np.where(cxx > 0, cxy / cxx, 0.0)
+        intercept = (sy - slope * sx) / n
+        sse = np.maximum(cyy - slope * cxy, 0.0)
+        # Same convention as sklearn: a constant target has a perfect fit
+        r2 = np.where(cyy > 0, 1.0 - sse / cyy, 1.0)
+    if slope.ndim == 0:
+        return float(slope), float(intercept), float(r2), float(sse)
+    return slope, intercept, r2, sse
+
+@timed('masked_line_fits')
+def masked_line_fits(x, y, masks):
+    """
+    Linear regressions of y over x restricted to several subsets of the
+    points, all solved from one matrix product of the masks with the
+    per-point moments.
+
+    Parameters
+    ----------
+    x: np.array
+        x values, shape (n,) or (n, 1)
+    y: np.array
+        y values, shape (n,)
+    masks: np.array
+        Boolean array (k, n), one row per subset of accepted points
+
+    Returns
+    -------
+    slope, intercept, r2, sse, count: np.array
+        One value per subset
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    masks = np.atleast_2d(np.asarray(masks, dtype=np.float64))
+    # Center to keep the sums well conditioned
+    x_shift, y_shift = x.mean(), y.mean()
+    x = x - x_shift
+    y = y - y_shift
+
+    sums = masks @ np.column_stack((np.ones_like(x), x, y, x * x, x * y, y * y))
+    slope, intercept, r2, sse = line_from_moments(*sums.T)
+    intercept = intercept + y_shift - slope * x_shift
+    return slope, intercept, r2, sse, sums[:, 0].astype(np.int64)
+
+def _as_feature(x):
+    """Values of a single feature, given as (n,) or (..., n, 1)"""
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim >= 2 and x.shape[-1] == 1:
+        x = x[..., 0]
+    return x
+
+def fit_lines(x, y, sample_weight=None):
+    """
+    Closed-form (weighted) least squares lines of y over x for a batch of
+    samples stacked along the first axes. Each row is an independent
+    regression over the last axis.
+
+    Parameters
+    ----------
+    x: np.array
+        x values, shape (..., n). A single (n,) array is shared by all y.
+    y: np.array
+        y values, shape (..., n)
+    sample_weight: np.array, optional
+        Weights broadcastable to the shape of y
+
+    Returns
+    -------
+    slope, intercept, r2, sse: np.array
+        One value per regression
+    """
+    x = _as_feature(x)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = np.broadcast_arrays(x, y)
+    w = np.ones_like(y) if sample_weight is None else np.broadcast_to(
+        np.asarray(sample_weight, dtype=np.float64), y.shape)
+
+    total = w.sum(axis=-1)
+    x_mean = (w * x).sum(axis=-1) / total
+    y_mean = (w * y).sum(axis=-1) / total
+    dx = x - x_mean[..., None]
+    dy = y - y_mean[..., None]
+    slope, _, r2, sse = line_from_moments(total, 0.0, 0.0,
+                                          (w * dx * dx).sum(axis=-1),
+                                          (w * dx * dy).sum(axis=-1),
+                                          (w * dy * dy).sum(axis=-1))
+    intercept = y_mean - slope * x_mean
+    return slope, intercept, r2, sse
+
+class LinearFit:
+    """
+    Simple (one feature) least squares line solved in closed form with
+    NumPy. Drop-in for the parts of sklearn's LinearRegression used in this
+    project: fit, predict, score, coef_ and intercept_, without sklearn's
+    validation and copies.
+
+    The training R2 and sum of squared residuals are kept as r2_ and sse_.
+    """
+
+    def __init__(self):
+        self.coef_ = None
+        self.intercept_ = None
+        self.r2_ = None
+        self.sse_ = None
+        self.n_ = None
+
+    @classmethod
+    def from_moments(cls, slope, intercept, r2, sse, n):
+        """Model of a line already solved (e.g. with line_from_moments)"""
+        model = cls()
+        model.coef_ = np.array([slope])
+        model.intercept_ = intercept
+        model.r2_ = r2
+        model.sse_ = sse
+        model.n_ = n
+        return model
+
+    def fit(self, x, y, sample_weight=None):
+        """
+        Parameters
+        ----------
+        x: np.array
+            x values, shape (n,) or (n, 1)
+        y: np.array
+            y values, shape (n,)
+        sample_weight: np.array, optional
+        """
+        x = _as_feature(x)
+        if x.ndim != 1:
+            raise ValueError(f"LinearFit supports a single feature, got x with shape {np.shape(x)}")
+        slope, intercept, r2, sse = fit_lines(x, np.asarray(y, dtype=np.float64).ravel(), sample_weight)
+        self.coef_ = np.array([float(slope)])
+        self.intercept_ = float(intercept)
+        self.r2_ = float(r2)
+        self.sse_ = float(sse)
+        self.n_ = len(x)
+        return self
+
+    @property
+    def residual_std(self):
+        """Standard deviation (ddof=1) of the training residuals"""
+        if self.n_ < 2:
+            return 0.0
+        return float(np.sqrt(self.sse_ / (self.n_ - 1)))
+
+    def predict(self, x):
+        return self.coef_[0] * _as_feature(x) + self.intercept_
+
+    def score(self, x=None, y=None, sample_weight=None):
+        """
+        R2 of the model on (x, y). Without data, the training R2.
+        """
+        if x is None:
+            return self.r2_
+        y = np.asarray(y, dtype=np.float64).ravel()
+        w = np.ones_like(y) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        residuals = y - self.predict(x)
+        sse = (w * residuals**2).sum()
+        sst = (w * (y - np.average(y, weights=w))**2).sum()
+        return 1.0 - sse / sst if sst > 0 else 1.0
+
+class CumulativeMoments:
+    """
+    Prefix sums of (1, x, y, x**2, x*y, y**2) over a time-indexed series.
+
+    Built once, it answers the linear regression of y over x for any
+    [initial_date, end_date] window in constant time (plus a binary search
+    on the index), without filtering or copying the underlying rows.
+    """
+
+    def __init__(self, data, xdata_label, ydata_label):
+        """
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Data sorted by its index (dates)
+        xdata_label: str
+            Column used as independent variable
+        ydata_label: str
+            Column used as dependent variable
+        """
+        self.xdata_label = xdata_label
+        self.ydata_label = ydata_label
+        x = data[xdata_label].to_numpy(dtype=np.float64)
+        y = data[ydata_label].to_numpy(dtype=np.float64)
+        self.index = pd.DatetimeIndex(pd.to_datetime(data.index))
+        # Shift the values by their mean to avoid cancellation in the
+        # centered moments of long series
+        self.x_shift = x.mean() if len(x) else 0.0
+        self.y_shift = y.mean() if len(y) else 0.0
+        x = x - self.x_shift
+        y = y - self.y_shift
+
+        moments = np.empty((len(x) + 1, 5))
+        moments[0] = 0.0
+        np.cumsum(x, out=moments[1:, 0])
+        np.cumsum(y, out=moments[1:, 1])
+        np.cumsum(x * x, out=moments[1:, 2])
+        np.cumsum(x * y, out=moments[1:, 3])
+        np.cumsum(y * y, out=moments[1:, 4])
+        self.moments = moments
+
+    def to_arrays(self):
+        """Arrays to publish with a shared dataset (see from_arrays)"""
+        return dict(moments=self.moments,
+                    moments_shift=np.array([self.x_shift, self.y_shift]),
+                    moments_labels=np.array([str(self.xdata_label), str(self.ydata_label)]))
+
+    @classmethod
+    def from_arrays(cls, index, arrays, xdata_label, ydata_label):
+        """
+        CumulativeMoments of published prefix sums (see to_arrays), which
+        are used without copy
+
+        Returns
+        -------
+        CumulativeMoments or None
+            None if arrays has no prefix sums of xdata_label and
+            ydata_label over index
+        """
+        if 'moments' not in arrays or list(arrays['moments_labels']) != [str(xdata_label), str(ydata_label)]:
+            return None
+        if len(arrays['moments']) != len(index) + 1:
+            return None
+        moments = cls.__new__(cls)
+        moments.xdata_label = xdata_label
+        moments.ydata_label = ydata_label
+        moments.index = pd.DatetimeIndex(index)
+        moments.x_shift, moments.y_shift = (float(shift) for shift in arrays['moments_shift'])
+        moments.moments = arrays['moments']
+        return moments
+
+    def __len__(self):
+        return len(self.index)
+
+    def locate(self, initial_date, end_date):
+        """
+        Positions [start, stop) of the rows between initial_date and
+        end_date (both included), same rows as apply_filter_by_dates.
+        """
+        start = self.index.searchsorted(pd.Timestamp(initial_date), side='left')
+        stop = self.index.searchsorted(pd.Timestamp(end_date), side='right')
+        return int(start), int(max(stop, start))
+
+    def sums(self, start, stop):
+        """
+        Sufficient statistics (n, sx, sy, sxx, sxy, syy) of rows
+        [start, stop) in the shifted coordinates. Arrays of positions are
+        accepted to query many windows at once.
+        """
+        window = self.moments[stop] - self.moments[start]
+        n = np.asarray(stop) - np.asarray(start)
+        return (n,) + tuple(window[..., k] for k in range(5))
+
+    def fit_positions(self, start, stop):
+        """
+        Linear regression over rows [start, stop). Returns slope,
+        intercept, r2 and sse (arrays if start/stop are arrays).
+        """
+        slope, intercept, r2, sse = line_from_moments(*self.sums(start, stop))
+        # Back to the original coordinates
+        intercept = intercept + self.y_shift - slope * self.x_shift
+        return slope, intercept, r2, sse
+
+    @timed('CumulativeMoments.fit')
+    def fit(self, initial_date, end_date):
+        """
+        Fit the line of the window between initial_date and end_date
+
+        Parameters
+        ----------
+        initial_date: str
+        end_date: str
+
+        Returns
+        -------
+        LinearFit
+            Fitted model of the window
+        """
+        start, stop = self.locate(initial_date, end_date)
+        slope, intercept, r2, sse = self.fit_positions(start, stop)
+        return LinearFit.from_moments(slope, intercept, r2, sse, stop - start)
@@ -0,0 +1,183 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.models.libfit import OutlierRemover
+from src.models.moments import fit_lines, line_from_moments
+
+# Columns of the results table
+PAIR_COLUMNS = ['x_ticker', 'y_ticker', 'initial_date', 'end_date',
+                'slope', 'intercept', 'r2', 'n_points', 'n_outliers', 'border_cases',
+                'slope_all', 'r2_all']
+
+def rolling_windows(dates, length, step):
+    """
+    (initial_date, end_date) of rolling windows of length rows every step
+    rows, as accepted by pairwise_fits
+    """
+    dates = pd.DatetimeIndex(dates)
+    return [(dates[start], dates[start + length - 1])
+            for start in range(0, len(dates) - length + 1, step)]
+
+def anchor_fits(x, Y, outlier_strategy, threshold):
+    """
+    Outlier-robust fits of every column of Y over x, with the rules of
+    fit_adaptative_line: full fit, residual outliers with the strict and
+    the border cases limits, and the best of both refits by R2.
+
+    Parameters
+    ----------
+    x: np.array
+        x values (n,)
+    Y: np.array
+        y values of m series (n, m). NaN marks missing values.
+
+    Returns
+    -------
+    dict of np.array
+        slope, intercept, r2, n_points, n_outliers, border_cases,
+        slope_all and r2_all for each column of Y
+    """
+    valid = ~np.isnan(Y) & ~np.isnan(x)[:, None]
+    x0 = np.where(np.isnan(x), 0.0, x)
+    Y0 = np.where(valid, Y, 0.0)
+
+    # Fit with all the points
+    slope_all, intercept_all, r2_all, _ = fit_lines(x0, Y0.T, sample_weight=valid.T)
+    residuals = np.where(valid, Y0 - (slope_all * x0[:, None] + intercept_all), np.nan)
+
+    # Strict and border cases masks of every column at once
+    masks = OutlierRemover(outlier_strategy, threshold).threshold_masks(
+        residuals, [threshold, threshold], border_cases=[False, True])
+
+    # Sufficient statistics of each (candidate, column), centered by column
+    counts = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = (x0[:, None] * valid).sum(axis=0) / counts
+        y_mean = Y0.sum(axis=0) / counts
+    dx = np.where(valid, x0[:, None] - x_mean, 0.0)
+    dy = np.where(valid, Y0 - y_mean, 0.0)
+    weights = masks.astype(np.float64)
+    slope, intercept, r2, _ = line_from_moments(weights.sum(axis=1),
+                                                (weights * dx).sum(axis=1),
+                                                (weights * dy).sum(axis=1),
+                                                (weights * dx * dx).sum(axis=1),
+                                                (weights * dx * dy).sum(axis=1),
+                                                (weights * dy * dy).sum(axis=1))
+    intercept = intercept + y_mean - slope * x_mean
+
+    # Border cases only when they improve the score
+    use_border = r2[1] > r2[0]
+    best = use_border.astype(int)
+    columns = np.arange(Y.shape[1])
+    n_points = masks[best, :, columns].sum(axis=1)
+    return {
+        'slope': slope[best, columns],
+        'intercept': intercept[best, columns],
+        'r2': r2[best, columns],
+        'n_points': n_points,
+        'n_outliers': counts - n_points,
+        'border_cases': use_border,
+        'slope_all': slope_all,
+        'r2_all': r2_all,
+    }
+
+# Data shared with the worker processes, set once by _init_worker
+_WORKER_DATA = {}
+
+def _init_worker(values, tickers, positions, windows, outlier_strategy, threshold):
+    _WORKER_DATA.update(values=values, tickers=tickers, positions=positions, windows=windows,
+                        outlier_strategy=outlier_strategy, threshold=threshold)
+
+def _anchor_task(anchor):
+    """Fits of ticker anchor against all the following tickers, every window"""
+    data = _WORKER_DATA
+    values, tickers = data['values'], data['tickers']
+    tables = []
+    for (start, stop), (initial_date, end_date) in zip(data['positions'], data['windows']):
+        if stop - start < 3:
+            continue
+        results = anchor_fits(values[start:stop, anchor], values[start:stop, anchor + 1:],
+                              data['outlier_strategy'], data['threshold'])
+        table = pd.DataFrame(results)
+        table.insert(0, 'x_ticker', tickers[anchor])
+        table.insert(1, 'y_ticker', tickers[anchor + 1:])
+        table.insert(2, 'initial_date', initial_date)
+        table.insert(3, 'end_date', end_date)
+        tables.append(table)
+    if not tables:
+        return pd.DataFrame(columns=PAIR_COLUMNS)
+    return pd.concat(tables, ignore_index=True)[PAIR_COLUMNS]
+
+def pairwise_fits(returns,
+                  windows=None,
+                  outlier_strategy='std',
+                  threshold=1.5,
+                  n_jobs=None,
+                  path=None):
+    """
+    Outlier-robust spread regression for all the N*(N-1)/2 pairs of
+    tickers of a returns matrix, in every date window.
+
+    Work is split by anchor ticker: each task fits one ticker (x) against
+    all the following ones (y) with vectorized moments, and the tasks run
+    in a process pool that receives the returns matrix once.
+
+    Parameters
+    ----------
+    returns: pd.DataFrame
+        Returns indexed by date, one column per ticker (as returned by
+        compute_daily_return)
+    windows: list of (initial_date, end_date), optional
+        Windows (both dates included). Defaults to the whole period. See
+        rolling_windows.
+    outlier_strategy: str
+        'std' or 'iqr'
+    threshold: float
+    n_jobs: int, optional
+        Number of processes. None uses all the cores, 1 runs in-process.
+    path: str, optional
+        File where the results table is saved (.parquet or .csv)
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per pair and window with the columns of PAIR_COLUMNS
+    """
+    t0 = time.time()
+    returns = returns.sort_index()
+    index = pd.DatetimeIndex(returns.index)
+    values = returns.to_numpy(dtype=np.float64)
+    tickers = np.asarray(returns.columns, dtype=object)
+    if windows is None:
+        windows = [(index[0], index[-1])]
+    positions = [(int(index.searchsorted(pd.Timestamp(initial_date), side='left')),
+                  int(index.searchsorted(pd.Timestamp(end_date), side='right')))
+                 for initial_date, end_date in windows]
+    anchors = list(range(len(tickers) - 1))
+    initargs = (values, tickers, positions, windows, outlier_strategy, threshold)
+
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        tables = [_anchor_task(anchor) for anchor in anchors]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=initargs) as executor:
+            tables = list(executor.map(_anchor_task, anchors,
+                                       chunksize=max(1, len(anchors) // (4 * (n_jobs or os.cpu_count() or 1)))))
+
+    tables = [table for table in tables if len(table)]
+    results = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=PAIR_COLUMNS)
+    print(f"{len(results)} pair fits of {len(tickers)} tickers and {len(windows)} windows "
+          f"in {time.time() - t0:.2f} s")
+
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".parquet"):
+            results.to_parquet(path, index=False)
+        else:
+            results.to_csv(path, index=False)
+    return results
@@ -0,0 +1,137 @@
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+class ResultCache:
+    """
+    Bounded LRU cache with time to live for callback results.
+
+    Entries are kept in memory and, when a directory is given, also as
+    pickle files in it, so every process pointing to the same directory
+    (e.g. all the gunicorn workers) shares the results. Files are written
+    atomically and the directory is pruned to maxsize entries, removing
+    the least recently used first.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, directory=None):
+        """
+        Parameters
+        ----------
+        maxsize: int
+            Maximum number of entries (in memory and on disk)
+        ttl: float, optional
+            Seconds an entry is valid. None keeps entries until evicted.
+        directory: str, optional
+            Directory shared between processes
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.directory = directory
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _expired(self, timestamp):
+        return self.ttl is not None and time.time() - timestamp > self.ttl
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.pkl")
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._memory:
+                timestamp, value = self._memory[key]
+                if not self._expired(timestamp):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                timestamp = os.path.getmtime(path)
+                if not self._expired(timestamp):
+                    with open(path, "rb") as file:
+                        value = pickle.load(file)
+                    # Keep the access time for the LRU pruning
+                    os.utime(path, (time.time(), timestamp))
+                    self._remember(key, value, timestamp)
+                    self.hits += 1
+                    return value
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass
+
+        self.misses += 1
+        return default
+
+    def _remember(self, key, value, timestamp):
+        with self._lock:
+            self._memory[key] = (timestamp, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.maxsize:
+                self._memory.popitem(last=False)
+
+    def set(self, key, value):
+        timestamp = time.time()
+        self._remember(key, value, timestamp)
+        if self.directory is not None:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._prune()
+
+    def _prune(self):
+        """Remove the least recently used files above maxsize"""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".pkl")]
+        except OSError:
+            return
+        if len(entries) <= self.maxsize:
+            return
+        # Other processes prune the same directory: skip the files removed
+        # since the scan
+        access_times = []
+        for entry in entries:
+            try:
+                access_times.append((entry.stat().st_atime, entry))
+            except OSError:
+                pass
+        access_times.sort(key=lambda item: item[0])
+        for _, entry in access_times[:len(access_times) - self.maxsize]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """
+        Cached value of key, computing it with func(*args, **kwargs) and
+        storing it when missing or expired
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = func(*args, **kwargs)
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pkl"):
+                    os.remove(entry.path)
+
+    def __len__(self):
+        return len(self._memory)
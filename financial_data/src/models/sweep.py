@@ -0,0 +1,227 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.models.libfit import BORDER_MARGIN, OutlierRemover, apply_filter_by_dates, prediction_grid
+from src.models.moments import CumulativeMoments, masked_line_fits
+from src.models.timing import timed
+
+class ThresholdSweep:
+    """
+    Outlier fits of a date window for every threshold and strategy of the
+    dashboard, computed together so that moving the threshold slider is a
+    lookup.
+
+    For each strategy the accepted-point masks of all the thresholds (and
+    their candidate margins, see fit_adaptative_line) come from one
+    estimation of the residual statistics, and all the fits from one set
+    of sufficient statistics. The sweeps of the last maxsize windows and
+    strategies are kept (least recently used first out), so sessions on
+    different windows do not evict each other. A window is swept from its
+    min_requests-th request on: before that lookup returns None and the
+    caller fits the single threshold, which is cheaper than the sweep.
+    """
+
+    def __init__(self, data, xdata_label, ydata_label, thresholds, strategies,
+                 moments=None, nvals=100, candidate_margins=(BORDER_MARGIN,),
+                 maxsize=8, min_requests=2):
+        """
+        Parameters
+        ----------
+        data: pd.DataFrame
+            Returns indexed by date (log_returns_difference)
+        xdata_label: str
+        ydata_label: str
+        thresholds: list of float
+            Values of the threshold slider
+        strategies: list of str
+            Outlier strategies ('std', 'iqr')
+        moments: CumulativeMoments, optional
+            Prefix sums of the data, built if not given
+        nvals: int
+            Number of points of the fitted lines
+        candidate_margins: list of float
+            Relative widenings of the limits of each threshold evaluated
+            as candidates
+        maxsize: int
+            Number of (window, strategy) sweeps kept
+        min_requests: int
+            Lookups of a (window, strategy) before it is swept
+        """
+        self.data = data
+        self.xdata_label = xdata_label
+        self.ydata_label = ydata_label
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)
+        self.strategies = list(strategies)
+        self.moments = moments if moments is not None else CumulativeMoments(data, xdata_label, ydata_label)
+        self.nvals = nvals
+        self.candidate_margins = np.asarray(candidate_margins, dtype=np.float64).ravel()
+        self.maxsize = maxsize
+        self.min_requests = min_requests
+        # (initial_date, end_date, strategy) -> (x_pred, y_pred, results)
+        self._sweeps = OrderedDict()
+        # Lookups of the windows not swept yet, bounded as the sweeps
+        self._requests = OrderedDict()
+        # Sweeps published with a shared dataset (see load_arrays), never
+        # evicted
+        self._published = {}
+        self._lock = threading.Lock()
+
+    def _sweep(self, X, y, initial_date, end_date, strategies):
+        reg_model = self.moments.fit(initial_date, end_date)
+        x_pred = prediction_grid(X, nvals=self.nvals)
+        y_pred = reg_model.predict(x_pred)
+        residuals = y - reg_model.predict(X)
+
+        n_thresholds = len(self.thresholds)
+        # Strict limit then each candidate margin, all the thresholds each
+        margins = np.concatenate(([0.0], self.candidate_margins))
+        thresholds = np.tile(self.thresholds, len(margins))
+        margins = np.repeat(margins, n_thresholds)
+        x = X.ravel()
+
+        sweeps = {}
+        for strategy in strategies:
+            masks = OutlierRemover(strategy, None).threshold_masks(residuals, thresholds, margins=margins)
+            slope, intercept, r2, _, _ = masked_line_fits(x, y, masks)
+            # Best candidate of each threshold, the strict one on ties (as
+            # fit_adaptative_line)
+            best = np.arange(n_thresholds) + n_thresholds * np.argmax(r2.reshape(-1, n_thresholds), axis=0)
+            accepted = masks[best]
+
+            # Fitted lines of every threshold, same grid as prediction_grid
+            x_min = np.where(accepted, x, np.inf).min(axis=1)
+            x_max = np.where(accepted, x, -np.inf).max(axis=1)
+            x_pred_no_outliers = np.linspace(x_min - np.abs(x_min)*5, x_max + x_max*5, self.nvals, axis=1)
+            y_pred_no_outliers = slope[best, None] * x_pred_no_outliers + intercept[best, None]
+            sweeps[strategy] = (x_pred, y_pred, (x_pred_no_outliers, y_pred_no_outliers, accepted, r2[best]))
+        return sweeps
+
+    def _cached(self, key):
+        """Sweep of key if published or kept, refreshing its LRU position"""
+        if key in self._published:
+            return self._published[key]
+        if key in self._sweeps:
+            self._sweeps.move_to_end(key)
+            return self._sweeps[key]
+        return None
+
+    @timed('ThresholdSweep.prepare')
+    def prepare(self, initial_date, end_date, strategies=None):
+        """
+        Sweep of the window for the strategies (all by default), computing
+        the ones not kept
+
+        Returns
+        -------
+        dict
+            (x_pred, y_pred, results) of the window by strategy
+        """
+        strategies = self.strategies if strategies is None else list(strategies)
+        with self._lock:
+            sweeps = {strategy: self._cached((initial_date, end_date, strategy)) for strategy in strategies}
+        missing = [strategy for strategy, sweep in sweeps.items() if sweep is None]
+        if not missing:
+            return sweeps
+
+        # Computed without the lock: sessions on other windows do not wait
+        t0 = time.time()
+        filtered_data = apply_filter_by_dates(self.data, initial_date, end_date)
+        X = filtered_data[self.xdata_label].values.reshape(-1, 1)
+        y = filtered_data[self.ydata_label].values
+        computed = self._sweep(X, y, initial_date, end_date, missing)
+        print(f"Threshold sweep from {initial_date} to {end_date} "
+              f"({len(self.thresholds)} thresholds, {missing}) in {time.time() - t0}")
+        with self._lock:
+            for strategy, sweep in computed.items():
+                key = (initial_date, end_date, strategy)
+                self._sweeps[key] = sweep
+                self._sweeps.move_to_end(key)
+                self._requests.pop(key, None)
+            while len(self._sweeps) > self.maxsize:
+                self._sweeps.popitem(last=False)
+        sweeps.update(computed)
+        return sweeps
+
+    # Fields of the results of each strategy, see _sweep
+    RESULT_FIELDS = ('x_pred_no_outliers', 'y_pred_no_outliers', 'accepted', 'r2')
+
+    def to_arrays(self, initial_date, end_date):
+        """
+        Arrays of the sweep of a window for all the strategies, to publish
+        with a shared dataset (see load_arrays)
+        """
+        sweeps = self.prepare(initial_date, end_date)
+        x_pred, y_pred, _ = sweeps[self.strategies[0]]
+        arrays = dict(sweep_window=np.array([initial_date, end_date]), sweep_thresholds=self.thresholds,
+                      sweep_margins=self.candidate_margins, sweep_strategies=np.array(self.strategies),
+                      sweep_x_pred=x_pred, sweep_y_pred=y_pred)
+        for strategy, (_, _, result) in sweeps.items():
+            for field, value in zip(self.RESULT_FIELDS, result):
+                arrays[f"sweep_{strategy}_{field}"] = value
+        return arrays
+
+    def load_arrays(self, arrays):
+        """
+        Use a published sweep (see to_arrays) without copy. It is kept
+        for the process, outside of the maxsize sweeps.
+
+        Returns
+        -------
+        bool
+            False if arrays has no sweep of the thresholds, margins and
+            strategies
+        """
+        if 'sweep_window' not in arrays or 'sweep_margins' not in arrays:
+            return False
+        if (list(arrays['sweep_strategies']) != self.strategies
+                or not np.array_equal(arrays['sweep_thresholds'], self.thresholds)
+                or not np.array_equal(arrays['sweep_margins'], self.candidate_margins)):
+            return False
+        initial_date, end_date = (str(date) for date in arrays['sweep_window'])
+        published = {(initial_date, end_date, strategy):
+                     (arrays['sweep_x_pred'], arrays['sweep_y_pred'],
+                      tuple(arrays[f"sweep_{strategy}_{field}"] for field in self.RESULT_FIELDS))
+                     for strategy in self.strategies}
+        with self._lock:
+            self._published = published
+        return True
+
+    def _requested(self, key):
+        """Count a lookup of a window not swept, True once it is due"""
+        with self._lock:
+            count = self._requests.pop(key, 0) + 1
+            self._requests[key] = count
+            while len(self._requests) > self.maxsize:
+                self._requests.popitem(last=False)
+        return count >= self.min_requests
+
+    @timed('ThresholdSweep.lookup')
+    def lookup(self, initial_date, end_date, outlier_strategy, threshold):
+        """
+        Fit results of a window, strategy and threshold
+
+        Returns
+        -------
+        tuple or None
+            (x_pred, y_pred, x_pred_no_outliers, y_pred_no_outliers,
+            accepted_idxs), or None if the threshold or the strategy are
+            not part of the sweep, or the window is not swept yet
+        """
+        if outlier_strategy not in self.strategies:
+            return None
+        matches = np.flatnonzero(np.isclose(self.thresholds, threshold))
+        if len(matches) == 0:
+            return None
+        k = matches[0]
+        key = (initial_date, end_date, outlier_strategy)
+        with self._lock:
+            sweep = self._cached(key)
+        if sweep is None:
+            if not self._requested(key):
+                return None
+            sweep = self.prepare(initial_date, end_date, [outlier_strategy])[outlier_strategy]
+        x_pred, y_pred, (x_pred_no_outliers, y_pred_no_outliers, accepted, _) = sweep
+        return x_pred, y_pred, x_pred_no_outliers[k], y_pred_no_outliers[k], accepted[k]
@@ -0,0 +1,181 @@
+import os
+import time
+import bisect
+import threading
+import functools
+
+import numpy as np
+
+# Histogram buckets: 20 per decade from 1 us to 1000 s (upper edges, seconds)
+BUCKET_EDGES = np.logspace(-6, 3, 9 * 20 + 1).tolist()
+PERCENTILES = (50, 95, 99)
+
+class StageHistogram:
+    """
+    Durations of one stage in log-spaced buckets: constant memory and O(log
+    buckets) per record. Percentiles are the upper edge of the bucket
+    (relative error below 12%).
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        if not self.count:
+            return float('nan')
+        rank = q / 100 * self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                edge = BUCKET_EDGES[bucket] if bucket < len(BUCKET_EDGES) else self.max
+                # The exact extremes are known
+                return min(max(edge, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """count, mean, min, max and percentiles, times in milliseconds"""
+        if not self.count:
+            return dict(count=0)
+        summary = dict(count=self.count,
+                       total_ms=self.total * 1e3,
+                       mean_ms=self.total / self.count * 1e3,
+                       min_ms=self.min * 1e3,
+                       max_ms=self.max * 1e3)
+        for q in PERCENTILES:
+            summary[f"p{q}_ms"] = self.percentile(q) * 1e3
+        return summary
+
+class Timings:
+    """
+    Registry of the stage histograms. Disabled by default: then span
+    returns a shared no-op context and the functions decorated with timed
+    only pay one attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = StageHistogram()
+            histogram.add(seconds)
+
+    def span(self, name):
+        """Context manager timing its block as stage name"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def timed(self, name=None):
+        """Decorator timing every call of the function as stage name"""
+        def decorator(func):
+            stage = name or f"{func.__module__}.{func.__qualname__}"
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """Summary of every stage, sorted by name"""
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in sorted(self._stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+class _Span:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timings.record(self.name, time.perf_counter() - self.start)
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+# Registry of the process, used by the instrumented functions
+TIMINGS = Timings()
+span = TIMINGS.span
+timed = TIMINGS.timed
+
+def enable(enabled=True):
+    TIMINGS.enabled = enabled
+
+def register_timing_endpoint(app, path="/_timings"):
+    """
+    Serve the stage statistics of this process as JSON on the Dash server
+    (each gunicorn worker answers with its own, identified by pid).
+    GET {path}?reset=1 clears them after reading.
+
+    Requests to the Dash endpoints (page, layout, dependencies and
+    callbacks) are also timed as stages "http <path>", which include the
+    serialization of the callback outputs. The other requests (assets,
+    component suites, 404s...) are grouped in the stage "http other", so
+    the number of stages stays bounded.
+    """
+    from flask import g, jsonify, request
+
+    prefix = app.config.routes_pathname_prefix
+    dash_paths = {prefix, prefix + "_dash-layout", prefix + "_dash-dependencies",
+                  prefix + "_dash-update-component"}
+
+    @app.server.before_request
+    def start_request_timer():
+        if TIMINGS.enabled:
+            g.timing_start = time.perf_counter()
+
+    @app.server.after_request
+    def stop_request_timer(response):
+        start = g.pop('timing_start', None)
+        if start is not None and request.path != path:
+            stage = f"http {request.path}" if request.path in dash_paths else "http other"
+            TIMINGS.record(stage, time.perf_counter() - start)
+        return response
+
+    @app.server.route(path)
+    def timing_stats():
+        stats = TIMINGS.stats()
+        if request.args.get("reset"):
+            TIMINGS.reset()
+        return jsonify(pid=os.getpid(), enabled=TIMINGS.enabled, stages=stats)
+    return timing_stats
@@ -0,0 +1,11 @@
+# Resource monitoring is owned by mymodule (at the root of the repository,
+# importable through src/__init__.py) and shared with the notebooks
+from mymodule.system_requirements import (monitor_resources,
+                                          ResourceSample,
+                                          ResourceSampler,
+                                          measure)
+
+__all__ = ['monitor_resources',
+           'ResourceSample',
+           'ResourceSampler',
+           'measure']
@@ -1,9 +1,19 @@
+import pandas as pd
 import plotly.express as px
 import seaborn as sns
 
+from src.features.correlation import blocked_correlation, binned_correlation, cluster_order
+from src.visualization.render import decimate_frame, scatter_type, MAX_LINE_POINTS
+
+# Largest matrix drawn cell by cell in the heatmap
+HEATMAP_MAX_SIZE = 100
+
 def trends_from_dataframe(timeline_df, 
+                          max_points=MAX_LINE_POINTS,
                           **kwargs):
 
+    # Keep about max_points points per company (min/max decimation)
+    timeline_df = decimate_frame(timeline_df, max_points=max_points)
     # Plot return for each company
     fig = px.line(timeline_df, 
                 x=timeline_df.index, 
@@ -21,9 +31,10 @@ def trends_from_dataframe(timeline_df,
 def plot_log_return_difference(log_returns_difference, 
                                companies,
                                PATH_REPORTS_DIR=None,
-                               savefig=False):
+                               savefig=False,
+                               max_points=MAX_LINE_POINTS):
     # Plot log returns difference with color line purple
-    fig = px.line(log_returns_difference, 
+    fig = px.line(decimate_frame(log_returns_difference, max_points=max_points), 
                   title=f"Log Returns Difference ({companies[0]} - {companies[1]})")
     # Plot horizontal line 
     fig.add_hline(y=0, line_dash="dot", line_color="red")
@@ -37,8 +48,28 @@ def plot_log_return_difference(log_returns_difference,
         fig.write_image(f"{PATH_REPORTS_DIR}/log_returns_difference_{companies[0]}_{companies[1]}.jpeg")
     fig.show()
     
-def correlation_heatmap(returns_of_companies):
-    corr = returns_of_companies.corr()
+def correlation_heatmap(returns_of_companies,
+                        max_size=HEATMAP_MAX_SIZE,
+                        cluster=None):
+    """
+    Heatmap of the correlation of the returns. Above max_size tickers the
+    tickers are ordered by cluster and the matrix is averaged into
+    max_size x max_size groups, so the full matrix is never built.
+
+    cluster: bool, optional
+        Order the tickers grouping correlated ones. Defaults to True only
+        for the binned heatmap.
+    """
+    n_tickers = returns_of_companies.shape[1]
+    if cluster is None:
+        cluster = n_tickers > max_size
+    order = cluster_order(returns_of_companies) if cluster else None
+    if n_tickers > max_size:
+        corr = binned_correlation(returns_of_companies, max_size, order=order)
+    else:
+        columns = returns_of_companies.columns if order is None else returns_of_companies.columns[order]
+        corr = blocked_correlation(returns_of_companies[columns])
+        corr = pd.DataFrame(corr, index=columns, columns=columns)
     fig_corr = px.imshow(corr, 
                         labels=dict(color="Correlation"),
                         color_continuous_scale='RdBu_r'
@@ -52,10 +83,36 @@ def plot_scatter_returns(log_returns_difference,
     
     xdata_label = companies[1]
     ydata_label = companies[0]
+    # WebGL for large scatters, otherwise plotly's own choice (WebGL above
+    # 1000 points)
+    render_mode = 'webgl' if scatter_type(len(log_returns_difference)) == 'scattergl' else 'auto'
     fig = px.scatter(x=log_returns_difference[xdata_label], 
-                    y=log_returns_difference[ydata_label])
+                    y=log_returns_difference[ydata_label],
+                    render_mode=render_mode)
     fig.update_xaxes(title_text=xdata_label)
     fig.update_yaxes(title_text=ydata_label)
     if savefig:
         fig.write_image(f"{PATH_REPORTS_DIR}/scatter_returns_{companies[0]}_{companies[1]}.jpeg")
-    fig.show()
\ No newline at end of file
+    fig.show()
+
+def plot_rolling_comovement(comovement,
+                            value="correlation",
+                            PATH_REPORTS_DIR=None,
+                            savefig=False):
+    """
+    Rolling correlation (or beta) of each pair, one panel per window
+    length, from the long table of rolling_comovement
+    """
+    comovement = comovement.assign(pair=comovement['x_ticker'] + " - " + comovement['y_ticker'])
+    fig = px.line(comovement,
+                  x='date',
+                  y=value,
+                  color='pair',
+                  facet_row='window',
+                  title=f"Rolling {value} of returns")
+    fig.update_traces(hoverinfo='y')
+    fig.update_layout(hovermode="x unified")
+    fig.update_xaxes(title_text='Date')
+    if savefig:
+        fig.write_image(f"{PATH_REPORTS_DIR}/rolling_{value}.jpeg")
+    fig.show()
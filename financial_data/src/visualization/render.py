@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Scatter traces with more points are drawn with WebGL
+SCATTERGL_THRESHOLD = 5000
+# Points kept per line trace after decimation
+MAX_LINE_POINTS = 2000
+
+def scatter_type(n_points, threshold=SCATTERGL_THRESHOLD):
+    """Plotly trace type for a scatter of n_points: 'scatter' or 'scattergl'"""
+    return 'scattergl' if n_points > threshold else 'scatter'
+
+def scatter_trace(x, y, threshold=SCATTERGL_THRESHOLD, **kwargs):
+    """
+    Scatter trace as a plain dict (no validation, no copies of x and y),
+    switching to WebGL above threshold points
+    """
+    return dict(type=scatter_type(len(x), threshold), x=x, y=y, **kwargs)
+
+def minmax_indices(y, max_points=MAX_LINE_POINTS):
+    """
+    Indices of the points kept by min/max decimation: the series is split
+    in max_points // 2 buckets and the minimum and the maximum of each one
+    are kept (in their original order), so peaks are never lost. NaN are
+    dropped.
+
+    Returns
+    -------
+    np.array
+        Sorted indices into y
+    """
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(y))
+    if len(finite) <= max_points:
+        return finite
+    n_buckets = max(max_points // 2, 1)
+    buckets = np.arange(len(finite)) * n_buckets // len(finite)
+    # Sorted by bucket and value: first of each bucket is its minimum,
+    # last its maximum
+    order = np.lexsort((y[finite], buckets))
+    starts = np.searchsorted(buckets[order], np.arange(n_buckets))
+    ends = np.append(starts[1:], len(order)) - 1
+    return np.unique(finite[np.concatenate((order[starts], order[ends]))])
+
+def lttb_indices(x, y, max_points=MAX_LINE_POINTS):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets
+    decimation, which preserves the visual shape of the line with
+    max_points points. NaN are dropped.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    n = len(finite)
+    if n <= max_points or max_points < 3:
+        return finite
+    xs, ys = x[finite], y[finite]
+    # First and last points are kept, the rest is split in buckets
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    selected = np.empty(max_points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # Average of the next bucket as third vertex
+        x_next, y_next = xs[stop:next_stop].mean(), ys[stop:next_stop].mean()
+        area = np.abs((xs[previous] - x_next) * (ys[start:stop] - ys[previous])
+                      - (xs[previous] - xs[start:stop]) * (y_next - ys[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return finite[selected]
+
+def decimate_frame(frame, max_points=MAX_LINE_POINTS, method='minmax'):
+    """
+    Rows of a wide frame (one line per column) needed to draw every column
+    with about max_points points, for line plots of long or intraday
+    series. The index is kept, so it can be passed to px.line as is.
+
+    Parameters
+    ----------
+    frame: pd.DataFrame or pd.Series
+    max_points: int
+        Points per column
+    method: str
+        'minmax' or 'lttb'
+
+    Returns
+    -------
+    pd.DataFrame or pd.Series
+    """
+    if len(frame) <= max_points:
+        return frame
+    x = np.arange(len(frame), dtype=np.float64)
+    columns = frame.items() if isinstance(frame, pd.DataFrame) else [(frame.name, frame)]
+    rows = set()
+    for _, values in columns:
+        y = values.to_numpy(dtype=np.float64)
+        if method == 'lttb':
+            rows.update(lttb_indices(x, y, max_points).tolist())
+        elif method == 'minmax':
+            rows.update(minmax_indices(y, max_points).tolist())
+        else:
+            raise ValueError(f"Unsupported decimation method: {method}")
+    return frame.iloc[sorted(rows)]
+
+def base_layout(**kwargs):
+    """
+    Layout of an empty go.Figure (with the default template resolved) as a
+    dict, built once and reused by figures assembled as dicts
+    """
+    return go.Figure(layout=kwargs).to_plotly_json()['layout']
+
+def figure_dict(data, layout, **layout_updates):
+    """Figure dict from trace dicts and a base layout, shallowly updated"""
+    return dict(data=data, layout={**layout, **layout_updates})
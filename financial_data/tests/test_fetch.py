@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.cache import COLUMN_NAMES
+from src.data.fetch import BatchDownloader, TickerError, YahooSource
+from src.data.get_data import load_data
+
+def prices(tickers, start, end):
+    index = pd.bdate_range(start, end, inclusive="left", name="Date")
+    columns = pd.MultiIndex.from_product([["Adj Close", "Close"], tickers], names=COLUMN_NAMES)
+    return pd.DataFrame(np.ones((len(index), len(columns))), index=index, columns=columns)
+
+class CountingFetcher:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def __call__(self, tickers, start, end, interval, period=None):
+        self.calls.append((list(tickers), start, end))
+        if self.error is not None:
+            raise self.error
+        return prices(tickers, start, end)
+
+def test_weekend_gap_is_downloaded_once(tmp_path):
+    fetcher = CountingFetcher()
+    load_data(["AAA", "BBB"], None, "1d", str(tmp_path), start="2025-01-27", end="2025-02-01", fetcher=fetcher)
+    # Ends on Monday: the missing range is the weekend
+    data = load_data(["AAA", "BBB"], None, "1d", str(tmp_path), start="2025-01-27", end="2025-02-03",
+                     fetcher=fetcher)
+    report = data.attrs["fetch_report"]
+    assert report.failed == []
+    assert report.succeeded == ["AAA", "BBB"]
+    assert len(fetcher.calls) == 2
+
+    data = load_data(["AAA", "BBB"], None, "1d", str(tmp_path), start="2025-01-27", end="2025-02-03",
+                     fetcher=fetcher)
+    assert data.attrs["fetch_report"] is None
+    assert len(fetcher.calls) == 2
+    assert len(data) == 5
+
+def test_ticker_error_fails_only_its_tickers():
+    def fetcher(tickers, start, end, interval, period=None):
+        good = [ticker for ticker in tickers if ticker != "BAD"]
+        raise TickerError({"BAD": "no timezone found"}, prices(good, start, end))
+
+    sleeps = []
+    batches = []
+    downloader = BatchDownloader(source=fetcher, batch_size=10, sleep=sleeps.append)
+    report = downloader.download([(["AAA", "BAD", "BBB"], "2025-01-27", "2025-02-01")], "1d",
+                                 on_batch=lambda data, start, end, tickers: batches.append(tickers))
+    assert report.failed == ["BAD"]
+    assert report.succeeded == ["AAA", "BBB"]
+    assert batches == [["AAA", "BBB"]]
+    assert sleeps == []
+
+def test_failed_batch_is_not_split():
+    fetcher = CountingFetcher(error=ConnectionError("down"))
+    downloader = BatchDownloader(source=fetcher, batch_size=3, max_retries=2, sleep=lambda seconds: None)
+    report = downloader.download([(["A", "B", "C", "D", "E", "F"], "2025-01-27", "2025-02-01")], "1d")
+    assert report.failed == ["A", "B", "C", "D", "E", "F"]
+    # Two batches, each tried max_retries + 1 times
+    assert len(fetcher.calls) == 6
+
+def test_yahoo_source_raises_ticker_errors(monkeypatch):
+    yf = pytest.importorskip("yfinance")
+    from yfinance.exceptions import YFPricesMissingError, YFTzMissingError
+
+    class Ticker:
+        def __init__(self, ticker):
+            self.ticker = ticker
+
+        def history(self, start=None, end=None, **kwargs):
+            if self.ticker == "BAD":
+                raise YFTzMissingError(self.ticker)
+            if self.ticker == "WKND":
+                raise YFPricesMissingError(self.ticker, f"(1d {start} -> {end})")
+            index = pd.bdate_range(start, end, inclusive="left", tz="America/New_York", name="Date")
+            return pd.DataFrame({"Adj Close": 1.0, "Close": 1.0}, index=index)
+
+    monkeypatch.setattr(yf, "Ticker", Ticker)
+    with pytest.raises(TickerError) as info:
+        YahooSource().fetch(["AAA", "BAD", "WKND"], "2025-01-27", "2025-02-01", "1d")
+    assert info.value.tickers == ["BAD"]
+    data = info.value.data
+    assert data.columns.names == COLUMN_NAMES
+    assert list(data.columns) == [("Adj Close", "AAA"), ("Close", "AAA")]
+    assert data.index.tz is None and len(data) == 5
+
+    monkeypatch.setattr(yf, "Ticker", lambda ticker: Ticker("WKND"))
+    assert YahooSource().fetch(["WKND"], "2025-02-01", "2025-02-03", "1d").empty
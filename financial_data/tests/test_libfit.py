@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from src.models.libfit import OutlierRemover, fit_adaptative_line
+from src.models.moments import CumulativeMoments
+from src.models.sweep import ThresholdSweep
+
+def line_with_edge_residuals(n=200, seed=0):
+    """
+    Points on a line with small noise. The 10 points of largest |x| lie on
+    the line but have residuals of about 2.6 std (as from a fit pulled by
+    them): outliers for a threshold of 2 even with the border cases.
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(-1, 1, n)
+    y = 2 * x + 1 + rng.normal(scale=0.05, size=n)
+    residuals = y - (2 * x + 1)
+    edge = np.argsort(np.abs(x))[-10:]
+    residuals[edge] = np.sign(x[edge]) * 0.15
+    return x.reshape(-1, 1), y, residuals, edge
+
+def test_candidate_masks_rows():
+    _, _, residuals, _ = line_with_edge_residuals()
+    remover = OutlierRemover('std', 2.0)
+    masks = remover.candidate_masks(residuals, candidate_margins=(0.1, 0.5))
+    assert masks.shape == (3, len(residuals))
+    np.testing.assert_array_equal(masks[0], remover.remove_outliers(residuals)[1])
+    np.testing.assert_array_equal(masks[1], remover.remove_outliers(residuals, border_cases=True)[1])
+    # Wider margins accept more points
+    assert masks[0].sum() <= masks[1].sum() <= masks[2].sum()
+
+def test_extra_margin_changes_selected_points():
+    X, y, residuals, edge = line_with_edge_residuals()
+    _, _, default = fit_adaptative_line(X, y, residuals, None, None, 'std', 2.0)
+    _, _, widened = fit_adaptative_line(X, y, residuals, None, None, 'std', 2.0,
+                                        candidate_margins=(0.1, 0.5))
+    assert not default[edge].any()
+    assert widened[edge].all()
+
+def test_sweep_matches_fit_adaptative_line():
+    X, y, _, _ = line_with_edge_residuals()
+    index = pd.bdate_range("2020-01-01", periods=len(y), name="Date")
+    data = pd.DataFrame({'x': X.ravel(), 'y': y}, index=index)
+    initial_date, end_date = str(index[0].date()), str(index[-1].date())
+    margins = (0.1, 0.5)
+    moments = CumulativeMoments(data, 'x', 'y')
+    sweep = ThresholdSweep(data, 'x', 'y', [1.0, 1.5, 2.0], ['std', 'iqr'], moments=moments,
+                           candidate_margins=margins)
+    sweep.prepare(initial_date, end_date)
+    residuals = y - moments.fit(initial_date, end_date).predict(X)
+    for strategy in ['std', 'iqr']:
+        for threshold in [1.0, 1.5, 2.0]:
+            _, _, x_pred, y_pred, accepted = sweep.lookup(initial_date, end_date, strategy, threshold)
+            expected = fit_adaptative_line(X, y, residuals, initial_date, end_date, strategy, threshold,
+                                           candidate_margins=margins)
+            np.testing.assert_array_equal(accepted, expected[2])
+            np.testing.assert_allclose(y_pred, expected[1])
+
+def test_rolling_mask_matches_remove_outliers():
+    rng = np.random.default_rng(1)
+    values = rng.standard_t(3, size=100)
+    series = pd.Series(values, index=pd.bdate_range("2020-01-01", periods=len(values)))
+    window = 36
+    for strategy in ['std', 'iqr']:
+        for border_cases in [False, True]:
+            remover = OutlierRemover(strategy, 1.5)
+            # ndarray input (e.g. residuals) and pd.Series input follow
+            # the std of numpy and of pandas, as remove_outliers
+            for data in [values, series]:
+                rolling = remover.rolling_mask(data, window, border_cases=border_cases)
+                assert len(rolling.starts) == len(values) - window + 1
+                for row, start in enumerate(rolling.starts):
+                    _, accepted = remover.remove_outliers(data[start:start + window], border_cases=border_cases)
+                    np.testing.assert_array_equal(rolling.mask[row], ~np.asarray(accepted))
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from src.data.cache import COLUMN_NAMES
+from src.data.store import TickerStore
+
+def prices(tickers, start, end):
+    index = pd.bdate_range(start, end, inclusive="left", name="Date")
+    columns = pd.MultiIndex.from_product([["Adj Close"], tickers], names=COLUMN_NAMES)
+    return pd.DataFrame(np.ones((len(index), len(columns))), index=index, columns=columns)
+
+def test_weekend_gap_is_covered(tmp_path):
+    store = TickerStore(str(tmp_path), cache="csv")
+    # Stored data stops on Friday 2025-01-31
+    store.write(prices(["AAA", "BBB"], "2025-01-27", "2025-02-01"), "2025-01-27", "2025-02-01")
+    assert store.missing("AAA", "2025-01-27", "2025-02-03") == [(pd.Timestamp("2025-02-01"),
+                                                                 pd.Timestamp("2025-02-03"))]
+
+    # The source answers the weekend without rows
+    weekend = prices(["AAA", "BBB"], "2025-02-01", "2025-02-03")
+    assert weekend.empty
+    store.write(weekend, "2025-02-01", "2025-02-03", tickers=["AAA", "BBB"])
+
+    assert store.missing("AAA", "2025-01-27", "2025-02-03") == []
+    assert store.missing("BBB", "2025-01-27", "2025-02-03") == []
+    assert len(store.read(["AAA", "BBB"], "2025-01-27", "2025-02-03")) == 5
+
+def test_empty_tickers_without_answer_are_not_covered(tmp_path):
+    store = TickerStore(str(tmp_path), cache="csv")
+    store.write(prices(["AAA"], "2025-02-01", "2025-02-03"), "2025-02-01", "2025-02-03")
+    assert store.missing("AAA", "2025-02-01", "2025-02-03") != []
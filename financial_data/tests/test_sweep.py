@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from src.models.sweep import ThresholdSweep
+
+def make_sweep(**kwargs):
+    rng = np.random.default_rng(0)
+    index = pd.bdate_range("2020-01-01", periods=300, name="Date")
+    x = rng.normal(size=len(index))
+    data = pd.DataFrame({'x': x, 'y': 0.5 * x + rng.standard_t(3, size=len(index))}, index=index)
+    return ThresholdSweep(data, 'x', 'y', [1.0, 1.5, 2.0], ['std', 'iqr'], **kwargs)
+
+def count_sweeps(sweep):
+    calls = []
+    original = sweep._sweep
+
+    def _sweep(*args):
+        calls.append(args[2:])
+        return original(*args)
+    sweep._sweep = _sweep
+    return calls
+
+def test_window_is_swept_from_its_second_request():
+    sweep = make_sweep()
+    calls = count_sweeps(sweep)
+    assert sweep.lookup("2020-01-01", "2020-06-30", 'std', 1.5) is None
+    assert calls == []
+    assert sweep.lookup("2020-01-01", "2020-06-30", 'std', 1.5) is not None
+    # Only the requested strategy is swept, then thresholds are lookups
+    assert calls == [("2020-01-01", "2020-06-30", ['std'])]
+    assert sweep.lookup("2020-01-01", "2020-06-30", 'std', 2.0) is not None
+    assert len(calls) == 1
+
+def test_sessions_on_different_windows_keep_their_sweeps():
+    sweep = make_sweep(maxsize=4, min_requests=1)
+    calls = count_sweeps(sweep)
+    windows = [("2020-01-01", "2020-06-30"), ("2020-03-02", "2020-12-31")]
+    for _ in range(3):
+        for initial_date, end_date in windows:
+            assert sweep.lookup(initial_date, end_date, 'iqr', 1.0) is not None
+    assert len(calls) == 2
+
+def test_least_recently_used_sweep_is_evicted():
+    sweep = make_sweep(maxsize=2, min_requests=1)
+    calls = count_sweeps(sweep)
+    for end_date in ["2020-04-30", "2020-05-29", "2020-06-30", "2020-04-30"]:
+        sweep.lookup("2020-01-01", end_date, 'std', 1.0)
+    assert len(calls) == 4
+    assert len(sweep._sweeps) == 2
@@ -26,9 +26,12 @@ import yaml
 
 # Import local module
 from src.data.get_data import load_data
+from src.data.fetch import BatchDownloader
 from src.features.build_features import compute_daily_return
+from src.features.correlation import top_k_neighbours, rolling_comovement
 from src.visualization.plot_lib import (trends_from_dataframe, 
-                                        correlation_heatmap)
+                                        correlation_heatmap,
+                                        plot_rolling_comovement)
 
 sys.path.append('..')
 
@@ -43,9 +46,11 @@ interval = config["download_params"]["interval"]
 start_date = config["download_params"]["start_date"]
 end_date = config["download_params"]["end_date"]
 param_to_analyze = config["financial_param"]
+cache_format = config.get("cache_format", "csv")
 root_dir = config["paths"]["root"]
 raw_data_dir = config["paths"]["raw"]
 PATH_RAW_DIR = root_dir+"/"+raw_data_dir
+rolling_windows = config.get("rolling_windows", [20, 60, 120])
 # Import the download method from get_data.py
 
 #############################################################
@@ -59,7 +64,10 @@ data = load_data(companies_name,
                 interval,
                 PATH_RAW_DIR,
                 start=start_date,
-                end=end_date)
+                end=end_date,
+                cache=cache_format,
+                fields=[param_to_analyze],
+                downloader=BatchDownloader(**config.get("fetch", {})))
 
 # Trends from raw data
 returns_of_companies = compute_daily_return(data[param_to_analyze], 
@@ -68,6 +76,13 @@ returns_of_companies = compute_daily_return(data[param_to_analyze],
 # Plot the data
 trends_from_dataframe(returns_of_companies, title = 'Stock Return')
 
-# Plot correlation matrix
+# Plot correlation matrix (binned and clustered for large universes)
 correlation_heatmap(returns_of_companies)
-# 
+
+# Most correlated tickers of each company
+print(top_k_neighbours(returns_of_companies, k=min(5, len(companies_name) - 1)))
+
+# Co-movement over time: rolling correlation and beta of every pair
+comovement = rolling_comovement(returns_of_companies, rolling_windows)
+plot_rolling_comovement(comovement, value="correlation")
+plot_rolling_comovement(comovement, value="beta")
@@ -1,17 +1,66 @@
 import os
+from collections import namedtuple
+
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import LinearRegression
 
 __all__ = ['apply_filter_by_dates', 
+           'apply_filter_by_windows',
+           'window_bounds',
+           'DateWindows',
+           'LinearFit',
+           'fit_lines',
            'OutlierRemover', 
            'fit_line',
            'fit_adaptative_line']
 
+# Many date windows of a frame as offsets into its values (see apply_filter_by_windows)
+DateWindows = namedtuple('DateWindows', ['values', 'starts', 'stops', 'columns'])
+
+def window_bounds(index, initial_dates, end_dates):
+    """
+    Positions [start, stop) in a sorted DatetimeIndex of the rows between
+    initial_date and end_date (both included), found by binary search
+
+    Parameters
+    ----------
+    index: pd.DatetimeIndex
+        Sorted index
+    initial_dates: str, datetime or array-like of them
+    end_dates: str, datetime or array-like of them
+
+    Returns
+    -------
+    tuple
+        (start, stop) as int, or as np.array for arrays of dates
+    """
+    scalar = np.ndim(initial_dates) == 0 and np.ndim(end_dates) == 0
+    # Single dates are parsed as Timestamp, much cheaper than to_datetime
+    if scalar:
+        initial_dates, end_dates = pd.Timestamp(initial_dates), pd.Timestamp(end_dates)
+    else:
+        initial_dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(initial_dates)))
+        end_dates = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(end_dates)))
+    # Naive dates are in the timezone of the index, as in comparisons
+    if index.tz is not None and initial_dates.tz is None:
+        initial_dates = initial_dates.tz_localize(index.tz)
+    if index.tz is not None and end_dates.tz is None:
+        end_dates = end_dates.tz_localize(index.tz)
+    start = index.searchsorted(initial_dates, side='left')
+    # Empty windows (end before start) have stop == start
+    stop = np.maximum(index.searchsorted(end_dates, side='right'), start)
+    if scalar:
+        return int(start), int(stop)
+    return start, stop
+
 def apply_filter_by_dates(data, initial_date, end_date):
     """ 
     Apply a filter to the data by the initial and end date
     
+    With a sorted DatetimeIndex the bounds are found by binary search and
+    the result is a view of data (no copy): do not modify it in place.
+    Otherwise the rows are selected with boolean masks.
+
     Parameters
     ----------
     data: pd.DataFrame
@@ -25,12 +74,129 @@ def apply_filter_by_dates(data, initial_date, end_date):
         Filtered data
         
     """
+    if isinstance(data.index, pd.DatetimeIndex) and data.index.is_monotonic_increasing:
+        start, stop = window_bounds(data.index, initial_date, end_date)
+        return data.iloc[start:stop]
     filtered_data = data[
         (data.index >= initial_date) & 
         (data.index <= end_date)
     ]
     return pd.DataFrame(filtered_data)
 
+def apply_filter_by_windows(data, initial_dates, end_dates):
+    """
+    Filter many windows at once without copying the data
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        Data with a sorted DatetimeIndex
+    initial_dates: array-like of str
+    end_dates: array-like of str
+
+    Returns
+    -------
+    DateWindows
+        values: np.array (n_rows, n_columns), values of data (a view when
+        data has a single dtype), shared by all the windows
+        starts, stops: np.array, window i is values[starts[i]:stops[i]]
+        columns: columns of data
+    """
+    if not (isinstance(data.index, pd.DatetimeIndex) and data.index.is_monotonic_increasing):
+        raise ValueError("apply_filter_by_windows requires a sorted DatetimeIndex")
+    starts, stops = window_bounds(data.index, initial_dates, end_dates)
+    return DateWindows(data.to_numpy(copy=False), np.atleast_1d(starts), np.atleast_1d(stops), data.columns)
+
+def _as_feature(x):
+    """Values of a single feature, given as (n,) or (..., n, 1)"""
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim >= 2 and x.shape[-1] == 1:
+        x = x[..., 0]
+    return x
+
+def fit_lines(x, y, sample_weight=None):
+    """
+    Closed-form (weighted) least squares lines of y over x for a batch of
+    samples stacked along the first axes. Each row is an independent
+    regression over the last axis.
+
+    Parameters
+    ----------
+    x: np.array
+        x values, shape (..., n). A single (n,) array is shared by all y.
+    y: np.array
+        y values, shape (..., n)
+    sample_weight: np.array, optional
+        Weights broadcastable to the shape of y
+
+    Returns
+    -------
+    slope, intercept, r2, sse: np.array
+        One value per regression
+    """
+    x = _as_feature(x)
+    y = np.asarray(y, dtype=np.float64)
+    x, y = np.broadcast_arrays(x, y)
+    w = np.ones_like(y) if sample_weight is None else np.broadcast_to(
+        np.asarray(sample_weight, dtype=np.float64), y.shape)
+
+    total = w.sum(axis=-1)
+    x_mean = (w * x).sum(axis=-1) / total
+    y_mean = (w * y).sum(axis=-1) / total
+    dx = x - x_mean[..., None]
+    dy = y - y_mean[..., None]
+    cxx = (w * dx * dx).sum(axis=-1)
+    cxy = (w * dx * dy).sum(axis=-1)
+    cyy = (w * dy * dy).sum(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(cxx > 0, cxy / cxx, 0.0)
+        sse = np.maximum(cyy - slope * cxy, 0.0)
+        r2 = np.where(cyy > 0, 1.0 - sse / cyy, 1.0)
+    intercept = y_mean - slope * x_mean
+    return slope, intercept, r2, sse
+
+class LinearFit:
+    """
+    Simple (one feature) least squares line solved in closed form with
+    NumPy. Drop-in for the parts of sklearn's LinearRegression used in this
+    module: fit, predict, score, coef_ and intercept_.
+
+    The training R2 and sum of squared residuals are kept as r2_ and sse_.
+    """
+
+    def __init__(self):
+        self.coef_ = None
+        self.intercept_ = None
+        self.r2_ = None
+        self.sse_ = None
+
+    def fit(self, x, y, sample_weight=None):
+        x = _as_feature(x)
+        if x.ndim != 1:
+            raise ValueError(f"LinearFit supports a single feature, got x with shape {np.shape(x)}")
+        slope, intercept, r2, sse = fit_lines(x, np.asarray(y, dtype=np.float64).ravel(), sample_weight)
+        self.coef_ = np.array([float(slope)])
+        self.intercept_ = float(intercept)
+        self.r2_ = float(r2)
+        self.sse_ = float(sse)
+        return self
+
+    def predict(self, x):
+        return self.coef_[0] * _as_feature(x) + self.intercept_
+
+    def score(self, x=None, y=None, sample_weight=None):
+        """
+        R2 of the model on (x, y). Without data, the training R2.
+        """
+        if x is None:
+            return self.r2_
+        y = np.asarray(y, dtype=np.float64).ravel()
+        w = np.ones_like(y) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        residuals = y - self.predict(x)
+        sse = (w * residuals**2).sum()
+        sst = (w * (y - np.average(y, weights=w))**2).sum()
+        return 1.0 - sse / sst if sst > 0 else 1.0
+
 def fit_line(x,y, nvals=100, verbose=True):
     """Returns the x_pred and y_pred of the linear regression
     and the model.
@@ -49,14 +215,15 @@ def fit_line(x,y, nvals=100, verbose=True):
         x values predicted
     y_pred_: np.array
         y values predicted
-    reg: LinearRegression
-        Linear regression model fitted
+    reg: LinearFit
+        Linear regression model fitted (closed form, same interface as
+        sklearn's LinearRegression)
     """
-    reg = LinearRegression(fit_intercept=True).fit(x, y)
+    reg = LinearFit().fit(x, y)
 
     # Get the score of the model
     if verbose:
-        print(f"Score: {reg.score(x,y):10.9f}")
+        print(f"Score: {reg.score():10.9f}")
         print(f"Coef: {reg.coef_[0]:3.2} - {reg.intercept_:1.5f}")
 
     # Predict the data
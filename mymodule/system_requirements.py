@@ -1,7 +1,245 @@
+import os
+import sys
+import csv
+import json
+import time
+import threading
+import functools
+from collections import deque, namedtuple
+
 import psutil
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+__all__ = ['monitor_resources',
+           'ResourceSample',
+           'ResourceSampler',
+           'measure']
+
+# One observation of the process: CPU in % of one core, memory in bytes
+ResourceSample = namedtuple('ResourceSample',
+                            ['timestamp', 'cpu_percent', 'rss', 'peak_rss', 'system_memory_percent'])
+
+def _peak_rss(process):
+    """Peak resident memory of the process in bytes, if the OS reports it"""
+    if resource is not None and process.pid == os.getpid():
+        # ru_maxrss is in KB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    memory = process.memory_info()
+    return getattr(memory, 'peak_wset', memory.rss)
+
 # Monitor system resources
-def monitor_resources():
+def monitor_resources(sampler=None):
+    """
+    Print the CPU and memory usage. Non-blocking: the CPU usage is the one
+    since the previous call (or the last sample of sampler, if given).
+    """
     memory = psutil.virtual_memory()
-    cpu = psutil.cpu_percent(interval=1)
+    if sampler is not None and sampler.latest() is not None:
+        cpu = sampler.latest().cpu_percent
+    else:
+        cpu = psutil.cpu_percent(interval=None)
     print(f"CPU Usage: {cpu}%")
     print(f"Memory Usage: {memory.percent}% ({memory.used / (1024**3):.2f} GB used)")
+
+class ResourceSampler:
+    """
+    Background thread sampling the CPU and memory of a process every
+    interval seconds into a ring buffer, without blocking the caller.
+
+    Calls measured with measure(..., sampler=sampler) are recorded in
+    sampler.calls, and everything can be exported to JSON or CSV to state
+    the resource requirements of the computation.
+
+    Usage:
+        with ResourceSampler(interval=0.5) as sampler:
+            ...
+        sampler.export("resources.json")
+    """
+
+    def __init__(self, interval=1.0, maxlen=3600, pid=None):
+        """
+        Parameters
+        ----------
+        interval: float
+            Seconds between samples
+        maxlen: int
+            Samples (and measured calls) kept, the oldest are dropped
+        pid: int, optional
+            Process to sample, the current one by default
+        """
+        self.interval = interval
+        self.pid = pid
+        self.process = psutil.Process(pid)
+        self.samples = deque(maxlen=maxlen)
+        self.calls = deque(maxlen=maxlen)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Take one sample and add it to the buffer"""
+        with self.process.oneshot():
+            sample = ResourceSample(time.time(),
+                                    self.process.cpu_percent(interval=None),
+                                    self.process.memory_info().rss,
+                                    _peak_rss(self.process),
+                                    psutil.virtual_memory().percent)
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if self.running:
+            return self
+        # In a forked child (e.g. a gunicorn worker) sample the child
+        if self.pid is None and self.process.pid != os.getpid():
+            self.process = psutil.Process()
+            self.samples.clear()
+            self.calls.clear()
+            self._lock = threading.Lock()
+        # First cpu_percent call only sets the reference
+        self.process.cpu_percent(interval=None)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+        self._thread = None
+        return self
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def latest(self):
+        with self._lock:
+            return self.samples[-1] if self.samples else None
+
+    def record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """
+        Resource budget over the buffer: mean and max CPU, max RSS, peak
+        RSS and the measured calls
+        """
+        with self._lock:
+            samples = list(self.samples)
+            calls = list(self.calls)
+        summary = dict(n_samples=len(samples), n_calls=len(calls))
+        if samples:
+            summary.update(duration=samples[-1].timestamp - samples[0].timestamp,
+                           cpu_percent_mean=sum(s.cpu_percent for s in samples) / len(samples),
+                           cpu_percent_max=max(s.cpu_percent for s in samples),
+                           rss_max=max(s.rss for s in samples),
+                           peak_rss=max(s.peak_rss for s in samples))
+        if calls:
+            summary.update(wall_time_total=sum(c['wall_time'] for c in calls),
+                           cpu_time_total=sum(c['cpu_time'] for c in calls),
+                           wall_time_max=max(c['wall_time'] for c in calls),
+                           rss_delta_max=max(c['rss_delta'] for c in calls))
+        return summary
+
+    def export(self, path):
+        """
+        Save the samples, the measured calls and the summary. A .json path
+        writes everything in one file; a .csv path writes the samples there
+        and the calls next to it (name_calls.csv).
+        """
+        with self._lock:
+            samples = list(self.samples)
+            calls = list(self.calls)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(ResourceSample._fields)
+                writer.writerows(samples)
+            if calls:
+                with open(path[:-len(".csv")] + "_calls.csv", "w", newline="") as file:
+                    writer = csv.DictWriter(file, fieldnames=list(calls[0]))
+                    writer.writeheader()
+                    writer.writerows(calls)
+        else:
+            with open(path, "w") as file:
+                json.dump(dict(summary=self.summary(),
+                               samples=[sample._asdict() for sample in samples],
+                               calls=calls), file, indent=1)
+        return path
+
+class measure:
+    """
+    Context manager and decorator recording the resources of a call: wall
+    time, CPU time of the process, RSS before and after and the peak RSS.
+    The record is kept in self.last and added to sampler.calls.
+
+    Usage:
+        with measure("fit", sampler):
+            ...
+
+        @measure("fit", sampler)
+        def fit(...):
+            ...
+    """
+
+    def __init__(self, name=None, sampler=None, verbose=False):
+        self.name = name
+        self.sampler = sampler
+        self.verbose = verbose
+        self.process = sampler.process if sampler is not None else psutil.Process()
+        self.last = None
+        self._local = threading.local()
+
+    def __enter__(self):
+        self._local.start = (time.time(), time.perf_counter(), self.process.cpu_times(),
+                             self.process.memory_info().rss)
+        return self
+
+    def __exit__(self, *exc_info):
+        timestamp, start, cpu_times, rss_start = self._local.start
+        wall_time = time.perf_counter() - start
+        end_cpu_times = self.process.cpu_times()
+        rss_end = self.process.memory_info().rss
+        self.last = dict(name=self.name,
+                         timestamp=timestamp,
+                         wall_time=wall_time,
+                         cpu_time=(end_cpu_times.user - cpu_times.user)
+                                  + (end_cpu_times.system - cpu_times.system),
+                         rss_start=rss_start,
+                         rss_end=rss_end,
+                         rss_delta=rss_end - rss_start,
+                         peak_rss=_peak_rss(self.process))
+        if self.sampler is not None:
+            self.sampler.record(self.last)
+        if self.verbose:
+            print(f"{self.name}: {wall_time:.4f} s, CPU {self.last['cpu_time']:.4f} s, "
+                  f"RSS {rss_end / 1024**2:.1f} MB ({self.last['rss_delta'] / 1024**2:+.1f} MB)")
+
+    def __call__(self, func):
+        name = self.name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with measure(name, self.sampler, self.verbose):
+                return func(*args, **kwargs)
+        return wrapper
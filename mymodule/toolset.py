@@ -1,50 +1,149 @@
 import numpy as np
 import pandas as pd
 
-__all__ = ['find_closest_date', 
+__all__ = ['DateResolver',
+           'find_closest_date', 
+           'compute_returns',
            'compute_daily_return_one',
            'compute_daily_return']
 
-# Create a function to search a valid date closer to the one provider by user
+class DateResolver:
+    """
+    Resolve user dates to valid dates of an index by binary search.
+
+    The index is converted and sorted once, so each query costs
+    O(log n). Queries can be a single date or an array of dates.
+
+    Modes:
+        'nearest': closest date (the earlier one on ties)
+        'previous': last date lower or equal than the query
+        'next': first date greater or equal than the query
+    """
+    MODES = ('nearest', 'previous', 'next')
+
+    def __init__(self, full_indexes):
+        index = pd.DatetimeIndex(pd.to_datetime(full_indexes))
+        if not index.is_monotonic_increasing:
+            index = index.sort_values()
+        self.index = index
+        self._values = index.asi8
+
+    def __len__(self):
+        return len(self.index)
+
+    def positions(self, dates, mode='nearest'):
+        """
+        Positions in the sorted index of the resolved dates
+
+        Parameters
+        ----------
+        dates: str, datetime or array-like of them
+        mode: str
+            'nearest', 'previous' or 'next'
+
+        Returns
+        -------
+        int or np.array
+            Position of each resolved date
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Use one of {self.MODES}")
+        scalar = np.ndim(dates) == 0
+        query = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates))).asi8
+        last = len(self._values) - 1
+
+        if mode == 'previous':
+            pos = np.searchsorted(self._values, query, side='right') - 1
+        elif mode == 'next':
+            pos = np.searchsorted(self._values, query, side='left')
+        else:
+            right = np.clip(np.searchsorted(self._values, query, side='left'), 0, last)
+            left = np.clip(right - 1, 0, last)
+            take_left = (query - self._values[left]) <= (self._values[right] - query)
+            pos = np.where(take_left, left, right)
+        pos = np.clip(pos, 0, last)
+        return int(pos[0]) if scalar else pos
+
+    def resolve(self, dates, mode='nearest'):
+        """
+        Resolved dates as Timestamp (single query) or DatetimeIndex
+        """
+        pos = self.positions(dates, mode=mode)
+        return self.index[pos]
+
+    def closest(self, dates, mode='nearest', date_format='%Y-%m-%d'):
+        """
+        Resolved dates formatted as strings, like find_closest_date
+        """
+        resolved = self.resolve(dates, mode=mode)
+        if isinstance(resolved, pd.Timestamp):
+            return resolved.strftime(date_format)
+        return resolved.strftime(date_format).to_numpy()
+
 def find_closest_date(date, full_indexes):
     """
     Find the closest date to the one provided by the user
+
+    For repeated queries over the same index build a DateResolver once
+    and call its closest method instead.
+    """
+    return DateResolver(full_indexes).closest(date)
+
+
+def compute_returns(prices, kind='log', out=None, dtype=np.float64):
     """
-    # Ensure full_indexes is a DatetimeIndex
-    full_indexes = pd.to_datetime(full_indexes)    # Convert to datetime
-    date = pd.to_datetime(date)
-    # Compute the difference in days
-    diff = np.abs((full_indexes - date).days)
-    # Get the index of the minimum
-    idx = np.argmin(diff)
-    return full_indexes[idx].strftime('%Y-%m-%d')
+    Compute the returns of all the columns of a price matrix at once.
+
+    The first row is set to 0 to mantain the same length as the prices.
 
+    Parameters
+    ----------
+    prices: np.array
+        Prices with shape (n_dates,) or (n_dates, n_assets)
+    kind: str
+        'log' for log returns or 'simple' for percentage change
+    out: np.array, optional
+        Preallocated float array with the shape of prices, filled in place
+    dtype: np.dtype
+        Type of the output when out is not given (float64 or float32)
+
+    Returns
+    -------
+    np.array
+        Returns with the shape of prices
+    """
+    if kind not in ('log', 'simple'):
+        raise ValueError(f"Unknown kind of return '{kind}'. Use 'log' or 'simple'")
+    prices = np.asarray(prices)
+    if out is None:
+        out = np.empty(prices.shape, dtype=dtype)
+    elif out.shape != prices.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {prices.shape}")
+
+    out[:1] = 0
+    np.divide(prices[1:], prices[:-1], out=out[1:])
+    if kind == 'log':
+        np.log(out[1:], out=out[1:])
+    else:
+        np.subtract(out[1:], 1, out=out[1:])
+    return out
 
 def compute_daily_return_one(data):
     """
     Return is a measure of the percentage change in price from one period to the next.
     """
-    # Compute the return of the stock
-    #return_stock = data[param].pct_change()
-    return_stock = np.log(data[1:]/data[:-1])
-    # Add 0 at beggining to mantain the same length
-    return_stock = np.insert(return_stock, 0, 0)
-    return return_stock
+    return compute_returns(np.asarray(data, dtype=np.float64))
 
-def compute_daily_return(full_data, dates, companies):
+def compute_daily_return(full_data, dates, companies, kind='log', out=None, dtype=np.float64):
     """
     Compute the daily return of a stock
+
+    All the companies are computed at once with compute_returns. See it
+    for the kind, out and dtype parameters.
     """
-    # Get the data of the stock
-    companies_return = []
-    for company in companies:
-        data = full_data[company].values
-        return_stock = compute_daily_return_one(data)
-        companies_return.append(return_stock)
+    # Prices of the companies as a (n_dates, n_companies) matrix
+    prices = full_data[list(companies)].to_numpy()
+    companies_return = compute_returns(prices, kind=kind, out=out, dtype=dtype)
 
     # Convert to pandas dataframe with proper indexing and date
-    companies_return = pd.DataFrame(companies_return).T
-    companies_return.index = dates
-    companies_return.columns = companies
-
-    return companies_return
\ No newline at end of file
+    return pd.DataFrame(companies_return, index=dates, columns=list(companies), copy=False)